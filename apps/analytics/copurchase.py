@@ -0,0 +1,214 @@
+"""
+"Customers also bought", computed offline from orders.
+
+Let B be the buyer x product matrix holding a 1 where the buyer has ordered
+the product. C = BᵀB then counts, for every pair of products, the buyers who
+ordered both, and its diagonal counts the buyers of each product. C is stored
+sparsely in ``CoPurchaseCount`` and kept current incrementally: the orders
+placed since the last run add the entries Δ to B, and
+
+    C' = (B + Δ)ᵀ(B + Δ) = C + BᵀΔ + ΔᵀB + ΔᵀΔ
+
+in which only the rows of the buyers of those orders take part, so a refresh
+reads the new orders and their buyers' earlier purchases, never the whole
+order table. Products whose row of C changed get their top-K neighbours,
+ranked by cosine similarity C[a,b] / sqrt(C[a,a] * C[b,b]), rewritten in
+``RelatedProduct``, which the ``related`` action reads with one index scan.
+So do the products listing a neighbour b whose C[b,b] grew: its score drops
+for them all, but only where it was in the top K can the lists change.
+
+Cancelled orders are skipped when they are processed; an order cancelled
+after it was counted keeps counting until the next full rebuild.
+"""
+from datetime import timedelta
+
+import numpy as np
+from scipy import sparse
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from apps.orders.models import Order
+from apps.products.models import Product
+from .models import CoPurchaseCount, CoPurchaseProgress, RelatedProduct
+
+# Orders younger than this wait for the next run: an order created earlier but
+# committed later than a newer one would otherwise land behind the watermark
+SETTLE_DELAY = timedelta(minutes=5)
+CHUNK_SIZE = 1000  # Ids per IN (...) lookup
+
+
+def _chunks(values):
+    values = list(values)
+    for start in range(0, len(values), CHUNK_SIZE):
+        yield values[start:start + CHUNK_SIZE]
+
+
+def counted_orders():
+    return Order.objects.exclude(status='cancelled')
+
+
+def _after(progress):
+    """Orders past the watermark, in (created_at, id) order"""
+    return Q(created_at__gt=progress.last_created_at) | Q(
+        created_at=progress.last_created_at, id__gt=progress.last_order_id
+    )
+
+
+def _up_to(progress):
+    """Orders at or before the watermark, in (created_at, id) order"""
+    return Q(created_at__lt=progress.last_created_at) | Q(
+        created_at=progress.last_created_at, id__lte=progress.last_order_id
+    )
+
+
+def count_pairs(history, new):
+    """
+    Increments of C for the ``new`` (buyer, product) purchases of buyers whose
+    earlier purchases are ``history``; the two sets must not overlap.
+    Returns the product ids and ΔC as a sparse COO matrix over them.
+    """
+    pairs = list(history) + list(new)
+    buyers = {buyer: i for i, buyer in enumerate(sorted({buyer for buyer, _ in pairs}))}
+    products = sorted({product for _, product in pairs})
+    columns = {product: i for i, product in enumerate(products)}
+
+    def matrix(pairs):
+        rows = np.fromiter((buyers[buyer] for buyer, _ in pairs), dtype=np.int64, count=len(pairs))
+        cols = np.fromiter((columns[product] for _, product in pairs), dtype=np.int64, count=len(pairs))
+        return sparse.csr_matrix(
+            (np.ones(len(pairs), dtype=np.int64), (rows, cols)), shape=(len(buyers), len(products))
+        )
+
+    B, D = matrix(list(history)), matrix(list(new))
+    cross = (B.T @ D).tocsr()
+    return products, (cross + cross.T + D.T @ D).tocoo()
+
+
+def add_counts(products, delta):
+    """Add ΔC (from ``count_pairs``) to the stored co-purchase counts with one upsert"""
+    order = np.lexsort((delta.col, delta.row))  # Fixed lock order, so concurrent refreshes cannot deadlock
+    ids = np.array([str(product) for product in products], dtype=object)
+    table = CoPurchaseCount._meta.db_table
+    products_table = Product._meta.db_table
+    with connection.cursor() as cursor:
+        # Pairs of products deleted since are dropped by the joins
+        cursor.execute(f"""
+            INSERT INTO {table} (product_id, other_id, buyers)
+            SELECT v.product_id, v.other_id, v.buyers
+            FROM unnest(%s::uuid[], %s::uuid[], %s::integer[]) AS v(product_id, other_id, buyers)
+            JOIN {products_table} a ON a.id = v.product_id
+            JOIN {products_table} b ON b.id = v.other_id
+            ORDER BY v.product_id, v.other_id
+            ON CONFLICT (product_id, other_id) DO UPDATE SET buyers = {table}.buyers + EXCLUDED.buyers
+        """, [
+            ids[delta.row[order]].tolist(),
+            ids[delta.col[order]].tolist(),
+            delta.data[order].tolist(),
+        ])
+
+
+def rank_neighbours(product_ids, top_k=None, min_buyers=None):
+    """Rewrite the ``RelatedProduct`` rows of ``product_ids`` from their stored co-purchase counts"""
+    top_k = top_k or getattr(settings, 'RELATED_PRODUCTS_TOP_K', 12)
+    min_buyers = min_buyers or getattr(settings, 'RELATED_PRODUCTS_MIN_BUYERS', 1)
+
+    rows = []
+    for chunk in _chunks(product_ids):
+        rows += CoPurchaseCount.objects.filter(product_id__in=chunk).values_list('product_id', 'other_id', 'buyers')
+    ids = sorted({product for product, _, _ in rows} | {other for _, other, _ in rows})
+    index = {product: i for i, product in enumerate(ids)}
+    buyers_of = np.zeros(len(ids))
+    for chunk in _chunks(ids):
+        for product, buyers in CoPurchaseCount.objects.filter(
+            product_id__in=chunk, other_id=F('product_id')
+        ).values_list('product_id', 'buyers'):
+            buyers_of[index[product]] = buyers
+
+    a = np.fromiter((index[product] for product, _, _ in rows), dtype=np.int64, count=len(rows))
+    b = np.fromiter((index[other] for _, other, _ in rows), dtype=np.int64, count=len(rows))
+    shared = np.fromiter((buyers for _, _, buyers in rows), dtype=np.float64, count=len(rows))
+    keep = (a != b) & (shared >= min_buyers)
+    a, b, shared = a[keep], b[keep], shared[keep]
+    score = shared / np.sqrt(np.maximum(buyers_of[a] * buyers_of[b], 1))
+
+    # Group by product, best first; ties go to more shared buyers, then to the lower id
+    order = np.lexsort((b, -shared, -score, a))
+    a, b, score = a[order], b[order], score[order]
+    rank = np.arange(len(a)) - np.searchsorted(a, a)  # Position within the product's group
+    keep = rank < top_k
+
+    with transaction.atomic():
+        for chunk in _chunks(product_ids):
+            RelatedProduct.objects.filter(product_id__in=chunk).delete()
+        RelatedProduct.objects.bulk_create([
+            RelatedProduct(product_id=ids[p], related_id=ids[r], rank=int(position), score=float(s))
+            for p, r, position, s in zip(a[keep], b[keep], rank[keep], score[keep])
+        ], batch_size=1000)
+
+
+def refresh(batch_size=20000, top_k=None, min_buyers=None, settle_delay=SETTLE_DELAY):
+    """
+    Fold the orders placed since the last run into the co-purchase counts,
+    ``batch_size`` orders per transaction, and re-rank the products they
+    touched. Returns (orders processed, products re-ranked).
+    """
+    cutoff = timezone.now() - settle_delay
+    processed, touched = 0, set()
+    while True:
+        with transaction.atomic():
+            # The row lock also keeps concurrent refreshes from counting a batch twice
+            progress, _ = CoPurchaseProgress.objects.select_for_update().get_or_create(pk=1)
+            orders = counted_orders().filter(created_at__lt=cutoff)
+            if progress.last_created_at is not None:
+                orders = orders.filter(_after(progress))
+            batch = list(
+                orders.order_by('created_at', 'id').values_list('id', 'created_at', 'buyer_id', 'product_id')[:batch_size]
+            )
+            if not batch:
+                break
+
+            new = {(buyer, product) for _, _, buyer, product in batch}
+            history = set()
+            if progress.last_created_at is not None:
+                for chunk in _chunks({buyer for buyer, _ in new}):
+                    history.update(
+                        counted_orders().filter(_up_to(progress), buyer_id__in=chunk)
+                        .values_list('buyer_id', 'product_id').distinct()
+                    )
+            new -= history  # Buying a product again adds nothing
+            if new:
+                products, delta = count_pairs(history, new)
+                add_counts(products, delta)
+                changed = {products[i] for i in np.unique(delta.row)}
+                # A product with new buyers scores lower for everyone else, which
+                # can also reorder the lists it appears in
+                grown = [products[i] for i in np.unique(delta.row[delta.row == delta.col])]
+                for chunk in _chunks(grown):
+                    changed.update(RelatedProduct.objects.filter(related_id__in=chunk).values_list('product_id', flat=True))
+                changed = sorted(changed)
+                rank_neighbours(changed, top_k, min_buyers)
+                touched.update(changed)
+
+            progress.last_order_id, progress.last_created_at = batch[-1][0], batch[-1][1]
+            progress.orders += len(batch)
+            progress.save()
+        processed += len(batch)
+        if len(batch) < batch_size:
+            break
+    return processed, len(touched)
+
+
+def rebuild(**options):
+    """
+    Recount everything from scratch. Runs in one transaction, so the API keeps
+    serving the previous neighbours until the rebuild commits.
+    """
+    with transaction.atomic():
+        CoPurchaseProgress.objects.select_for_update().filter(pk=1).first()
+        CoPurchaseCount.objects.all().delete()
+        RelatedProduct.objects.all().delete()
+        CoPurchaseProgress.objects.all().delete()
+        return refresh(**options)
@@ -0,0 +1,185 @@
+"""
+Buffered product view counting.
+
+Counting a view must not cost a write on the primary, so ``record_view`` only
+bumps a counter in process memory. Once ``ANALYTICS_VIEW_FLUSH_INTERVAL``
+seconds have passed (or the buffer holds ``ANALYTICS_VIEW_BUFFER_SIZE``
+product-hours) the next view hands the buffer to a background thread, which
+writes it with two set-based upserts: hourly counts into ``ProductViewCount``
+and running totals into ``ProductPopularity``. Views still buffered when a
+process is killed are lost, which view statistics can afford; a normal exit
+flushes them.
+"""
+import atexit
+import logging
+import math
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from apps.products.models import Product
+from .models import ProductPopularity, ProductViewCount
+
+logger = logging.getLogger(__name__)
+
+# Scores are log2(decayed views) relative to this instant, which keeps them small
+POPULARITY_EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc).timestamp()
+MAX_SCORE_GAP = 60  # 2^-60 is lost next to 1 in a float, and larger gaps would underflow
+
+
+def get_half_life_hours():
+    return getattr(settings, 'PRODUCT_POPULARITY_HALF_LIFE_HOURS', 24)
+
+
+def decayed_score(views_by_hour, half_life_hours):
+    """
+    log2(sum(views * 2^(hours since epoch / half-life))) for ``{hour timestamp: views}``.
+    Newer views weigh more; the sum is taken in log space so it cannot overflow.
+    """
+    exponents = [
+        math.log2(views) + (hour - POPULARITY_EPOCH) / 3600 / half_life_hours
+        for hour, views in views_by_hour.items()
+    ]
+    top = max(exponents)
+    return top + math.log2(sum(2 ** (exponent - top) for exponent in exponents))
+
+
+def write_views(pending):
+    """Upsert buffered ``{(product_id, hour timestamp): views}`` into the hourly counts and popularity"""
+    rows = sorted(pending.items())  # Fixed lock order, so concurrent flushes cannot deadlock
+    by_product = defaultdict(dict)
+    for (product_id, hour), views in rows:
+        by_product[product_id][hour] = views
+    half_life = get_half_life_hours()
+    product_ids = sorted(by_product)
+
+    counts = ProductViewCount._meta.db_table
+    popularity = ProductPopularity._meta.db_table
+    products = Product._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Views of products deleted since are dropped by the join
+        cursor.execute(f"""
+            INSERT INTO {counts} (product_id, hour, views)
+            SELECT v.product_id, v.hour, v.views
+            FROM unnest(%s::uuid[], %s::timestamptz[], %s::integer[]) AS v(product_id, hour, views)
+            JOIN {products} p ON p.id = v.product_id
+            ORDER BY v.product_id, v.hour
+            ON CONFLICT (product_id, hour) DO UPDATE SET views = {counts}.views + EXCLUDED.views
+        """, [
+            [product_id for (product_id, _), _ in rows],
+            [datetime.fromtimestamp(hour, tz=dt_timezone.utc) for (_, hour), _ in rows],
+            [views for _, views in rows],
+        ])
+        # score: log2(2^old + 2^new), i.e. the decayed view sums added together
+        cursor.execute(f"""
+            INSERT INTO {popularity} (product_id, views, score, updated_at)
+            SELECT v.product_id, v.views, v.score, now()
+            FROM unnest(%s::uuid[], %s::bigint[], %s::float8[]) AS v(product_id, views, score)
+            JOIN {products} p ON p.id = v.product_id
+            ORDER BY v.product_id
+            ON CONFLICT (product_id) DO UPDATE SET
+                views = {popularity}.views + EXCLUDED.views,
+                score = GREATEST({popularity}.score, EXCLUDED.score) + ln(
+                    1 + power(2::float8, -LEAST(abs({popularity}.score - EXCLUDED.score), {MAX_SCORE_GAP}))
+                ) / ln(2),
+                updated_at = EXCLUDED.updated_at
+        """, [
+            product_ids,
+            [sum(by_product[product_id].values()) for product_id in product_ids],
+            [decayed_score(by_product[product_id], half_life) for product_id in product_ids],
+        ])
+
+
+class ViewCounter:
+    """Thread-safe in-memory view buffer, flushed in batches by one background thread"""
+
+    def __init__(self, flush_interval, max_pending):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.pending = defaultdict(int)  # (product_id, hour timestamp) -> views
+        self.lock = threading.Lock()
+        self.last_flush = time.monotonic()
+        self.flushing = False
+        self.executor = None
+
+    def record(self, product_id):
+        hour = int(time.time() // 3600) * 3600
+        with self.lock:
+            self.pending[(str(product_id), hour)] += 1
+            due = not self.flushing and (
+                len(self.pending) >= self.max_pending
+                or time.monotonic() - self.last_flush >= self.flush_interval
+            )
+            if due:
+                self.flushing = True  # Only this view schedules the flush
+        if due:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='product-views')
+            self.executor.submit(self._run)
+
+    def flush(self):
+        """Write the buffered views now; returns how many were written"""
+        with self.lock:
+            pending, self.pending = self.pending, defaultdict(int)
+            self.last_flush = time.monotonic()
+        if not pending:
+            return 0
+        try:
+            write_views(pending)
+        except Exception:
+            self._restore(pending)
+            raise
+        return sum(pending.values())
+
+    def _restore(self, pending):
+        """Put the views of a failed flush back, unless the buffer has grown out of bounds"""
+        with self.lock:
+            if len(self.pending) + len(pending) > self.max_pending * 10:
+                logger.warning(f"Dropping {sum(pending.values())} buffered product views")
+                return
+            for key, views in pending.items():
+                self.pending[key] += views
+
+    def _run(self):
+        """Flush thread entry point; closes its connection so an idle process holds none"""
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Failed to flush product views: {str(e)}", exc_info=True)
+        finally:
+            with self.lock:
+                self.flushing = False
+            connection.close()
+
+
+_view_counter = None
+_view_counter_lock = threading.Lock()
+
+
+def get_view_counter():
+    global _view_counter
+    with _view_counter_lock:
+        if _view_counter is None:
+            _view_counter = ViewCounter(
+                getattr(settings, 'ANALYTICS_VIEW_FLUSH_INTERVAL', 10),
+                getattr(settings, 'ANALYTICS_VIEW_BUFFER_SIZE', 5000),
+            )
+            atexit.register(_flush_at_exit, _view_counter)
+        return _view_counter
+
+
+def _flush_at_exit(counter):
+    try:
+        counter.flush()
+    except Exception as e:
+        logger.error(f"Failed to flush product views at exit: {str(e)}")
+
+
+def record_view(product_id):
+    """Count one detail view of a product (in memory; written by the next flush)"""
+    get_view_counter().record(product_id)
@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.analytics.models import ProductViewCount
+
+
+class Command(BaseCommand):
+    help = 'Delete hourly product view counts older than --days (popularity totals are kept)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90)
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        deleted = 0
+        while True:
+            # Small batches keep each transaction and its locks short
+            ids = list(
+                ProductViewCount.objects.filter(hour__lt=cutoff).values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            deleted += ProductViewCount.objects.filter(id__in=ids).delete()[0]
+        self.stdout.write(f'Deleted {deleted} hourly view counts older than {options["days"]} days')
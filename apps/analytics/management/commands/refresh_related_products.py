@@ -0,0 +1,29 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from apps.analytics.copurchase import SETTLE_DELAY, rebuild, refresh
+
+
+class Command(BaseCommand):
+    help = 'Fold orders placed since the last run into the "customers also bought" neighbours'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recount from every order instead of only new ones')
+        parser.add_argument('--batch-size', type=int, default=20000, help='Orders per transaction')
+        parser.add_argument('--top-k', type=int, default=None, help='Neighbours kept per product (RELATED_PRODUCTS_TOP_K)')
+        parser.add_argument(
+            '--settle-seconds', type=int, default=int(SETTLE_DELAY.total_seconds()),
+            help='Leave orders younger than this for the next run'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        processed, ranked = (rebuild if options['full'] else refresh)(
+            batch_size=options['batch_size'], top_k=options['top_k'],
+            settle_delay=timedelta(seconds=options['settle_seconds']),
+        )
+        self.stdout.write(
+            f'Processed {processed} orders, re-ranked {ranked} products in {time.monotonic() - started:.1f}s'
+        )
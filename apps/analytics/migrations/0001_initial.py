@@ -0,0 +1,42 @@
+# Generated by Django 5.1.6 on 2026-10-17 07:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('products', '0013_product_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPopularity',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='products.product')),
+                ('views', models.PositiveBigIntegerField(default=0)),
+                ('score', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Product popularity',
+                'indexes': [models.Index(fields=['-score'], name='product_popularity_score_idx'), models.Index(fields=['-views'], name='product_popularity_views_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductViewCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='view_counts', to='products.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hour'], name='product_view_count_hour_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'hour'), name='product_view_count_hour_uniq')],
+            },
+        ),
+    ]
@@ -1,3 +1,97 @@
 from django.db import models
 
-# Create your models here.
+
+class ProductViewCount(models.Model):
+    """Detail views of a product within one hour, written in batches by the view counter"""
+    product = models.ForeignKey('products.Product', on_delete=models.CASCADE, related_name='view_counts')
+    hour = models.DateTimeField()  # Start of the hour (UTC)
+    views = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Target of the flush upsert (ON CONFLICT (product_id, hour))
+            models.UniqueConstraint(fields=['product', 'hour'], name='product_view_count_hour_uniq'),
+        ]
+        indexes = [
+            # Retention: prune_product_views deletes by hour
+            models.Index(fields=['hour'], name='product_view_count_hour_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} @ {self.hour:%Y-%m-%d %H:00}: {self.views}"
+
+
+class ProductPopularity(models.Model):
+    """
+    Running view totals of a product. ``score`` is the base-2 log of its views
+    weighted by 2^(age / half-life), so sorting by it ranks products by their
+    exponentially decayed view count at any moment without ever rescoring rows.
+    """
+    product = models.OneToOneField(
+        'products.Product', on_delete=models.CASCADE, primary_key=True, related_name='popularity'
+    )
+    views = models.PositiveBigIntegerField(default=0)  # All-time views ("most viewed")
+    score = models.FloatField(default=0)  # Decayed popularity ("trending")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'Product popularity'
+        indexes = [
+            models.Index(fields=['-score'], name='product_popularity_score_idx'),
+            models.Index(fields=['-views'], name='product_popularity_views_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.views} views, score {self.score:.2f}"
+
+
+class CoPurchaseCount(models.Model):
+    """
+    Buyers who ordered both ``product`` and ``other`` (when they are the same
+    product: the buyers of that product). Both orderings of every pair are
+    stored, so a product's row of the co-occurrence matrix is one index scan.
+    """
+    product = models.ForeignKey('products.Product', on_delete=models.CASCADE, related_name='+')
+    other = models.ForeignKey('products.Product', on_delete=models.CASCADE, related_name='+')
+    buyers = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Target of the refresh upsert (ON CONFLICT (product_id, other_id))
+            models.UniqueConstraint(fields=['product', 'other'], name='copurchase_count_pair_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} + {self.other_id}: {self.buyers}"
+
+
+class RelatedProduct(models.Model):
+    """Top co-purchased neighbours of a product ("customers also bought"), rank 0 first"""
+    product = models.ForeignKey('products.Product', on_delete=models.CASCADE, related_name='related_products')
+    related = models.ForeignKey('products.Product', on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()  # Cosine similarity of the two products' buyer sets
+
+    class Meta:
+        ordering = ['product', 'rank']
+        constraints = [
+            # Also the index the related action reads: product_id = ? ORDER BY rank
+            models.UniqueConstraint(fields=['product', 'rank'], name='related_product_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} #{self.rank}: {self.related_id} ({self.score:.3f})"
+
+
+class CoPurchaseProgress(models.Model):
+    """Single row: the last order (by created_at, id) folded into CoPurchaseCount"""
+    last_created_at = models.DateTimeField(null=True, blank=True)
+    last_order_id = models.UUIDField(null=True, blank=True)
+    orders = models.PositiveBigIntegerField(default=0)  # Orders processed in total
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'Co-purchase progress'
+
+    def __str__(self):
+        return f"{self.orders} orders, up to {self.last_created_at}"
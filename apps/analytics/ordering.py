@@ -0,0 +1,37 @@
+from django.db.models import F
+from rest_framework import filters
+
+# Public ordering names -> popularity columns
+POPULARITY_ORDERINGS = {
+    'views': 'popularity__views',  # Most viewed, all time
+    'trending': 'popularity__score',  # Decayed view count, recent views weigh more
+}
+
+
+class PopularityOrderingFilter(filters.OrderingFilter):
+    """
+    OrderingFilter that also accepts ``views`` and ``trending`` (e.g.
+    ``?ordering=-trending``) when the view lists them in ``ordering_fields``.
+    Products that were never viewed sort as if they had no views, newest first.
+    The id breaks any remaining ties, so page-number pages neither repeat nor
+    skip products that share a sort value.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = self.get_ordering(request, queryset, view)
+        if not ordering:
+            return queryset
+        expressions = [self.to_expression(term) for term in ordering]
+        if any(term.lstrip('-') in POPULARITY_ORDERINGS for term in ordering):
+            expressions.append('-created_at')  # Ties, e.g. all the never-viewed products
+        if not any(term.lstrip('-') in ('id', 'pk') for term in ordering):
+            expressions.append('-id')
+        return queryset.order_by(*expressions)
+
+    @staticmethod
+    def to_expression(term):
+        name = term.lstrip('-')
+        if name not in POPULARITY_ORDERINGS:
+            return term
+        field = F(POPULARITY_ORDERINGS[name])
+        return field.desc(nulls_last=True) if term.startswith('-') else field.asc(nulls_first=True)
@@ -1,3 +1,186 @@
-from django.test import TestCase
+import time
+from datetime import timedelta
+from decimal import Decimal
+from uuid import uuid4
 
-# Create your tests here.
+from django.core.cache import cache
+from rest_framework.test import APITestCase
+
+from apps.authentication.models import User
+from apps.orders.models import Order
+from apps.products.models import Category, Product
+from .copurchase import rebuild, refresh
+from .counters import get_view_counter, write_views
+from .models import CoPurchaseCount, ProductPopularity, ProductViewCount, RelatedProduct
+
+
+class ProductViewCounterTests(APITestCase):
+    """Detail views are buffered in memory and written as batched upserts"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='pass',
+            role='seller', first_name='Sam', last_name='Seller'
+        )
+        category = Category.objects.create(name='Home & Decor')
+        cls.lamp, cls.mug, cls.vase = [
+            Product.objects.create(
+                title=title, description='Handmade', price=Decimal('19.99'),
+                category=category, seller=seller, stock=10, requires_shipping=False
+            )
+            for title in ['Ceramic Lamp', 'Ceramic Mug', 'Glass Vase']
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.counter = get_view_counter()
+        self.counter.flush()  # Views buffered by other tests
+
+    def view(self, product, times=1):
+        for _ in range(times):
+            self.assertEqual(self.client.get(f'/products/products/{product.pk}/').status_code, 200)
+
+    def test_views_are_buffered_then_flushed(self):
+        with self.assertNumQueries(0):
+            self.counter.record(self.lamp.pk)
+        self.view(self.lamp, 2)
+        self.view(self.mug)
+        self.assertFalse(ProductViewCount.objects.exists())
+
+        with self.assertNumQueries(4):  # Savepoint, two upserts, release
+            self.assertEqual(self.counter.flush(), 4)
+        self.assertEqual(ProductViewCount.objects.get(product=self.lamp).views, 3)
+        self.assertEqual(ProductPopularity.objects.get(product=self.mug).views, 1)
+
+        self.view(self.lamp)
+        self.counter.flush()
+        self.assertEqual(ProductViewCount.objects.get(product=self.lamp).views, 4)
+        self.assertEqual(ProductPopularity.objects.get(product=self.lamp).views, 4)
+
+    def test_revalidations_are_not_views(self):
+        etag = self.client.get(f'/products/products/{self.lamp.pk}/')['ETag']
+        response = self.client.get(f'/products/products/{self.lamp.pk}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.client.get(f'/products/products/{uuid4()}/')
+        self.assertEqual(self.counter.flush(), 1)
+        self.assertEqual(ProductViewCount.objects.get(product=self.lamp).views, 1)
+
+    def test_views_of_deleted_products_are_dropped(self):
+        self.counter.record(self.vase.pk)
+        self.vase.delete()
+        self.counter.flush()
+        self.assertFalse(ProductViewCount.objects.exists())
+
+    def test_popularity_orderings(self):
+        hour = int(time.time() // 3600) * 3600
+        # The lamp was popular two days ago (two half-lives), the mug is being viewed now
+        write_views({(str(self.lamp.pk), hour - 48 * 3600): 10})
+        write_views({(str(self.mug.pk), hour): 4})
+
+        def titles(ordering):
+            response = self.client.get('/products/products/', {'ordering': ordering})
+            return [product['title'] for product in response.data['results']]
+
+        self.assertEqual(titles('-views'), ['Ceramic Lamp', 'Ceramic Mug', 'Glass Vase'])
+        self.assertEqual(titles('-trending'), ['Ceramic Mug', 'Ceramic Lamp', 'Glass Vase'])
+        self.assertEqual(titles('trending'), ['Glass Vase', 'Ceramic Lamp', 'Ceramic Mug'])
+
+    def test_scores_add_up_across_flushes(self):
+        hour = int(time.time() // 3600) * 3600
+        write_views({(str(self.lamp.pk), hour): 4})
+        write_views({(str(self.lamp.pk), hour): 4})
+        write_views({(str(self.mug.pk), hour): 8})
+        lamp, mug = (ProductPopularity.objects.get(product=product).score for product in (self.lamp, self.mug))
+        self.assertAlmostEqual(lamp, mug)
+
+
+class RelatedProductTests(APITestCase):
+    """Co-purchase neighbours are counted offline, incrementally, and served with one query"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='pass',
+            role='seller', first_name='Sam', last_name='Seller'
+        )
+        category = Category.objects.create(name='Home & Decor')
+        cls.lamp, cls.mug, cls.vase, cls.rug = [
+            Product.objects.create(
+                title=title, description='Handmade', price=Decimal('19.99'),
+                category=category, seller=seller, stock=10, requires_shipping=False
+            )
+            for title in ['Ceramic Lamp', 'Ceramic Mug', 'Glass Vase', 'Wool Rug']
+        ]
+        cls.buyers = [
+            User.objects.create_user(
+                email=f'buyer{i}@example.com', username=f'buyer{i}', password='pass',
+                role='buyer', first_name='Bea', last_name='Buyer'
+            )
+            for i in range(3)
+        ]
+
+    def order(self, buyer, product, status='delivered'):
+        Order.objects.create(buyer=buyer, product=product, total_price=product.price, status=status)
+
+    def refresh(self, **options):
+        return refresh(settle_delay=timedelta(0), **options)
+
+    def related(self, product):
+        response = self.client.get(f'/products/products/{product.pk}/related/')
+        self.assertEqual(response.status_code, 200)
+        return [(neighbour['title'], neighbour['score']) for neighbour in response.data['results']]
+
+    def snapshot(self):
+        return sorted(RelatedProduct.objects.values_list('product_id', 'rank', 'related_id', 'score'))
+
+    def test_neighbours_ranked_by_cosine_similarity(self):
+        first, second, third = self.buyers
+        self.order(first, self.lamp)
+        self.order(first, self.mug)
+        self.order(second, self.lamp)
+        self.order(second, self.mug)
+        self.order(third, self.lamp)
+        self.order(third, self.vase)
+        self.order(third, self.rug, status='cancelled')
+        self.assertEqual(self.refresh(), (6, 3))
+
+        # Lamp: 3 buyers, mug: 2 (both also bought the lamp), vase: 1
+        self.assertEqual(self.related(self.lamp), [('Ceramic Mug', 0.8165), ('Glass Vase', 0.5774)])
+        self.assertEqual(self.related(self.mug), [('Ceramic Lamp', 0.8165)])
+        self.assertEqual(self.related(self.rug), [])
+        self.assertEqual(CoPurchaseCount.objects.get(product=self.lamp, other=self.lamp).buyers, 3)
+
+    def test_incremental_refresh_matches_full_rebuild(self):
+        first, second, third = self.buyers
+        self.order(first, self.lamp)
+        self.order(second, self.mug)
+        self.refresh()
+        self.assertEqual(self.related(self.lamp), [])
+
+        # Only the new orders are read; repeat purchases add nothing
+        self.order(first, self.mug)
+        self.order(first, self.lamp)
+        self.order(third, self.vase)
+        self.order(third, self.lamp)
+        self.assertEqual(self.refresh(batch_size=2), (4, 3))
+        self.assertEqual(self.refresh(), (0, 0))
+        incremental = self.snapshot()
+        counts = sorted(CoPurchaseCount.objects.values_list('product_id', 'other_id', 'buyers'))
+
+        rebuild(settle_delay=timedelta(0))
+        self.assertEqual(self.snapshot(), incremental)
+        self.assertEqual(sorted(CoPurchaseCount.objects.values_list('product_id', 'other_id', 'buyers')), counts)
+        self.assertEqual(self.related(self.lamp), [('Glass Vase', 0.7071), ('Ceramic Mug', 0.5)])
+
+    def test_related_is_a_single_query(self):
+        for buyer in self.buyers:
+            for product in (self.lamp, self.mug, self.vase, self.rug):
+                self.order(buyer, product)
+        self.refresh(top_k=2)
+        with self.assertNumQueries(1):
+            neighbours = self.related(self.lamp)
+        self.assertEqual([score for _, score in neighbours], [1.0, 1.0])
+
+    def test_invalid_product_id(self):
+        self.assertEqual(self.client.get('/products/products/not-a-uuid/related/').status_code, 404)
@@ -40,6 +40,12 @@ class User(AbstractUser):
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username"]
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # User listings, paginated by keyset
+            models.Index(fields=["-date_joined", "-id"], name="user_date_joined_idx"),
+        ]
+
     def __str__(self):
         return f"{self.username} ({self.role})"
 
@@ -1,3 +1,67 @@
-from django.test import TestCase
+import base64
+import json
 
-# Create your tests here.
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from .models import User
+
+
+class UserKeysetPaginationTests(APITestCase):
+    """Cursor pages of the user and seller lists, ordered by date joined"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(
+            email='admin@example.com', username='admin', password='pass', role='admin'
+        )
+        for i in range(8):
+            User.objects.create_user(
+                email=f'seller{i}@example.com', username=f'seller{i}', password='pass', role='seller'
+            )
+        # Most sellers joined at the same instant, so only the id orders them
+        User.objects.filter(username__in=[f'seller{i}' for i in range(6)]).update(date_joined=timezone.now())
+        cls.expected = [
+            str(pk) for pk in User.objects.filter(role='seller').order_by('-date_joined', '-id').values_list('pk', flat=True)
+        ]
+
+    def setUp(self):
+        self.client.force_authenticate(self.admin)
+
+    def ids(self, response):
+        return [user['id'] for user in response.data['results']]
+
+    def test_next_and_previous_round_trip(self):
+        response = self.client.get('/auth/sellers/', {'cursor': '', 'page_size': 3})
+        pages = [self.ids(response)]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append(self.ids(response))
+        self.assertEqual(sum(pages, []), self.expected)
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(self.ids(response), pages[-2])
+
+    def test_filters_apply_to_cursor_pages(self):
+        response = self.client.get('/auth/users/', {'cursor': '', 'role': 'seller', 'page_size': 5, 'count': 'false'})
+        self.assertNotIn('count', response.data)
+        self.assertEqual(self.ids(response), self.expected[:5])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(self.ids(response), self.expected[5:])
+        self.assertIn('role=seller', response.data['previous'])
+
+    def test_malformed_or_tampered_cursor(self):
+        tampered = base64.urlsafe_b64encode(json.dumps({'p': ['not a date', 'x']}).encode()).decode()
+        for token in ('garbage', tampered):
+            with self.subTest(token=token):
+                self.assertEqual(self.client.get('/auth/users/', {'cursor': token}).status_code, 404)
+
+    def test_page_number_fallback(self):
+        response = self.client.get('/auth/users/', {'page_size': 4})
+        self.assertEqual(response.data['count'], 9)
+        self.assertIn('page=2', response.data['next'])
+
+    def test_user_list_is_admin_only(self):
+        self.client.force_authenticate(User.objects.get(username='seller0'))
+        self.assertEqual(self.client.get('/auth/users/').status_code, 403)
+        self.assertEqual(self.client.get('/auth/sellers/').status_code, 200)
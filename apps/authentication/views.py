@@ -13,7 +13,7 @@ from .serializers import (
 )
 from .utils import send_verification_email, send_password_reset_email, send_welcome_email
 from rest_framework.generics import ListAPIView, RetrieveAPIView
-from rest_framework.pagination import PageNumberPagination
+from auraspotmarketplace1.pagination import UserKeysetPagination
 from django.db.models import Q
 from django.contrib.auth import authenticate
 
@@ -243,21 +243,6 @@ class PasswordResetConfirmView(APIView):
             'message': 'Password reset successful'
         })
 
-class StandardResultsSetPagination(PageNumberPagination):
-    """Standard pagination class for consistent pagination across views."""
-    page_size = 10  # Default number of items per page
-    page_size_query_param = 'page_size'  # Allow client to override page size
-    max_page_size = 100  # Maximum limit per page
-    page_query_param = 'page'  # Parameter name for page number
-    
-    def get_paginated_response(self, data):
-        return Response({
-            'count': self.page.paginator.count,  # Total number of items
-            'next': self.get_next_link(),  # URL for next page
-            'previous': self.get_previous_link(),  # URL for previous page
-            'results': data  # Page of results
-        })
-
 class UserListView(ListAPIView):
     """
     View to list all users with pagination.
@@ -265,7 +250,7 @@ class UserListView(ListAPIView):
     """
     serializer_class = UserListSerializer
     permission_classes = [IsAuthenticated, IsAdminRole]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = UserKeysetPagination
 
     def get_queryset(self):
         queryset = User.objects.all().order_by('-date_joined')
@@ -292,7 +277,7 @@ class SellerListView(ListAPIView):
     """
     serializer_class = UserListSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = UserKeysetPagination
 
     def get_queryset(self):
         queryset = User.objects.filter(role='seller').order_by('-date_joined')
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.buyers.notifications import send_wishlist_notifications
+
+
+class Command(BaseCommand):
+    help = 'Email buyers about restocks and price drops of the products on their wishlist'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Product changes per transaction')
+        parser.add_argument('--loop', type=int, metavar='SECONDS', help='Keep running, sending every SECONDS')
+
+    def handle(self, *args, **options):
+        while True:
+            processed, sent = send_wishlist_notifications(batch_size=options['batch_size'])
+            self.stdout.write(f'Sent {sent} emails for {processed} product changes')
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
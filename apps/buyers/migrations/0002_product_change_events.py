@@ -0,0 +1,59 @@
+# Generated by Django 5.1.6 on 2026-10-17 07:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Records restocks (stock 0 -> positive) and price drops of wishlisted products.
+# The WHEN clause keeps every other product update free of any extra work.
+CREATE_TRIGGER = """
+CREATE FUNCTION buyers_record_product_change() RETURNS trigger AS $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM buyers_wishlist WHERE product_id = NEW.id) THEN
+        RETURN NULL;
+    END IF;
+    IF OLD.stock <= 0 AND NEW.stock > 0 THEN
+        INSERT INTO buyers_productchangeevent (product_id, kind, old_price, new_price, created_at)
+        VALUES (NEW.id, 'restock', OLD.price, NEW.price, now());
+    END IF;
+    IF NEW.price < OLD.price THEN
+        INSERT INTO buyers_productchangeevent (product_id, kind, old_price, new_price, created_at)
+        VALUES (NEW.id, 'price_drop', OLD.price, NEW.price, now());
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER buyers_product_change
+    AFTER UPDATE OF stock, price ON products_product
+    FOR EACH ROW
+    WHEN ((OLD.stock <= 0 AND NEW.stock > 0) OR NEW.price < OLD.price)
+    EXECUTE FUNCTION buyers_record_product_change();
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS buyers_product_change ON products_product;
+DROP FUNCTION IF EXISTS buyers_record_product_change();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('buyers', '0001_initial'),
+        ('products', '0013_product_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductChangeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('restock', 'Back in stock'), ('price_drop', 'Price drop')], max_length=20)),
+                ('old_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('new_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='products.product')),
+            ],
+        ),
+        migrations.RunSQL(CREATE_TRIGGER, DROP_TRIGGER),
+    ]
@@ -16,3 +16,25 @@ class Wishlist(models.Model):
         
     def __str__(self):
         return f"{self.buyer.email}'s wishlist item: {self.product.title}"
+
+
+class ProductChangeEvent(models.Model):
+    """
+    A wishlisted product came back in stock or got cheaper. Rows are written by
+    a database trigger on the products table (see migration 0002), so stock
+    released by a cancelled order or a queryset ``update()`` is caught as well,
+    and are consumed by ``send_wishlist_notifications``.
+    """
+    KIND_CHOICES = [
+        ('restock', 'Back in stock'),
+        ('price_drop', 'Price drop'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    old_price = models.DecimalField(max_digits=10, decimal_places=2)
+    new_price = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.kind} of {self.product_id} at {self.created_at}"
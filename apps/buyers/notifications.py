@@ -0,0 +1,112 @@
+"""
+Back-in-stock and price-drop emails for wishlists.
+
+Product updates only leave a ``ProductChangeEvent`` row behind (written by a
+trigger, in the same transaction as the update). ``send_wishlist_notifications``
+runs periodically: it claims a batch of events, joins their products against
+``Wishlist`` in one query, collapses everything a buyer should hear about into
+one email, and sends the batch's emails over a single SMTP connection that is
+reused for the whole run.
+
+A batch's events are deleted in the transaction that claimed them, after its
+emails went out: if sending fails the events stay and the batch is retried on
+the next run, so a buyer may occasionally get an email twice but never miss one.
+"""
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.template.loader import render_to_string
+
+from .models import ProductChangeEvent, Wishlist
+
+logger = logging.getLogger(__name__)
+
+
+def collapse_events(events):
+    """``(product_id, kind, old_price)`` rows -> ``{product_id: {'restocked': bool, 'was': highest old price}}``"""
+    changes = defaultdict(lambda: {'restocked': False, 'was': None})
+    for product_id, kind, old_price in events:
+        change = changes[product_id]
+        if kind == 'restock':
+            change['restocked'] = True
+        elif change['was'] is None or old_price > change['was']:
+            change['was'] = old_price
+    return dict(changes)
+
+
+def wishlist_updates(changes):
+    """
+    ``{buyer: [update, ...]}`` for the buyers who wishlisted a changed product.
+    Events are checked against the product as it is now: a product that sold
+    out again or went back up in price meanwhile is left out.
+    """
+    updates = defaultdict(list)
+    entries = (
+        Wishlist.objects.filter(product_id__in=list(changes), buyer__is_active=True)
+        .select_related('buyer', 'product')
+        .order_by('buyer_id', 'product__title')
+    )
+    for entry in entries:
+        product, change = entry.product, changes[entry.product_id]
+        restocked = change['restocked'] and product.stock > 0
+        was = change['was'] if change['was'] is not None and product.price < change['was'] else None
+        if restocked or was is not None:
+            updates[entry.buyer].append({'product': product, 'restocked': restocked, 'was': was})
+    return updates
+
+
+def build_message(buyer, updates, connection=None):
+    context = {
+        'user': buyer,
+        'updates': updates,
+        'base_url': settings.BASE_URL,
+    }
+    if len(updates) == 1:
+        subject = f"Good news about {updates[0]['product'].title}"
+    else:
+        subject = f"Good news about {len(updates)} items on your wishlist"
+    message = EmailMultiAlternatives(
+        subject=subject,
+        body=render_to_string('buyers/wishlist_update_email.txt', context),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[buyer.email],
+        connection=connection,
+    )
+    message.attach_alternative(render_to_string('buyers/wishlist_update_email.html', context), 'text/html')
+    return message
+
+
+def send_wishlist_notifications(batch_size=500):
+    """
+    Email buyers about restocks and price drops of their wishlisted products,
+    ``batch_size`` events per transaction. Events locked by a concurrent run
+    are skipped. Returns (events processed, emails sent).
+    """
+    processed = sent = 0
+    mail = get_connection(fail_silently=False)
+    mail.open()  # One connection for the whole run; send_messages would otherwise reconnect per call
+    try:
+        while True:
+            with transaction.atomic():
+                events = list(
+                    ProductChangeEvent.objects.select_for_update(skip_locked=True)
+                    .order_by('id').values_list('id', 'product_id', 'kind', 'old_price')[:batch_size]
+                )
+                if not events:
+                    break
+                updates = wishlist_updates(collapse_events(event[1:] for event in events))
+                messages = [build_message(buyer, items, mail) for buyer, items in updates.items()]
+                if messages:
+                    sent += mail.send_messages(messages) or 0
+                ProductChangeEvent.objects.filter(id__in=[event[0] for event in events]).delete()
+            processed += len(events)
+            if len(events) < batch_size:
+                break
+    finally:
+        mail.close()
+    if sent:
+        logger.info(f"Sent {sent} wishlist notifications for {processed} product changes")
+    return processed, sent
@@ -2,8 +2,10 @@ from rest_framework import serializers
 from apps.products.models import Product
 from apps.orders.models import Order, Payment
 from apps.shipping.models import Shipping
+from auraspotmarketplace1.fieldsets import SparseFieldsetMixin
 
-class WishlistProductSerializer(serializers.ModelSerializer):
+class WishlistProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    image = serializers.ImageField(source='primary_image.image', read_only=True, allow_null=True)  # Cover image
     class Meta:
         model = Product
         fields = [
@@ -13,7 +15,8 @@ class WishlistProductSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'updated_at']
 
-class BuyerOrderProductSerializer(serializers.ModelSerializer):
+class BuyerOrderProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    image = serializers.ImageField(source='primary_image.image', read_only=True, allow_null=True)  # Cover image
     class Meta:
         model = Product
         fields = [
@@ -21,7 +24,7 @@ class BuyerOrderProductSerializer(serializers.ModelSerializer):
             'seller'
         ]
 
-class BuyerOrderSerializer(serializers.ModelSerializer):
+class BuyerOrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     product = BuyerOrderProductSerializer(read_only=True)
     payment_status = serializers.CharField(source='payment.payment_status', read_only=True)
     shipping_status = serializers.CharField(source='shipping.status', read_only=True)
@@ -47,7 +50,7 @@ class BuyerDashboardStatsSerializer(serializers.Serializer):
     total_spent = serializers.DecimalField(max_digits=10, decimal_places=2)
     wishlist_count = serializers.IntegerField()
 
-class BuyerShippingSerializer(serializers.ModelSerializer):
+class BuyerShippingSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     order = BuyerOrderSerializer(read_only=True)
     
     class Meta:
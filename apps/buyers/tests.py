@@ -1,3 +1,92 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.test import TestCase, override_settings
+
+from apps.authentication.models import User
+from apps.orders.inventory import release_stock
+from apps.products.models import Category, Product
+from .models import ProductChangeEvent, Wishlist
+from .notifications import send_wishlist_notifications
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise ConnectionError('SMTP server unavailable')
+
+
+class WishlistNotificationTests(TestCase):
+    """Restocks and price drops are recorded by a trigger and emailed in batches"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='pass',
+            role='seller', first_name='Sam', last_name='Seller'
+        )
+        category = Category.objects.create(name='Home & Decor')
+        cls.lamp, cls.mug, cls.vase = [
+            Product.objects.create(
+                title=title, description='Handmade', price=Decimal('20.00'),
+                category=category, seller=seller, stock=stock, requires_shipping=False
+            )
+            for title, stock in [('Ceramic Lamp', 0), ('Ceramic Mug', 5), ('Glass Vase', 0)]
+        ]
+        cls.buyers = [
+            User.objects.create_user(
+                email=f'buyer{i}@example.com', username=f'buyer{i}', password='pass',
+                role='buyer', first_name=f'Bea{i}', last_name='Buyer'
+            )
+            for i in range(3)
+        ]
+        for buyer in cls.buyers:
+            Wishlist.objects.create(buyer=buyer, product=cls.lamp)
+        Wishlist.objects.create(buyer=cls.buyers[0], product=cls.mug)
+
+    def set_price(self, product, price):
+        Product.objects.filter(pk=product.pk).update(price=Decimal(price))
+
+    def test_only_restocks_and_price_drops_of_wishlisted_products_are_recorded(self):
+        release_stock(self.lamp.pk, 3)  # Queryset update, e.g. a cancelled order
+        release_stock(self.lamp.pk, 1)  # Already in stock
+        self.set_price(self.mug, '25.00')
+        self.set_price(self.mug, '15.00')
+        release_stock(self.vase.pk, 2)  # Nobody wishlisted it
+        self.set_price(self.vase, '10.00')
+        self.assertEqual(
+            sorted(ProductChangeEvent.objects.values_list('product__title', 'kind', 'old_price', 'new_price')),
+            [('Ceramic Lamp', 'restock', Decimal('20.00'), Decimal('20.00')),
+             ('Ceramic Mug', 'price_drop', Decimal('25.00'), Decimal('15.00'))]
+        )
+
+    def test_one_email_per_buyer_over_one_connection(self):
+        release_stock(self.lamp.pk, 3)
+        self.set_price(self.mug, '15.00')
+
+        # Savepoint, claim the events, one join with Wishlist, delete them, release
+        with self.assertNumQueries(5):
+            self.assertEqual(send_wishlist_notifications(), (2, 3))
+        self.assertFalse(ProductChangeEvent.objects.exists())
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [buyer.email for buyer in self.buyers])
+
+        first = next(message for message in mail.outbox if message.to == [self.buyers[0].email])
+        self.assertEqual(first.subject, 'Good news about 2 items on your wishlist')
+        self.assertIn('Ceramic Lamp: back in stock', first.body)
+        self.assertIn('Ceramic Mug: now $15.00 (was $20.00)', first.body)
+        self.assertEqual(send_wishlist_notifications(), (0, 0))
+
+    def test_changes_undone_before_sending_are_skipped(self):
+        release_stock(self.lamp.pk, 3)
+        Product.objects.filter(pk=self.lamp.pk).update(stock=0)
+        self.set_price(self.mug, '15.00')
+        self.set_price(self.mug, '30.00')
+        self.assertEqual(send_wishlist_notifications(), (2, 0))
+        self.assertEqual(mail.outbox, [])
+
+    @override_settings(EMAIL_BACKEND='apps.buyers.tests.FailingEmailBackend')
+    def test_events_are_kept_when_sending_fails(self):
+        release_stock(self.lamp.pk, 3)
+        with self.assertRaises(ConnectionError):
+            send_wishlist_notifications()
+        self.assertEqual(ProductChangeEvent.objects.count(), 1)
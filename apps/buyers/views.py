@@ -5,9 +5,10 @@ from rest_framework.response import Response
 from django.db.models import Count, Sum, Q
 from django.utils import timezone
 from datetime import timedelta
-from rest_framework.pagination import PageNumberPagination
+from auraspotmarketplace1.fieldsets import sparse_queryset
+from auraspotmarketplace1.pagination import KeysetPagination
 
-from apps.orders.models import Order
+from apps.orders.models import ACTIVE_STATUSES, Order
 from apps.products.models import Product
 from .models import Wishlist
 from .serializers import (
@@ -17,11 +18,6 @@ from .serializers import (
     BuyerShippingSerializer
 )
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 10
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-
 class IsBuyerOrAdmin(permissions.BasePermission):
     """Permission class for buyer or admin access"""
     def has_permission(self, request, view):
@@ -36,7 +32,7 @@ class IsBuyerOrAdmin(permissions.BasePermission):
 
 class BuyerDashboardViewSet(viewsets.ViewSet):
     permission_classes = [IsBuyerOrAdmin]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetPagination
 
     def paginate_queryset(self, queryset):
         if self.paginator is None:
@@ -56,6 +52,15 @@ class BuyerDashboardViewSet(viewsets.ViewSet):
                 self._paginator = self.pagination_class()
         return self._paginator
 
+    def get_serializer(self, serializer_class, *args, **kwargs):
+        """Serializer with the request in its context, so ?fields= and ?expand= apply"""
+        kwargs.setdefault('context', {'request': self.request})
+        return serializer_class(*args, **kwargs)
+
+    def sparse(self, queryset, serializer_class):
+        """Load only the columns and relations the requested fields render (plus the keyset cursor)"""
+        return sparse_queryset(queryset, self.get_serializer(serializer_class), extra=('created_at',))
+
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """Get buyer's dashboard statistics"""
@@ -66,7 +71,7 @@ class BuyerDashboardViewSet(viewsets.ViewSet):
         stats = {
             'total_orders': orders.count(),
             'active_orders': orders.filter(
-                status__in=['pending', 'processing', 'shipped']
+                status__in=ACTIVE_STATUSES
             ).count(),
             'completed_orders': orders.filter(status='delivered').count(),
             'cancelled_orders': orders.filter(status='cancelled').count(),
@@ -85,7 +90,7 @@ class BuyerDashboardViewSet(viewsets.ViewSet):
         status_filter = request.query_params.get('status')
         date_filter = request.query_params.get('date')
         
-        orders = Order.objects.filter(buyer=request.user)
+        orders = Order.objects.filter(buyer=request.user).order_by('-created_at')
         
         # Apply filters
         if status_filter:
@@ -103,12 +108,13 @@ class BuyerDashboardViewSet(viewsets.ViewSet):
                     created_at__gte=timezone.now() - timedelta(days=30)
                 )
 
+        orders = self.sparse(orders, BuyerOrderSerializer)
         page = self.paginate_queryset(orders)
         if page is not None:
-            serializer = BuyerOrderSerializer(page, many=True)
+            serializer = self.get_serializer(BuyerOrderSerializer, page, many=True)
             return self.get_paginated_response(serializer.data)
 
-        serializer = BuyerOrderSerializer(orders, many=True)
+        serializer = self.get_serializer(BuyerOrderSerializer, orders, many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
@@ -116,28 +122,29 @@ class BuyerDashboardViewSet(viewsets.ViewSet):
         """Get buyer's active orders"""
         orders = Order.objects.filter(
             buyer=request.user,
-            status__in=['pending', 'processing', 'shipped']
+            status__in=ACTIVE_STATUSES
         ).order_by('-created_at')
 
+        orders = self.sparse(orders, BuyerOrderSerializer)
         page = self.paginate_queryset(orders)
         if page is not None:
-            serializer = BuyerOrderSerializer(page, many=True)
+            serializer = self.get_serializer(BuyerOrderSerializer, page, many=True)
             return self.get_paginated_response(serializer.data)
 
-        serializer = BuyerOrderSerializer(orders, many=True)
+        serializer = self.get_serializer(BuyerOrderSerializer, orders, many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
     def wishlist(self, request):
         """Get buyer's wishlist"""
-        wishlist_items = Wishlist.objects.filter(buyer=request.user)
+        wishlist_items = Wishlist.objects.filter(buyer=request.user).select_related('product__primary_image')
         
         page = self.paginate_queryset(wishlist_items)
         if page is not None:
-            serializer = WishlistProductSerializer([item.product for item in page], many=True)
+            serializer = self.get_serializer(WishlistProductSerializer, [item.product for item in page], many=True)
             return self.get_paginated_response(serializer.data)
 
-        serializer = WishlistProductSerializer([item.product for item in wishlist_items], many=True)
+        serializer = self.get_serializer(WishlistProductSerializer, [item.product for item in wishlist_items], many=True)
         return Response(serializer.data)
 
     @action(detail=True, methods=['post'])
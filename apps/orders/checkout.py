@@ -0,0 +1,69 @@
+"""
+Placing orders, from a single product or a whole cart.
+
+Each order is one product from one seller, the unit that is paid, shipped and
+cancelled. A checkout places several at once in one transaction: the orders
+are written with one bulk INSERT and grouped under a ``Checkout`` that carries
+their total, then the stock of every product is reserved together (see
+``inventory.reserve_stock``). Reserving last keeps the hot product rows locked
+only until commit. The single-product order API goes through the same path.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from apps.products.models import Product
+from .inventory import get_reservation_ttl, reserve_stock, stock_error
+from .models import CartItem, Checkout, Order
+
+MAX_CHECKOUT_LINES = 100  # Distinct products per checkout
+
+
+def place_orders(buyer, quantities, checkout=False):
+    """
+    Create one pending order per product of ``{product_id: quantity}`` and
+    reserve the stock, all or nothing. With ``checkout`` the orders are grouped under
+    a new Checkout. Returns (checkout or None, orders in product id order);
+    raises ``inventory.StockError`` leaving nothing behind.
+    """
+    reserved_until = timezone.now() + get_reservation_ttl()
+    # Priced without a lock; the reservation reports the price it took the stock at
+    prices = dict(Product.objects.filter(pk__in=list(quantities)).values_list('pk', 'price'))
+    if len(prices) < len(quantities):
+        raise stock_error(quantities)
+
+    with transaction.atomic():
+        group = Checkout(buyer=buyer) if checkout else None
+        orders = [
+            Order(
+                buyer=buyer, product_id=pk, quantity=quantities[pk], total_price=prices[pk] * quantities[pk],
+                reserved_until=reserved_until, checkout=group,
+            )
+            for pk in sorted(quantities)
+        ]
+        if group:
+            group.total_price = sum(order.total_price for order in orders)
+            group.save()
+        Order.objects.bulk_create(orders)
+
+        reserved = reserve_stock(quantities)
+        repriced = [order for order in orders if reserved[order.product_id] != prices[order.product_id]]
+        if repriced:
+            # A price changed between the read and the reservation
+            for order in repriced:
+                order.total_price = reserved[order.product_id] * order.quantity
+            Order.objects.bulk_update(repriced, ['total_price'])
+            if group:
+                group.total_price = sum(order.total_price for order in orders)
+                group.save(update_fields=['total_price'])
+    return group, orders
+
+
+def checkout_cart(buyer):
+    """Check out everything in the buyer's cart and empty it; returns (checkout, orders), or (None, []) for an empty cart"""
+    with transaction.atomic():
+        quantities = dict(CartItem.objects.filter(buyer=buyer).values_list('product_id', 'quantity'))
+        if not quantities:
+            return None, []
+        group, orders = place_orders(buyer, quantities, checkout=True)
+        CartItem.objects.filter(buyer=buyer, product_id__in=list(quantities)).delete()
+    return group, orders
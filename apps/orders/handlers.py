@@ -0,0 +1,64 @@
+"""
+Outbox handlers for orders and payments: emails to the buyer.
+
+Registered when the app loads (see ``OrdersConfig.ready``) and run by the
+``process_outbox`` worker, never inside the request that made the change.
+"""
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
+from django.template.loader import render_to_string
+
+from .models import Order, Payment
+from .outbox import handler
+
+# Status changes the buyer is emailed about; payment is covered by the receipt
+STATUS_MESSAGES = {
+    'shipped': 'Your order of {title} is on its way.',
+    'delivered': 'Your order of {title} was delivered.',
+    'cancelled': 'Your order of {title} was cancelled.',
+}
+
+
+def send_order_email(order, subject, message, link=None):
+    """Email ``order``'s buyer a short update about it"""
+    context = {
+        'user': order.buyer,
+        'order': order,
+        'message': message,
+        'link': link or f'{settings.BASE_URL}/orders/orders/{order.pk}/',
+    }
+    email = EmailMultiAlternatives(
+        subject=subject,
+        body=render_to_string('orders/order_update_email.txt', context),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[order.buyer.email],
+    )
+    email.attach_alternative(render_to_string('orders/order_update_email.html', context), 'text/html')
+    email.send()
+
+
+@handler('order.status_changed')
+def email_status_change(payload):
+    template = STATUS_MESSAGES.get(payload['to'])
+    if template is None:
+        return
+    order = Order.objects.select_related('buyer', 'product').filter(pk=payload['order']).first()
+    if order is None:
+        return  # Deleted meanwhile
+    message = template.format(title=order.product.title)
+    if payload.get('note'):
+        message = f"{message} ({payload['note']})"
+    send_order_email(order, f"Your order has been {payload['to']}", message)
+
+
+@handler('payment.completed')
+def email_receipt(payload):
+    payment = Payment.objects.select_related('order__buyer', 'order__product').filter(pk=payload['payment']).first()
+    if payment is None:
+        return
+    order = payment.order
+    send_order_email(
+        order, 'Payment received',
+        f'We received your payment of ${payment.amount} for {order.quantity} x {order.product.title} '
+        f'(transaction {payment.transaction_id}).'
+    )
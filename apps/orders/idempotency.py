@@ -0,0 +1,157 @@
+"""
+Idempotency keys for POSTs that clients retry.
+
+A client that may retry a request (e.g. after a timeout) sends it with an
+``Idempotency-Key`` header holding a value unique to that operation. The first
+request with a key runs normally and its response is stored for
+``IDEMPOTENCY_KEY_TTL`` seconds. A retry with the same key, method, path and
+body gets the stored response back, marked ``Idempotent-Replayed: true``,
+without running the view again; reusing the key for a different request is
+rejected with 422.
+
+Requests with the same key are serialized by a Postgres advisory lock held
+while the view runs, so a duplicate that arrives while the first is still
+running waits for it (up to ``IDEMPOTENCY_WAIT_TIMEOUT`` seconds) and then
+replays its response instead of executing a second time. The lock belongs to
+the database session, so it goes away even if the process dies mid-request.
+Only outcomes that a retry would repeat are stored: 2xx responses and 4xx
+responses other than ``RETRYABLE_STATUSES``. A view that raises, answers
+5xx, or marks its response with ``retryable()`` (e.g. a carrier that timed
+out) stores nothing, so a retry with the same key runs the view again.
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# 4xx answers that depend on the moment rather than the request
+RETRYABLE_STATUSES = {
+    status.HTTP_408_REQUEST_TIMEOUT, status.HTTP_409_CONFLICT, 425, status.HTTP_429_TOO_MANY_REQUESTS,
+}
+
+
+def get_ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+
+
+def get_wait_timeout():
+    return getattr(settings, 'IDEMPOTENCY_WAIT_TIMEOUT', 30)
+
+
+def request_fingerprint(request):
+    """sha256 of the method, path and parsed body; JSON key order and form field order do not matter"""
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())  # QueryDict: keep repeated fields
+    payload = json.dumps([request.method, request.path, data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _lock_id(user_id, key):
+    """64-bit advisory lock id of a user's key"""
+    return int.from_bytes(hashlib.sha256(f'{user_id}:{key}'.encode()).digest()[:8], 'big', signed=True)
+
+
+def _acquire(lock_id):
+    """Take the key's session-level lock, waiting for a request holding it; False on timeout"""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_lock(%s)', [lock_id])
+        if cursor.fetchone()[0]:
+            return True  # The usual case: nobody else is using the key
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute("SELECT set_config('lock_timeout', %s, true)", [f'{get_wait_timeout()}s'])
+            # Session-level: survives the end of this transaction until released
+            cursor.execute('SELECT pg_advisory_lock(%s)', [lock_id])
+    except OperationalError:
+        return False
+    return True
+
+
+def _release(lock_id):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_unlock(%s)', [lock_id])
+
+
+def retryable(response):
+    """Mark a failure as transient, so it is not stored and a retry with the same key runs the view again"""
+    response.idempotency_retryable = True
+    return response
+
+
+def is_stored(response):
+    """Whether a retry would get ``response`` again, and may therefore be answered with it"""
+    if getattr(response, 'idempotency_retryable', False):
+        return False
+    code = response.status_code
+    return 200 <= code < 300 or (400 <= code < 500 and code not in RETRYABLE_STATUSES)
+
+
+def replay(record):
+    response = Response(record.response_body, status=record.response_status)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """
+    Honour ``Idempotency-Key`` on a DRF view function or viewset method.
+    Requests without the header, or from anonymous users, run as before.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        request = args[0] if isinstance(args[0], Request) else args[1]
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        fingerprint = request_fingerprint(request)
+        lock_id = _lock_id(request.user.pk, key)
+        if not _acquire(lock_id):
+            return Response(
+                {'error': f'A request with this {HEADER} is still being processed; retry later'},
+                status=status.HTTP_409_CONFLICT
+            )
+        try:
+            record = IdempotencyKey.objects.filter(
+                user=request.user, key=key, expires_at__gt=timezone.now()
+            ).first()
+            if record is not None:
+                if record.fingerprint != fingerprint:
+                    return Response(
+                        {'error': f'This {HEADER} was already used for a different request'},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                    )
+                return replay(record)
+
+            response = view(*args, **kwargs)
+            if isinstance(response, Response) and is_stored(response):
+                IdempotencyKey.objects.update_or_create(
+                    user=request.user, key=key,
+                    defaults={
+                        'fingerprint': fingerprint,
+                        'response_status': response.status_code,
+                        'response_body': response.data,
+                        'expires_at': timezone.now() + get_ttl(),
+                    }
+                )
+            return response
+        finally:
+            _release(lock_id)
+    return wrapper
@@ -0,0 +1,86 @@
+"""
+Stock reservation for orders.
+
+Stock is reserved when orders are placed and released when one is cancelled
+or its reservation expires unpaid (see ``states``). Reserving takes the stock
+of the whole purchase with one conditional UPDATE (``stock = stock - n WHERE
+stock >= n``) and releasing is a single relative UPDATE (``stock = stock + n``),
+never a read-modify-write, so concurrent buyers of the same product cannot
+oversell it: Postgres re-checks the condition against the committed row once
+the previous writer commits. Reserving runs last in its transaction, so the
+row locks are held only until commit.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from apps.products import cache as product_cache
+from apps.products.models import Product
+
+# Orders in these states hold stock; cancelling them gives it back
+RESERVING_STATUSES = ('pending', 'processing')
+
+
+def get_reservation_ttl():
+    return timedelta(seconds=getattr(settings, 'ORDER_RESERVATION_TTL', 900))
+
+
+class StockError(Exception):
+    """Some products of a purchase do not exist or lack stock; nothing was reserved"""
+
+    def __init__(self, unknown=(), short=None):
+        super().__init__('Cannot reserve stock')
+        self.unknown = list(unknown)  # Product ids
+        self.short = short or {}  # Product id -> {'requested': units, 'available': units}
+
+
+def reserve_stock(quantities):
+    """
+    Take stock for a whole purchase, ``{product_id: quantity}``. Must run inside
+    a transaction, after the orders are written, so the product rows stay
+    locked only until commit. Returns ``{product_id: unit price}`` as of the
+    reservation; raises StockError, and the caller's transaction must roll back
+    whatever was taken.
+    """
+    product_ids = sorted(quantities)
+    # One conditional UPDATE, never a read-modify-write; the sorted ids drive
+    # the join so overlapping purchases take their row locks in the same order
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            UPDATE {Product._meta.db_table} p SET stock = p.stock - v.quantity, updated_at = %s
+            FROM unnest(%s::uuid[], %s::integer[]) AS v(id, quantity)
+            WHERE p.id = v.id AND p.stock >= v.quantity
+            RETURNING p.id, p.price
+        """, [timezone.now(), [str(pk) for pk in product_ids], [quantities[pk] for pk in product_ids]])
+        prices = dict(cursor.fetchall())
+    for pk in prices:
+        product_cache.invalidate_product(pk)
+    missing = [pk for pk in product_ids if pk not in prices]
+    if missing:
+        raise stock_error({pk: quantities[pk] for pk in missing})
+    return prices
+
+
+def stock_error(quantities):
+    """
+    StockError for the products of ``{product_id: quantity}`` that do not exist
+    or lack stock. Reads without locking: the figures only explain a failed
+    reservation to the buyer.
+    """
+    stock = dict(Product.objects.filter(pk__in=list(quantities)).values_list('pk', 'stock'))
+    return StockError(
+        [pk for pk in sorted(quantities) if pk not in stock],
+        {
+            pk: {'requested': quantities[pk], 'available': stock[pk]}
+            for pk in sorted(quantities) if pk in stock and stock[pk] < quantities[pk]
+        },
+    )
+
+
+def release_stock(product_id, quantity):
+    """Give ``quantity`` units back to a product"""
+    Product.objects.filter(pk=product_id).update(stock=F('stock') + quantity, updated_at=timezone.now())
+    product_cache.invalidate_product(product_id)
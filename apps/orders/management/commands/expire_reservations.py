@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.orders.states import expire_reservations
+
+
+class Command(BaseCommand):
+    help = 'Cancel unpaid orders whose stock reservation has expired and release the stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--loop', type=int, metavar='SECONDS', help='Keep running, sweeping every SECONDS')
+
+    def handle(self, *args, **options):
+        while True:
+            expired = expire_reservations(batch_size=options['batch_size'])
+            self.stdout.write(f'Expired {expired} reservations')
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
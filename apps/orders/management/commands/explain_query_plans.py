@@ -0,0 +1,197 @@
+import random
+import re
+import statistics
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from apps.authentication.models import User
+from apps.orders.models import ACTIVE_STATUSES, Order
+from apps.products.models import Category, Product
+from apps.shipping.models import BuyerAddress, SellerAddress, Shipping
+from auraspotmarketplace1.partitions import add_months, create_partition, month_start
+
+# The composite and partial indexes whose effect is reported
+INDEXES = [
+    'product_category_price_idx',
+    'product_seller_created_idx',
+    'order_buyer_status_idx',
+    'order_buyer_active_idx',
+    'order_product_status_idx',
+]
+
+# Share of seeded orders per status: most of a mature table is delivered or cancelled
+STATUS_WEIGHTS = {'pending': 3, 'processing': 4, 'shipped': 8, 'delivered': 75, 'cancelled': 10}
+
+COST = re.compile(r'\s*\((cost|actual)=[^)]*\)')
+# EXPLAIN ANALYZE detail that does not help compare plans
+NOISE = ('Planning', 'Execution', 'Buffers:', 'Index Searches:', 'Heap Blocks:', 'Buckets:')
+
+
+class _Abort(Exception):
+    """Raised to roll back the seeded data (or the dropped indexes) once measured"""
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN ANALYZE the product filter and dashboard queries with and without their indexes on seeded data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000, help='Number of products to seed')
+        parser.add_argument('--orders', type=int, default=500000, help='Number of orders to seed')
+        parser.add_argument('--sellers', type=int, default=500)
+        parser.add_argument('--buyers', type=int, default=2000)
+        parser.add_argument('--runs', type=int, default=5, help='EXPLAIN ANALYZE runs per query, the median is reported')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded data instead of rolling back')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                sample = self.seed(options)
+                self.report(sample, options['runs'])
+                if not options['keep']:
+                    raise _Abort()
+        except _Abort:
+            self.stdout.write('Seeded data rolled back')
+
+    def seed(self, options):
+        rng = random.Random(42)
+        now = timezone.now()
+
+        def users(role, count):
+            User.objects.bulk_create([
+                User(email=f'bench-{role}-{i}@example.com', username=f'bench{role}{i}', password='!',
+                     role=role, first_name='Bench', last_name=role.title())
+                for i in range(count)
+            ], batch_size=5000)
+            return list(User.objects.filter(email__startswith=f'bench-{role}-').values_list('id', flat=True))
+
+        sellers = users('seller', options['sellers'])
+        buyers = users('buyer', options['buyers'])
+        categories = [Category.objects.create(name=f'Bench category {i}') for i in range(40)]
+
+        products = []
+        for i in range(options['products']):
+            products.append(Product(
+                title=f'Bench product {i}', description='', price=Decimal(rng.randint(100, 50000)) / 100,
+                category=rng.choice(categories), seller_id=rng.choice(sellers),
+                stock=rng.randint(0, 500), requires_shipping=False,
+            ))
+        Product.objects.bulk_create(products, batch_size=5000)
+        product_sellers = list(
+            Product.objects.filter(seller_id__in=sellers).values_list('id', 'seller_id', 'price')
+        )
+
+        statuses = list(STATUS_WEIGHTS)
+        weights = list(STATUS_WEIGHTS.values())
+        orders = []
+        for _ in range(options['orders']):
+            product_id, _, price = rng.choice(product_sellers)
+            orders.append(Order(
+                buyer_id=rng.choice(buyers), product_id=product_id, quantity=1, total_price=price,
+                status=rng.choices(statuses, weights)[0],
+            ))
+        Order.objects.bulk_create(orders, batch_size=5000)
+
+        address = dict(street1='1 Bench St', city='Austin', state='TX', zip_code='78701',
+                       phone='5555555555', email='bench@example.com', is_default=True)
+        seller_addresses = {
+            a.seller_id: a.pk for a in SellerAddress.objects.bulk_create(
+                [SellerAddress(seller_id=pk, name='Bench seller', **address) for pk in sellers]
+            )
+        }
+        buyer_addresses = {
+            a.buyer_id: a.pk for a in BuyerAddress.objects.bulk_create(
+                [BuyerAddress(buyer_id=pk, name='Bench buyer', **address) for pk in buyers], batch_size=5000
+            )
+        }
+        shipped = Order.objects.filter(buyer_id__in=buyers, status__in=['shipped', 'delivered']).values_list(
+            'id', 'buyer_id', 'product__seller_id', 'status'
+        )
+        Shipping.objects.bulk_create([
+            Shipping(
+                order_id=order_id, from_address_id=seller_addresses[seller_id],
+                to_address_id=buyer_addresses[buyer_id], carrier='USPS', shipping_method='Priority',
+                shipping_cost=Decimal('7.50'), status='TRANSIT' if status == 'shipped' else 'DELIVERED',
+            )
+            for order_id, buyer_id, seller_id, status in shipped.iterator()
+        ], batch_size=5000)
+
+        with connection.cursor() as cursor:
+            # Spread orders over the past year so date ordering is meaningful, into monthly
+            # partitions like real ones rather than the default partition (rolled back with the seed)
+            month = month_start(now - timedelta(days=365))
+            while month <= month_start(now):
+                create_partition(cursor, 'orders_order', month)
+                month = add_months(month, 1)
+            cursor.execute(
+                "UPDATE orders_order SET created_at = %s - random() * interval '365 days' WHERE buyer_id = ANY(%s)",
+                [now, buyers]
+            )
+            for table in ['products_product', 'orders_order', 'shipping_shipping']:
+                cursor.execute(f'ANALYZE {table}')
+        self.stdout.write(
+            f"Seeded {len(sellers)} sellers, {len(buyers)} buyers, {len(product_sellers)} products, "
+            f"{len(orders)} orders"
+        )
+        return {
+            'seller': rng.choice(sellers),
+            'buyer': rng.choice(buyers),
+            'category': rng.choice(categories),
+            'month_ago': now - timedelta(days=30),
+        }
+
+    def queries(self, sample):
+        seller, buyer, category = sample['seller'], sample['buyer'], sample['category']
+        return [
+            ('ProductFilter: category + price range, by price',
+             Product.objects.filter(category=category, price__gte=20, price__lte=40).order_by('price')[:20]),
+            ("Seller's products, newest first",
+             Product.objects.filter(seller=seller).order_by('-created_at')[:20]),
+            ('OrderViewSet: seller orders, newest first',
+             Order.objects.filter(product__seller=seller).order_by('-created_at')[:20]),
+            ('Seller dashboard: pending orders this month',
+             Order.objects.filter(product__seller=seller, status='pending', created_at__gte=sample['month_ago'])),
+            ('Buyer dashboard: orders by status (keyset page)',
+             Order.objects.filter(buyer=buyer, status='delivered').order_by('-created_at', '-id')[:20]),
+            ('Buyer dashboard: active orders (keyset page)',
+             Order.objects.filter(buyer=buyer, status__in=ACTIVE_STATUSES).order_by('-created_at', '-id')[:20]),
+            ('Seller dashboard: shipments in transit',
+             Shipping.objects.filter(order__product__seller=seller, status='TRANSIT')),
+        ]
+
+    def explain(self, queryset, runs):
+        """Median execution time and the plan (without cost estimates) of ``queryset``"""
+        timings = []
+        for _ in range(runs):
+            plan = queryset.explain(analyze=True)
+            timings.append(float(re.search(r'Execution Time: ([\d.]+) ms', plan).group(1)))
+        lines = [COST.sub('', line) for line in plan.splitlines() if not line.strip().startswith(NOISE)]
+        return statistics.median(timings), lines
+
+    def measure(self, sample, runs, without_indexes):
+        results = []
+        try:
+            with transaction.atomic():
+                if without_indexes:
+                    with connection.cursor() as cursor:
+                        for name in INDEXES:
+                            cursor.execute(f'DROP INDEX {name}')
+                for label, queryset in self.queries(sample):
+                    results.append((label, *self.explain(queryset, runs)))
+                raise _Abort()  # Restores the dropped indexes
+        except _Abort:
+            pass
+        return results
+
+    def report(self, sample, runs):
+        before = self.measure(sample, runs, without_indexes=True)
+        after = self.measure(sample, runs, without_indexes=False)
+        for (label, old_ms, old_plan), (_, new_ms, new_plan) in zip(before, after):
+            self.stdout.write(f'\n== {label}: {old_ms:.2f}ms -> {new_ms:.2f}ms')
+            self.stdout.write('-- without indexes')
+            self.stdout.write('\n'.join(old_plan))
+            self.stdout.write('-- with indexes')
+            self.stdout.write('\n'.join(new_plan))
@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from auraspotmarketplace1.partitions import add_months, archive_partitions, ensure_partitions, month_start
+
+
+class Command(BaseCommand):
+    help = (
+        'Create the coming monthly partitions of orders and shipping history and, with --archive, '
+        'archive the months past their retention to gzipped CSV files'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=settings.PARTITION_MONTHS_AHEAD)
+        parser.add_argument('--archive', action='store_true', help='Archive months older than PARTITIONED_TABLES allows')
+        parser.add_argument('--archive-dir', default=settings.PARTITION_ARCHIVE_DIR)
+        parser.add_argument(
+            '--keep-detached', action='store_true',
+            help='Only detach old months, leaving them as standalone tables instead of dumping and dropping them'
+        )
+
+    def handle(self, *args, **options):
+        # Run daily: creating a month that already exists is a no-op
+        current = month_start(timezone.now())
+        for table, retention in settings.PARTITIONED_TABLES.items():
+            for name in ensure_partitions(table, options['months_ahead']):
+                self.stdout.write(f'Created {name}')
+            if options['archive'] and retention is not None:
+                try:
+                    archived = archive_partitions(
+                        table, add_months(current, -retention), options['archive_dir'],
+                        keep_detached=options['keep_detached'],
+                    )
+                except ValueError as e:
+                    raise CommandError(str(e))
+                for name in archived:
+                    self.stdout.write(f"{'Detached' if options['keep_detached'] else 'Archived'} {name}")
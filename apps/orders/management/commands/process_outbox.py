@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.orders.outbox import process_outbox
+
+
+class Command(BaseCommand):
+    help = 'Run the follow-up work (emails, shipping history, ...) queued by order, payment and shipping changes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Messages per transaction')
+        parser.add_argument('--loop', type=float, metavar='SECONDS', help='Keep running, polling every SECONDS when idle')
+
+    def handle(self, *args, **options):
+        # Run as many of these as needed, on any hosts: workers never claim the same message
+        while True:
+            handled, failed = process_outbox(batch_size=options['batch_size'])
+            if handled or failed or not options['loop']:
+                self.stdout.write(f'Handled {handled} outbox messages, {failed} failed')
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.6 on 2026-10-17 07:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_outbox'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='orderstatushistory',
+            name='order',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='status_history', to='orders.order'),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='order',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='payment', to='orders.order'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from auraspotmarketplace1.partitions import partition_table, unpartition_table
+
+
+def partition_orders(apps, schema_editor):
+    partition_table(schema_editor, 'orders_order')
+
+
+def unpartition_orders(apps, schema_editor):
+    unpartition_table(schema_editor, 'orders_order')
+
+
+class Migration(migrations.Migration):
+    """Range-partition orders by month of created_at; the foreign keys pointing at them were dropped first"""
+
+    dependencies = [
+        ('orders', '0010_order_relations_without_constraint'),
+        ('shipping', '0002_partition_status_history'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_orders, unpartition_orders),
+    ]
@@ -0,0 +1,68 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Each of these columns leads a composite index (order_buyer_created_idx,
+# order_product_status_idx, checkout_buyer_created_idx, order_history_order_idx
+# and the unique (buyer, product) of the cart), which serves every lookup and
+# ON DELETE CASCADE scan the single-column index did. Only the indexes are
+# dropped: a plain AlterField would also drop and re-validate the foreign key
+# constraints, scanning every orders partition. On the partitioned orders
+# table, dropping the parent index drops the partitions' indexes too.
+DROP_INDEXES = """
+DROP INDEX IF EXISTS orders_order_buyer_id_26195532;
+DROP INDEX IF EXISTS orders_order_product_id_096244de;
+DROP INDEX IF EXISTS orders_checkout_buyer_id_1b6dd489;
+DROP INDEX IF EXISTS orders_cartitem_buyer_id_9d573254;
+DROP INDEX IF EXISTS orders_orderstatushistory_order_id_bf09a0e1;
+"""
+
+CREATE_INDEXES = """
+CREATE INDEX IF NOT EXISTS orders_order_buyer_id_26195532 ON orders_order (buyer_id);
+CREATE INDEX IF NOT EXISTS orders_order_product_id_096244de ON orders_order (product_id);
+CREATE INDEX IF NOT EXISTS orders_checkout_buyer_id_1b6dd489 ON orders_checkout (buyer_id);
+CREATE INDEX IF NOT EXISTS orders_cartitem_buyer_id_9d573254 ON orders_cartitem (buyer_id);
+CREATE INDEX IF NOT EXISTS orders_orderstatushistory_order_id_bf09a0e1 ON orders_orderstatushistory (order_id);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0012_payment_provider'),
+        ('products', '0015_drop_redundant_fk_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunSQL(DROP_INDEXES, CREATE_INDEXES)],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='cartitem',
+                    name='buyer',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='cart_items', to=settings.AUTH_USER_MODEL),
+                ),
+                migrations.AlterField(
+                    model_name='checkout',
+                    name='buyer',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='checkouts', to=settings.AUTH_USER_MODEL),
+                ),
+                migrations.AlterField(
+                    model_name='order',
+                    name='buyer',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='orders', to=settings.AUTH_USER_MODEL),
+                ),
+                migrations.AlterField(
+                    model_name='order',
+                    name='product',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='orders', to='products.product'),
+                ),
+                migrations.AlterField(
+                    model_name='orderstatushistory',
+                    name='order',
+                    field=models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='status_history', to='orders.order'),
+                ),
+            ],
+        ),
+    ]
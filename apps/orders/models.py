@@ -1,9 +1,47 @@
 from uuid import uuid4
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.utils import timezone
 from apps.products.models import Product
 from apps.authentication.models import User
 
+# Orders that still need the seller's or carrier's attention
+ACTIVE_STATUSES = ['pending', 'processing', 'shipped']
+
+class Checkout(models.Model):
+    """One checkout of several products: the orders it placed (one per product, fulfilled by its seller) and their total"""
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='checkouts', db_index=False)  # Led by checkout_buyer_created_idx
+    total_price = models.DecimalField(max_digits=12, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['buyer', '-created_at'], name='checkout_buyer_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Checkout {self.id} - {self.total_price}"
+
+class CartItem(models.Model):
+    """A product in a buyer's cart, until it is checked out"""
+    buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cart_items', db_index=False)  # Led by the unique (buyer, product)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    quantity = models.PositiveIntegerField(default=1)
+    added_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['added_at']
+        constraints = [
+            models.UniqueConstraint(fields=['buyer', 'product'], name='cart_item_buyer_product_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} in {self.buyer_id}'s cart"
+
 class Order(models.Model):
+    # Partitioned by month of created_at, with primary key (id, created_at) in
+    # the database (see auraspotmarketplace1.partitions); created_at never changes
     id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -13,17 +51,62 @@ class Order(models.Model):
         ('cancelled', 'Cancelled'),
     ]
 
-    buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
-    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='orders')
+    # No single-column indexes: the composite indexes below lead with buyer and product
+    buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders', db_index=False)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='orders', db_index=False)
     quantity = models.PositiveIntegerField(default=1)
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    version = models.PositiveIntegerField(default=0)  # Bumped by every status change (see states.py)
+    reserved_until = models.DateTimeField(null=True, blank=True)  # Unpaid reservation expiry; cleared once paid
+    checkout = models.ForeignKey(Checkout, on_delete=models.SET_NULL, null=True, blank=True, related_name='orders')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Buyer order history, paginated by keyset
+            models.Index(fields=['buyer', '-created_at', '-id'], name='order_buyer_created_idx'),
+            # Unpaid reservations, scanned by expire_reservations
+            models.Index(fields=['reserved_until'], condition=models.Q(status='pending'), name='order_pending_reserved_idx'),
+            # Buyer dashboard filtered by status, paginated by keyset
+            models.Index(fields=['buyer', 'status', '-created_at', '-id'], name='order_buyer_status_idx'),
+            # Buyer's active orders; completed and cancelled orders, the bulk of the table, are left out
+            models.Index(
+                fields=['buyer', '-created_at', '-id'], condition=models.Q(status__in=ACTIVE_STATUSES),
+                name='order_buyer_active_idx'
+            ),
+            # Orders of a seller's products (reached through product__seller), by status and date
+            models.Index(fields=['product', 'status', '-created_at'], name='order_product_status_idx'),
+            # Orders placed since a watermark, read in batches by refresh_related_products
+            models.Index(fields=['created_at', 'id'], name='order_created_idx'),
+        ]
+
     def __str__(self):
         return f"Order {self.id} - {self.status}"
 
+class OrderStatusHistory(models.Model):
+    """One status change of an order, written by the order state machine"""
+    # No database constraint: orders_order is partitioned (see auraspotmarketplace1.partitions)
+    order = models.ForeignKey(
+        Order, on_delete=models.CASCADE, related_name='status_history', db_constraint=False, db_index=False
+    )  # Led by order_history_order_idx
+    from_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    to_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    changed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    note = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        verbose_name_plural = 'Order status history'
+        indexes = [
+            models.Index(fields=['order', 'created_at'], name='order_history_order_idx'),
+        ]
+
+    def __str__(self):
+        return f"Order {self.order_id}: {self.from_status} -> {self.to_status}"
+
 class Payment(models.Model):
     """Payment Model for Handling Transactions with a Required Transaction ID"""
     id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
@@ -32,12 +115,17 @@ class Payment(models.Model):
         ('pending', 'Pending'),
         ('completed', 'Completed'),
         ('failed', 'Failed'),
+        ('refunded', 'Refunded'),
     ]
 
-    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='payment')
+    # No database constraint: orders_order is partitioned (see auraspotmarketplace1.partitions)
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='payment', db_constraint=False)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     payment_status = models.CharField(max_length=20, choices=PAYMENT_STATUS, default='pending')
     transaction_id = models.CharField(max_length=255, unique=True, null=True, blank=True)  # Can be null for pending, required for completed
+    provider = models.CharField(max_length=50, blank=True)  # Key of the provider in PAYMENT_PROVIDERS (see apps.payments)
+    attempt = models.PositiveSmallIntegerField(default=1)  # Bumped when a failed payment is retried
+    failure_reason = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def save(self, *args, **kwargs):
@@ -49,3 +137,50 @@ class Payment(models.Model):
     def __str__(self):
         return f"Payment {self.transaction_id or self.id} - {self.payment_status}"
 
+class IdempotencyKey(models.Model):
+    """The stored response to a request sent with an ``Idempotency-Key`` header, replayed to retries of it"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)  # sha256 of the method, path and body
+    response_status = models.PositiveSmallIntegerField()
+    response_body = models.JSONField(encoder=DjangoJSONEncoder, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            # Also the index every keyed request looks itself up by
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_key_user_key_uniq'),
+        ]
+        indexes = [
+            # Expiry: purge_idempotency_keys deletes by expires_at
+            models.Index(fields=['expires_at'], name='idempotency_key_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.user_id}): {self.response_status}"
+
+class OutboxMessage(models.Model):
+    """
+    Follow-up work (emails, shipping history, ...) of an order, payment or
+    shipping change, written in the same transaction as the change and run
+    later by the ``process_outbox`` worker (see outbox.py)
+    """
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    available_at = models.DateTimeField(null=True, default=timezone.now)  # Next attempt; null once given up on
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # What the worker claims: due messages, oldest first
+            models.Index(
+                fields=['available_at', 'id'], name='outbox_due_idx',
+                condition=models.Q(available_at__isnull=False)
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} #{self.pk} ({self.attempts} attempts)"
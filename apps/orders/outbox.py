@@ -0,0 +1,181 @@
+"""
+Transactional outbox for the follow-up work of order, payment and shipping changes.
+
+A request that changes an order only *records* what has to happen next, by
+calling ``publish`` inside its own transaction: the message is committed or
+rolled back together with the change, so no email is sent for an order that
+was never saved and none is lost when the process dies after the commit. The
+request's cost no longer grows with each side effect added.
+
+``process_outbox`` workers (any number, on any hosts) claim due messages with
+``SELECT ... FOR UPDATE SKIP LOCKED``, so each is handled by one worker at a
+time, and dispatch them to the handlers registered with ``@handler(topic)``.
+A handled message is deleted. A failing handler's writes are rolled back and
+its message is retried with exponential backoff; after
+``OUTBOX_MAX_ATTEMPTS`` it is kept, with its last error, for inspection.
+Delivery is at least once: handlers must tolerate running twice.
+
+A batch runs its handlers in one transaction, holding the claim on every
+message until the last one is done, which suits short handlers only. Long
+jobs (e.g. reconciling a settlement file) are registered with
+``isolated=True``: the batch leases such a message instead, hiding it from
+other workers for ``OUTBOX_LEASE`` seconds, and once the batch has committed
+its handler runs in a transaction of its own. A worker that dies mid-job
+leaves the lease to expire, and the message is run again.
+"""
+import logging
+import random
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}  # Topic -> handler(payload)
+ISOLATED_TOPICS = set()  # Topics whose handlers run outside the batch transaction
+
+
+def handler(topic, isolated=False):
+    """
+    Register the decorated function to run, with the message payload, for
+    every message of ``topic``; ``isolated`` runs it in its own transaction,
+    after the batch that claimed it (for handlers that take seconds or more).
+    """
+    def register(func):
+        if topic in HANDLERS:
+            raise ValueError(f"An outbox handler for {topic} is already registered")
+        HANDLERS[topic] = func
+        if isolated:
+            ISOLATED_TOPICS.add(topic)
+        return func
+    return register
+
+
+def get_max_attempts():
+    return getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 8)
+
+
+def get_lease():
+    return timedelta(seconds=getattr(settings, 'OUTBOX_LEASE', 15 * 60))
+
+
+def retry_delay(attempts):
+    """Seconds before attempt ``attempts + 1``: doubling from OUTBOX_RETRY_DELAY up to OUTBOX_MAX_RETRY_DELAY, with jitter"""
+    base = getattr(settings, 'OUTBOX_RETRY_DELAY', 30)
+    cap = getattr(settings, 'OUTBOX_MAX_RETRY_DELAY', 60 * 60)
+    delay = min(cap, base * 2 ** (attempts - 1))
+    # Jitter, so messages that failed together (e.g. SMTP down) are not retried together
+    return delay * random.uniform(0.5, 1)
+
+
+def publish(topic, payload):
+    """Queue ``payload`` for the handler of ``topic`` once the current transaction commits"""
+    return OutboxMessage.objects.create(topic=topic, payload=payload)
+
+
+def publish_many(topic, payloads):
+    """``publish`` for many payloads with one INSERT"""
+    return OutboxMessage.objects.bulk_create([OutboxMessage(topic=topic, payload=payload) for payload in payloads])
+
+
+def dispatch(message):
+    func = HANDLERS.get(message.topic)
+    if func is None:
+        raise LookupError(f"No outbox handler for {message.topic}")
+    func(message.payload)
+
+
+def record_failure(message, error, now):
+    """Schedule the retry of a failed message, or give up on it after OUTBOX_MAX_ATTEMPTS"""
+    attempts = message.attempts + 1
+    if attempts >= get_max_attempts():
+        logger.error(f"Giving up on outbox message {message.pk} ({message.topic}) after {attempts} attempts:\n{error}")
+        available_at = None
+    else:
+        logger.warning(f"Outbox message {message.pk} ({message.topic}) failed, retrying:\n{error}")
+        available_at = now + timedelta(seconds=retry_delay(attempts))
+    OutboxMessage.objects.filter(pk=message.pk).update(
+        attempts=F('attempts') + 1, available_at=available_at, last_error=error[-10000:]
+    )
+
+
+def run_isolated(message, leased_until):
+    """
+    Run a leased message's handler in its own transaction. Returns True if it
+    was handled, False if it failed and None if the lease was lost meanwhile
+    (another worker took the message over after it expired).
+    """
+    now = timezone.now()
+    # Renew the lease, unless another worker has taken the message over meanwhile
+    renewed = OutboxMessage.objects.filter(pk=message.pk, available_at=leased_until).update(
+        available_at=now + get_lease()
+    )
+    if not renewed:
+        return None
+    try:
+        with transaction.atomic():
+            dispatch(message)
+            OutboxMessage.objects.filter(pk=message.pk).delete()
+    except Exception:
+        record_failure(message, traceback.format_exc(), timezone.now())
+        return False
+    return True
+
+
+def process_batch(batch_size=100):
+    """
+    Claim up to ``batch_size`` due messages, skipping those claimed by other
+    workers, and run their handlers in one transaction; then run the isolated
+    ones, each in its own. Returns (handled, failed).
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        messages = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(available_at__lte=now).order_by('available_at', 'id')[:batch_size]
+        )
+        handled, failed, isolated = [], [], []
+        for message in messages:
+            if message.topic in ISOLATED_TOPICS:
+                isolated.append(message)
+                continue
+            try:
+                # Savepoint: a failing handler's writes are undone without losing the batch
+                with transaction.atomic():
+                    dispatch(message)
+            except Exception:
+                failed.append((message, traceback.format_exc()))
+            else:
+                handled.append(message.pk)
+
+        if handled:
+            OutboxMessage.objects.filter(pk__in=handled).delete()
+        for message, error in failed:
+            record_failure(message, error, now)
+        leased_until = now + get_lease()
+        if isolated:
+            OutboxMessage.objects.filter(pk__in=[message.pk for message in isolated]).update(available_at=leased_until)
+
+    handled, failed = len(handled), len(failed)
+    for message in isolated:
+        outcome = run_isolated(message, leased_until)
+        handled += outcome is True
+        failed += outcome is False
+    return handled, failed
+
+
+def process_outbox(batch_size=100):
+    """Work through every due message, batch by batch. Returns (handled, failed)."""
+    handled = failed = 0
+    while True:
+        batch_handled, batch_failed = process_batch(batch_size)
+        handled += batch_handled
+        failed += batch_failed
+        if batch_handled + batch_failed < batch_size:
+            return handled, failed
@@ -1,21 +1,35 @@
+from collections import defaultdict
+
 from rest_framework import serializers
-from .models import Order, Payment
+from .models import CartItem, Checkout, Order, Payment
+from .checkout import MAX_CHECKOUT_LINES, place_orders
+from .inventory import StockError
+from auraspotmarketplace1.fieldsets import SparseFieldsetMixin
 
-class OrderSerializer(serializers.ModelSerializer):
-    """Serializer for Creating and Viewing Orders"""
+class OrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """Serializer for Creating and Viewing Orders (supports ?fields= and ?expand=product)"""
     id = serializers.UUIDField(read_only=True)  # Ensure UUID is read-only
 
     class Meta:
         model = Order
         fields = '__all__'
-        read_only_fields = ('buyer', 'total_price', 'status')
+        read_only_fields = ('buyer', 'total_price', 'status', 'version', 'reserved_until', 'checkout')
+        expandable_fields = {'product': 'apps.products.serializers.ProductSerializer'}
+
+    def validate_quantity(self, value):
+        if value < 1:
+            raise serializers.ValidationError("Quantity must be at least 1")
+        return value
 
     def create(self, validated_data):
-        """Ensure buyer is the logged-in user and calculate total price"""
+        """Place a one-product order for the logged-in user: price it and reserve the stock"""
         request = self.context['request']
-        validated_data['buyer'] = request.user
-        validated_data['total_price'] = validated_data['product'].price * validated_data['quantity']
-        return super().create(validated_data)
+        product = validated_data['product']
+        try:
+            _, orders = place_orders(request.user, {product.pk: validated_data.get('quantity', 1)})
+        except StockError:
+            raise serializers.ValidationError({'quantity': "Not enough stock for this product"})
+        return orders[0]
 
 class PaymentSerializer(serializers.ModelSerializer):
     """Serializer for Managing Payments"""
@@ -24,4 +38,53 @@ class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
         fields = '__all__'
-        read_only_fields = ('payment_status', 'transaction_id')
+        read_only_fields = ('payment_status', 'transaction_id', 'provider', 'attempt', 'failure_reason')
+
+
+class CartItemSerializer(serializers.ModelSerializer):
+    """A cart line with the product's current price (cart prices are not locked in until checkout)"""
+    title = serializers.CharField(source='product.title', read_only=True)
+    unit_price = serializers.DecimalField(source='product.price', max_digits=10, decimal_places=2, read_only=True)
+    stock = serializers.IntegerField(source='product.stock', read_only=True)
+    line_total = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CartItem
+        fields = ['product', 'title', 'unit_price', 'stock', 'quantity', 'line_total', 'added_at']
+        read_only_fields = ('added_at',)
+
+    def validate_quantity(self, value):
+        if value < 1:
+            raise serializers.ValidationError("Quantity must be at least 1")
+        return value
+
+    def get_line_total(self, obj):
+        return str(obj.product.price * obj.quantity)
+
+class CheckoutLineSerializer(serializers.Serializer):
+    product = serializers.UUIDField()  # Checked with the stock reservation, in one query for all lines
+    quantity = serializers.IntegerField(min_value=1)
+
+class CheckoutSerializer(serializers.ModelSerializer):
+    """
+    A checkout and its orders. Created from ``items`` when given, otherwise
+    from the buyer's cart, which is then emptied.
+    """
+    id = serializers.UUIDField(read_only=True)
+    orders = OrderSerializer(many=True, read_only=True)
+    items = CheckoutLineSerializer(many=True, write_only=True, required=False)
+
+    class Meta:
+        model = Checkout
+        fields = ['id', 'buyer', 'total_price', 'created_at', 'orders', 'items']
+        read_only_fields = ('buyer', 'total_price', 'created_at')
+
+    def validate_items(self, value):
+        quantities = defaultdict(int)
+        for line in value:
+            quantities[line['product']] += line['quantity']
+        if not quantities:
+            raise serializers.ValidationError("At least one item is required")
+        if len(quantities) > MAX_CHECKOUT_LINES:
+            raise serializers.ValidationError(f"At most {MAX_CHECKOUT_LINES} different products per checkout")
+        return dict(quantities)
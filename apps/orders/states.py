@@ -0,0 +1,189 @@
+"""
+Order state machine.
+
+``TRANSITIONS`` lists the moves an order can make. Every move is a conditional
+UPDATE, ``SET status = <to>, version = version + 1 ... WHERE status = <from>
+AND version = <v>``, that writes only the columns it changes, never a
+``save()`` of the whole row. Two concurrent changes of an order therefore
+cannot silently overwrite each other: the second matches no row and is
+reported as a conflict. Each move writes an ``OrderStatusHistory`` row and an
+``order.status_changed`` outbox message, and cancelling an order that still
+holds stock gives the stock back, all in the same transaction.
+"""
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .inventory import RESERVING_STATUSES, release_stock
+from .models import Order, OrderStatusHistory
+from .outbox import publish, publish_many
+
+TRANSITIONS = {
+    'pending': ('processing', 'cancelled'),
+    'processing': ('shipped', 'cancelled'),
+    'shipped': ('delivered', 'cancelled'),  # Goods lost in transit; they keep their stock
+    'delivered': (),
+    'cancelled': (),  # Its stock is already released, so it cannot be reopened
+}
+
+MAX_BULK_ORDERS = 1000
+
+
+class TransitionError(Exception):
+    """The move is not allowed, or (``conflict``) the order changed since it was read"""
+
+    def __init__(self, message, conflict=False):
+        super().__init__(message)
+        self.conflict = conflict
+
+
+def can_transition(from_status, to_status):
+    return to_status in TRANSITIONS.get(from_status, ())
+
+
+def _changes(to_status, now):
+    """Columns a move to ``to_status`` writes"""
+    fields = {'status': to_status, 'updated_at': now}
+    if to_status != 'pending':
+        fields['reserved_until'] = None  # Paid, shipped or cancelled: the reservation no longer expires
+    return fields
+
+
+def status_changed(order_id, from_status, to_status, note):
+    """Payload of the ``order.status_changed`` outbox message"""
+    return {'order': str(order_id), 'from': from_status, 'to': to_status, 'note': note}
+
+
+def transition(order, to_status, version=None, user=None, note=''):
+    """
+    Move ``order`` to ``to_status`` provided it is still in the status it was
+    read with and at ``version`` (default: the version it was read with).
+    Updates ``order`` in place; raises TransitionError.
+    """
+    from_status = order.status
+    if not can_transition(from_status, to_status):
+        raise TransitionError(f"Cannot change an order from {from_status} to {to_status}")
+    expected = order.version if version is None else version
+    now = timezone.now()
+    changes = _changes(to_status, now)
+
+    with transaction.atomic():
+        moved = Order.objects.filter(pk=order.pk, status=from_status, version=expected).update(
+            version=F('version') + 1, **changes
+        )
+        if not moved:
+            raise TransitionError("The order was changed meanwhile; reload it and try again", conflict=True)
+        if to_status == 'cancelled' and from_status in RESERVING_STATUSES:
+            release_stock(order.product_id, order.quantity)
+        OrderStatusHistory.objects.create(
+            order_id=order.pk, from_status=from_status, to_status=to_status, changed_by=user, note=note
+        )
+        publish('order.status_changed', status_changed(order.pk, from_status, to_status, note))
+
+    for field, value in changes.items():
+        setattr(order, field, value)
+    order.version = expected + 1
+
+
+def bulk_transition(orders, to_status, user=None, note='', skip_locked=False, limit=None):
+    """
+    Move every order of the queryset ``orders`` whose status allows it to
+    ``to_status``, with one UPDATE (which also locks the rows, in primary-key
+    order, and reads their previous status) and one bulk INSERT of history
+    rows. Other orders are left alone. Returns the ids of the orders moved.
+    """
+    sources = [status for status, targets in TRANSITIONS.items() if to_status in targets]
+    candidates = (
+        orders.filter(status__in=sources).order_by('pk')
+        .select_for_update(of=('self',), skip_locked=skip_locked).values('id', 'status')
+    )
+    if limit is not None:
+        candidates = candidates[:limit]
+    candidate_sql, candidate_params = candidates.query.sql_with_params()
+    now = timezone.now()
+    changes = _changes(to_status, now)
+    assignments = ', '.join(f'{field} = %s' for field in changes)
+    table = Order._meta.db_table
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                UPDATE {table} o SET {assignments}, version = o.version + 1
+                FROM ({candidate_sql}) AS old
+                WHERE o.id = old.id
+                RETURNING o.id, old.status, o.product_id, o.quantity
+            """, [*changes.values(), *candidate_params])
+            moved = cursor.fetchall()
+        if not moved:
+            return []
+
+        OrderStatusHistory.objects.bulk_create([
+            OrderStatusHistory(
+                order_id=order_id, from_status=from_status, to_status=to_status, changed_by=user, note=note
+            )
+            for order_id, from_status, _, _ in moved
+        ])
+        publish_many('order.status_changed', [
+            status_changed(order_id, from_status, to_status, note) for order_id, from_status, _, _ in moved
+        ])
+        if to_status == 'cancelled':
+            released = defaultdict(int)
+            for _, from_status, product_id, quantity in moved:
+                if from_status in RESERVING_STATUSES:
+                    released[product_id] += quantity
+            # Fixed order so two bulk cancels can never deadlock on product rows
+            for product_id in sorted(released):
+                release_stock(product_id, released[product_id])
+    return [order_id for order_id, _, _, _ in moved]
+
+
+def cancel_order(order, user=None, note=''):
+    """
+    Cancel an order that still holds stock, releasing it. Returns False if the
+    order no longer holds stock or changed meanwhile, so stock is released
+    exactly once even under concurrent calls.
+    """
+    if order.status not in RESERVING_STATUSES:
+        return False
+    try:
+        transition(order, 'cancelled', user=user, note=note)
+    except TransitionError:
+        return False
+    return True
+
+
+def confirm_reservation(order, user=None):
+    """
+    Turn an unpaid reservation into a sale so it no longer expires. Returns
+    False if the order is not awaiting payment (e.g. it expired, was cancelled
+    or was paid by a concurrent request).
+    """
+    if order.status == 'processing':
+        return True
+    if order.status != 'pending':
+        return False
+    try:
+        transition(order, 'processing', user=user)
+    except TransitionError:
+        return False
+    return True
+
+
+def expire_reservations(now=None, batch_size=500):
+    """
+    Cancel unpaid orders whose reservation has expired and release their stock,
+    one batch per transaction. Rows locked by a concurrent payment or cancel
+    are skipped and picked up on the next run. Returns the number expired.
+    """
+    now = now or timezone.now()
+    expired = 0
+    while True:
+        moved = bulk_transition(
+            Order.objects.filter(status='pending', reserved_until__lt=now), 'cancelled',
+            note='Reservation expired', skip_locked=True, limit=batch_size,
+        )
+        expired += len(moved)
+        if len(moved) < batch_size:
+            return expired
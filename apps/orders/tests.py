@@ -1,3 +1,883 @@
-from django.test import TestCase
+import csv
+import gzip
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
+from types import SimpleNamespace
+from uuid import uuid4
 
-# Create your tests here.
+from django.core import mail
+from django.db import connections, transaction
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient, APITestCase
+
+from apps.authentication.models import User
+from apps.products.models import Category, Product
+from apps.shipping.models import BuyerAddress, SellerAddress, Shipping, ShippingStatusHistory
+from auraspotmarketplace1.partitions import (
+    add_months, archive_partitions, create_partition, ensure_partitions, list_partitions, month_start,
+    partition_name,
+)
+from auraspotmarketplace1.testing import QueryCountTestMixin
+from . import outbox
+from .outbox import process_outbox, publish
+from .states import expire_reservations, transition
+from .models import CartItem, Checkout, IdempotencyKey, Order, OrderStatusHistory, OutboxMessage, Payment
+
+
+class OrderQueryCountTests(QueryCountTestMixin, APITestCase):
+    """Order and payment listings must not issue per-row queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='pass',
+            role='seller', first_name='Sam', last_name='Seller'
+        )
+        cls.buyer = User.objects.create_user(
+            email='buyer@example.com', username='buyer', password='pass',
+            role='buyer', first_name='Bea', last_name='Buyer'
+        )
+        cls.admin = User.objects.create_user(
+            email='admin@example.com', username='admin', password='pass',
+            role='admin', first_name='Ada', last_name='Admin'
+        )
+        category = Category.objects.create(name='Fashion')
+        for i in range(25):
+            product = Product.objects.create(
+                title=f'Jacket {i}', description='Leather jacket', price=Decimal('80.00'),
+                category=category, seller=cls.seller, stock=5, requires_shipping=False
+            )
+            order = Order.objects.create(
+                buyer=cls.buyer, product=product, quantity=1, total_price=product.price
+            )
+            Payment.objects.create(
+                order=order, amount=order.total_price,
+                payment_status='completed', transaction_id=str(uuid4())
+            )
+
+    def test_order_list_as_buyer(self):
+        self.client.force_authenticate(self.buyer)
+        self.assertListQueryCount('/orders/orders/', 2)
+
+    def test_order_list_as_seller(self):
+        self.client.force_authenticate(self.seller)
+        self.assertListQueryCount('/orders/orders/', 2)
+
+    def test_order_list_as_admin(self):
+        self.client.force_authenticate(self.admin)
+        self.assertListQueryCount('/orders/orders/', 2)
+
+    def test_payment_list_as_buyer(self):
+        self.client.force_authenticate(self.buyer)
+        self.assertListQueryCount('/orders/payments/', 2)
+
+    def test_order_list_expand_product(self):
+        # COUNT, page of orders joined with product, product images prefetch
+        self.client.force_authenticate(self.buyer)
+        params = {'fields': 'id,status,product', 'expand': 'product'}
+        self.assertListQueryCount('/orders/orders/', 3, params)
+        order = self.client.get('/orders/orders/', params).data['results'][0]
+        self.assertEqual(set(order), {'id', 'status', 'product'})
+        self.assertEqual(order['product']['title'], 'Jacket 24')
+
+    def test_seller_dashboard_orders(self):
+        # COUNT, page of orders joined with product, buyer, payment and shipping
+        self.client.force_authenticate(self.seller)
+        self.assertListQueryCount('/sellers/dashboard/seller/orders/', 2)
+        order = self.client.get('/sellers/dashboard/seller/orders/').data['results'][0]
+        self.assertEqual(order['payment_status'], 'completed')
+        self.assertIsNone(order['product']['image'])
+
+    def test_seller_dashboard_orders_sparse(self):
+        self.client.force_authenticate(self.seller)
+        self.assertListQueryCount('/sellers/dashboard/seller/orders/', 2, {'fields': 'id,status,total_price'})
+        order = self.client.get('/sellers/dashboard/seller/orders/', {'fields': 'id,status'}).data['results'][0]
+        self.assertEqual(set(order), {'id', 'status'})
+
+    def test_seller_dashboard_products_sparse(self):
+        # COUNT, page of products with their order totals
+        self.client.force_authenticate(self.seller)
+        params = {'fields': 'id,title,total_orders,image'}
+        self.assertListQueryCount('/sellers/dashboard/seller/products/', 2, params)
+        product = self.client.get('/sellers/dashboard/seller/products/', params).data['results'][0]
+        self.assertEqual(set(product), {'id', 'title', 'total_orders', 'image'})
+        self.assertEqual(product['total_orders'], 1)
+
+    def test_buyer_dashboard_orders(self):
+        # COUNT, page of orders joined with product, payment and shipping
+        self.client.force_authenticate(self.buyer)
+        for params in [{}, {'fields': 'id,product,tracking_number'}]:
+            with self.assertNumQueries(2):
+                response = self.client.get('/buyers/dashboard/buyer/orders/', params)
+            self.assertEqual(response.status_code, 200)
+
+
+class StockReservationTests(APITestCase):
+    """Orders reserve stock on creation and give it back exactly once"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='pass',
+            role='seller', first_name='Sam', last_name='Seller'
+        )
+        cls.buyer = User.objects.create_user(
+            email='buyer@example.com', username='buyer', password='pass',
+            role='buyer', first_name='Bea', last_name='Buyer'
+        )
+        cls.category = Category.objects.create(name='Fashion')
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            title='Jacket', description='Leather jacket', price=Decimal('80.00'),
+            category=self.category, seller=self.seller, stock=3, requires_shipping=False
+        )
+        self.client.force_authenticate(self.buyer)
+
+    def place_order(self, quantity):
+        return self.client.post('/orders/orders/', {'product': str(self.product.pk), 'quantity': quantity})
+
+    def stock(self):
+        self.product.refresh_from_db(fields=['stock'])
+        return self.product.stock
+
+    def test_order_reserves_stock(self):
+        response = self.place_order(2)
+        self.assertEqual(response.status_code, 201)
+        self.assertIsNotNone(response.data['reserved_until'])
+        self.assertEqual(self.stock(), 1)
+
+    def test_order_beyond_stock_is_rejected(self):
+        response = self.place_order(4)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.stock(), 3)
+        self.assertFalse(Order.objects.exists())
+
+    def test_cancel_releases_stock_once(self):
+        order_id = self.place_order(2).data['id']
+        self.assertEqual(self.client.post(f'/orders/orders/{order_id}/cancel/').status_code, 200)
+        self.assertEqual(self.client.post(f'/orders/orders/{order_id}/cancel/').status_code, 400)
+        self.assertEqual(self.stock(), 3)
+
+    def test_seller_cancel_releases_stock(self):
+        order_id = self.place_order(2).data['id']
+        self.client.force_authenticate(self.seller)
+        url = f'/orders/orders/{order_id}/update_status/'
+        self.assertEqual(self.client.post(url, {'status': 'cancelled'}).status_code, 200)
+        self.assertEqual(self.stock(), 3)
+        self.assertEqual(self.client.post(url, {'status': 'processing'}).status_code, 400)
+
+    def test_unpaid_reservation_expires(self):
+        order_id = self.place_order(2).data['id']
+        self.assertEqual(expire_reservations(), 0)
+        self.assertEqual(expire_reservations(now=timezone.now() + timedelta(days=1)), 1)
+        self.assertEqual(Order.objects.get(pk=order_id).status, 'cancelled')
+        self.assertEqual(self.stock(), 3)
+
+        response = self.client.post('/orders/payments/', {'order': order_id})
+        self.assertEqual(response.status_code, 400)
+
+    def test_payment_keeps_reservation(self):
+        order_id = self.place_order(2).data['id']
+        self.assertEqual(self.client.post('/orders/payments/', {'order': order_id}).status_code, 202)
+        self.assertEqual(expire_reservations(now=timezone.now() + timedelta(minutes=20)), 0)  # Payment pending
+        process_outbox()
+        self.assertEqual(expire_reservations(now=timezone.now() + timedelta(days=1)), 0)
+        self.assertEqual(Order.objects.get(pk=order_id).status, 'processing')
+        self.assertEqual(self.stock(), 1)
+
+
+class CheckoutTests(APITestCase):
+    """A cart checks out into one order per product in a single transaction"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='pass',
+            role='seller', first_name='Sam', last_name='Seller'
+        )
+        cls.buyer = User.objects.create_user(
+            email='buyer@example.com', username='buyer', password='pass',
+            role='buyer', first_name='Bea', last_name='Buyer'
+        )
+        cls.category = Category.objects.create(name='Fashion')
+
+    def setUp(self):
+        self.products = [
+            Product.objects.create(
+                title=f'Jacket {i}', description='Leather jacket', price=Decimal('80.00') + i,
+                category=self.category, seller=self.seller, stock=3, requires_shipping=False
+            )
+            for i in range(5)
+        ]
+        self.client.force_authenticate(self.buyer)
+
+    def add_to_cart(self, product, quantity=1):
+        return self.client.post('/orders/cart/items/', {'product': str(product.pk), 'quantity': quantity})
+
+    def stock(self):
+        return sorted(Product.objects.values_list('title', 'stock'))
+
+    def test_cart_items_are_upserted_and_removed(self):
+        self.assertEqual(self.add_to_cart(self.products[0]).status_code, 201)
+        self.assertEqual(self.add_to_cart(self.products[0], 2).status_code, 200)
+        self.add_to_cart(self.products[1])
+        response = self.client.get('/orders/cart/')
+        self.assertEqual([item['quantity'] for item in response.data['items']], [2, 1])
+        self.assertEqual(response.data['subtotal'], '241.00')
+
+        url = f'/orders/cart/items/{self.products[1].pk}/'
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.assertEqual(CartItem.objects.count(), 1)
+
+    def test_checkout_cart(self):
+        for product in self.products[:3]:
+            self.add_to_cart(product, 2)
+        response = self.client.post('/orders/checkouts/', {}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total_price'], '486.00')
+        self.assertEqual(len(response.data['orders']), 3)
+        self.assertEqual({order['status'] for order in response.data['orders']}, {'pending'})
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual([stock for _, stock in self.stock()], [1, 1, 1, 3, 3])
+
+        response = self.client.post('/orders/checkouts/', {}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_checkout_queries_do_not_grow_with_items(self):
+        def checkout(products):
+            items = [{'product': str(product.pk), 'quantity': 1} for product in products]
+            with CaptureQueriesContext(connections['default']) as queries:
+                response = self.client.post('/orders/checkouts/', {'items': items}, format='json')
+            self.assertEqual(response.status_code, 201)
+            return len(queries)
+
+        self.assertEqual(checkout(self.products[:1]), checkout(self.products[1:]))
+
+    def test_checkout_is_all_or_nothing(self):
+        items = [
+            {'product': str(self.products[0].pk), 'quantity': 1},
+            {'product': str(self.products[1].pk), 'quantity': 2},
+            {'product': str(self.products[1].pk), 'quantity': 2},  # Merged: 4 > 3 in stock
+            {'product': str(uuid4()), 'quantity': 1},
+        ]
+        response = self.client.post('/orders/checkouts/', {'items': items}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data['insufficient_stock'], {str(self.products[1].pk): {'requested': 4, 'available': 3}}
+        )
+        self.assertEqual(response.data['unknown_products'], [items[3]['product']])
+        self.assertEqual({stock for _, stock in self.stock()}, {3})
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Checkout.objects.exists())
+
+    def test_failed_reservation_rolls_back_stock_taken(self):
+        items = [
+            {'product': str(self.products[0].pk), 'quantity': 2},
+            {'product': str(self.products[1].pk), 'quantity': 4},
+        ]
+        response = self.client.post('/orders/checkouts/', {'items': items}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data['insufficient_stock'], {str(self.products[1].pk): {'requested': 4, 'available': 3}}
+        )
+        self.assertEqual({stock for _, stock in self.stock()}, {3})
+        self.assertFalse(Order.objects.exists())
+
+    def test_stock_is_reserved_after_the_orders_are_written(self):
+        items = [{'product': str(product.pk), 'quantity': 1} for product in self.products[:2]]
+        with CaptureQueriesContext(connections['default']) as queries:
+            self.client.post('/orders/checkouts/', {'items': items}, format='json')
+        statements = [query['sql'].strip() for query in queries.captured_queries]
+        reserve = next(i for i, sql in enumerate(statements) if sql.startswith(f'UPDATE {Product._meta.db_table}'))
+        inserts = [i for i, sql in enumerate(statements) if sql.startswith('INSERT INTO "orders_')]
+        self.assertLess(max(inserts), reserve)
+        self.assertNotIn('FOR UPDATE', ' '.join(statements[:reserve]))
+
+    def test_price_change_before_the_reservation_reprices_orders(self):
+        from . import checkout
+
+        def reserve_after_price_change(quantities):
+            Product.objects.filter(pk=self.products[0].pk).update(price=Decimal('50.00'))
+            return reserve_stock(quantities)
+
+        reserve_stock = checkout.reserve_stock
+        items = [{'product': str(product.pk), 'quantity': 2} for product in self.products[:2]]
+        with mock.patch.object(checkout, 'reserve_stock', reserve_after_price_change):
+            response = self.client.post('/orders/checkouts/', {'items': items}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['total_price'], '262.00')
+        self.assertEqual(
+            sorted(Order.objects.values_list('total_price', flat=True)), [Decimal('100.00'), Decimal('162.00')]
+        )
+
+    def test_pay_checkout_at_once(self):
+        items = [{'product': str(product.pk), 'quantity': 1} for product in self.products[:3]]
+        checkout = self.client.post('/orders/checkouts/', {'items': items}, format='json').data
+        cancelled = checkout['orders'][0]['id']
+        self.client.post(f'/orders/orders/{cancelled}/cancel/')
+
+        response = self.client.post(f'/orders/checkouts/{checkout["id"]}/pay/')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(len(response.data['payments']), 2)
+        self.assertEqual(response.data['amount'], str(sum(Decimal(order['total_price']) for order in checkout['orders'][1:])))
+        self.assertEqual(self.client.post(f'/orders/checkouts/{checkout["id"]}/pay/').status_code, 400)  # Pending
+        process_outbox()
+        self.assertEqual(
+            sorted(Order.objects.values_list('status', flat=True)), ['cancelled', 'processing', 'processing']
+        )
+        self.assertEqual(expire_reservations(now=timezone.now() + timedelta(days=1)), 0)
+        self.assertEqual(self.client.post(f'/orders/checkouts/{checkout["id"]}/pay/').status_code, 400)
+
+
+class OrderStateMachineTests(APITestCase):
+    """Status changes are conditional on status and version, recorded, and can be applied in bulk"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='pass',
+            role='seller', first_name='Sam', last_name='Seller'
+        )
+        cls.buyer = User.objects.create_user(
+            email='buyer@example.com', username='buyer', password='pass',
+            role='buyer', first_name='Bea', last_name='Buyer'
+        )
+        cls.category = Category.objects.create(name='Fashion')
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            title='Jacket', description='Leather jacket', price=Decimal('80.00'),
+            category=self.category, seller=self.seller, stock=100, requires_shipping=False
+        )
+
+    def make_orders(self, count, status='processing'):
+        return Order.objects.bulk_create([
+            Order(buyer=self.buyer, product=self.product, quantity=1, total_price=self.product.price, status=status)
+            for _ in range(count)
+        ])
+
+    def test_stale_version_is_a_conflict(self):
+        order = self.make_orders(1)[0]
+        self.client.force_authenticate(self.seller)
+        url = f'/orders/orders/{order.pk}/update_status/'
+        response = self.client.post(url, {'status': 'shipped', 'version': 0})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['version'], 1)
+
+        # A second seller acting on what they read before the first change
+        response = self.client.post(url, {'status': 'cancelled', 'version': 0})
+        self.assertEqual(response.status_code, 409)
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.version), ('shipped', 1))
+
+    def test_update_cannot_overwrite_a_concurrent_status_change(self):
+        order = self.make_orders(1, status='pending')[0]
+        self.client.force_authenticate(self.buyer)
+        read = self.client.get(f'/orders/orders/{order.pk}/').data
+        transition(order, 'processing')
+
+        for send in (self.client.put, self.client.patch):
+            response = send(f'/orders/orders/{order.pk}/', {**read, 'status': 'pending'}, format='json')
+            self.assertEqual(response.status_code, 405)
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.version), ('processing', 1))
+
+    def test_invalid_transition_is_rejected(self):
+        order = self.make_orders(1, status='delivered')[0]
+        self.client.force_authenticate(self.seller)
+        response = self.client.post(f'/orders/orders/{order.pk}/update_status/', {'status': 'pending'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(OrderStatusHistory.objects.exists())
+
+    def test_cancel_is_recorded(self):
+        order = self.make_orders(1, status='pending')[0]
+        self.client.force_authenticate(self.buyer)
+        self.assertEqual(self.client.post(f'/orders/orders/{order.pk}/cancel/').status_code, 200)
+        history = order.status_history.get()
+        self.assertEqual((history.from_status, history.to_status, history.changed_by), ('pending', 'cancelled', self.buyer))
+        self.product.refresh_from_db(fields=['stock'])
+        self.assertEqual(self.product.stock, 101)
+
+    def test_bulk_ship(self):
+        orders = self.make_orders(30)
+        delivered = self.make_orders(1, status='delivered')[0]
+        other_seller = User.objects.create_user(
+            email='other@example.com', username='other', password='pass', role='seller'
+        )
+        self.client.force_authenticate(other_seller)
+        url = '/sellers/dashboard/seller/bulk_update_order_status/'
+        order_ids = [str(order.pk) for order in orders] + [str(delivered.pk)]
+        response = self.client.post(url, {'order_ids': order_ids, 'status': 'shipped'}, format='json')
+        self.assertEqual(response.data['updated'], [])
+
+        self.client.force_authenticate(self.seller)
+        # Savepoint, bulk UPDATE, history INSERT, outbox INSERT, release: the same whatever the number of orders
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.client.post(url, {'order_ids': order_ids, 'status': 'shipped'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 5)
+        self.assertEqual(response.data['skipped'], [str(delivered.pk)])
+        self.assertEqual(len(response.data['updated']), 30)
+        self.assertEqual(Order.objects.filter(status='shipped', version=1).count(), 30)
+        self.assertEqual(OrderStatusHistory.objects.filter(from_status='processing', to_status='shipped').count(), 30)
+
+    def test_admin_updates_any_sellers_orders(self):
+        first, second = self.make_orders(2)
+        admin = User.objects.create_user(email='admin@example.com', username='admin', password='pass', role='admin')
+        self.client.force_authenticate(admin)
+        response = self.client.post(
+            '/sellers/dashboard/seller/bulk_update_order_status/',
+            {'order_ids': [str(first.pk)], 'status': 'shipped'}, format='json'
+        )
+        self.assertEqual(response.data['updated'], [str(first.pk)])
+        response = self.client.post(
+            f'/sellers/dashboard/seller/{second.pk}/update_order_status/', {'status': 'shipped'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(Order.objects.values_list('status', flat=True)), {'shipped'})
+
+
+class OutboxTests(APITestCase):
+    """Side effects are queued with the change and run by the worker, with retries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='pass',
+            role='seller', first_name='Sam', last_name='Seller'
+        )
+        cls.buyer = User.objects.create_user(
+            email='buyer@example.com', username='buyer', password='pass',
+            role='buyer', first_name='Bea', last_name='Buyer'
+        )
+        category = Category.objects.create(name='Fashion')
+        cls.product = Product.objects.create(
+            title='Jacket', description='Leather jacket', price=Decimal('80.00'),
+            category=category, seller=cls.seller, stock=10, requires_shipping=False
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.buyer)
+
+    def test_payment_and_shipping_are_emailed_by_the_worker(self):
+        order_id = self.client.post('/orders/orders/', {'product': str(self.product.pk), 'quantity': 1}).data['id']
+        self.client.post('/orders/payments/', {'order': order_id})
+        self.assertEqual(list(OutboxMessage.objects.values_list('topic', flat=True)), ['payment.requested'])
+        self.assertEqual(process_outbox(), (1, 0))  # Charged; the simulated provider completes it at once
+        self.client.force_authenticate(self.seller)
+        self.client.post(f'/orders/orders/{order_id}/update_status/', {'status': 'shipped'})
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(
+            sorted(OutboxMessage.objects.values_list('topic', flat=True)),
+            ['order.status_changed', 'order.status_changed', 'payment.completed']
+        )
+
+        self.assertEqual(process_outbox(), (3, 0))
+        self.assertEqual([message.subject for message in mail.outbox], ['Payment received', 'Your order has been shipped'])
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_rolled_back_change_queues_nothing(self):
+        order = Order.objects.create(buyer=self.buyer, product=self.product, quantity=1, total_price=Decimal('80.00'))
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            transition(order, 'cancelled')
+            raise RuntimeError
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_failing_handler_is_retried_with_backoff(self):
+        calls = []
+
+        def flaky(payload):
+            calls.append(payload)
+            OrderStatusHistory.objects.create(order_id=payload['order'], from_status='pending', to_status='pending')
+            if len(calls) < 3:
+                raise ConnectionError('SMTP unavailable')
+
+        order = Order.objects.create(buyer=self.buyer, product=self.product, quantity=1, total_price=Decimal('80.00'))
+        publish('test.flaky', {'order': str(order.pk)})
+        with mock.patch.dict(outbox.HANDLERS, {'test.flaky': flaky}), self.assertLogs('apps.orders.outbox'):
+            self.assertEqual(process_outbox(), (0, 1))
+            message = OutboxMessage.objects.get()
+            self.assertEqual(message.attempts, 1)
+            self.assertIn('SMTP unavailable', message.last_error)
+            self.assertGreater(message.available_at, timezone.now())
+            # The failed attempt's writes were rolled back
+            self.assertFalse(OrderStatusHistory.objects.exists())
+            self.assertEqual(process_outbox(), (0, 0))  # Not due yet
+
+            OutboxMessage.objects.update(available_at=timezone.now())
+            process_outbox()
+            OutboxMessage.objects.update(available_at=timezone.now())
+            self.assertEqual(process_outbox(), (1, 0))
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(OrderStatusHistory.objects.count(), 1)
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_isolated_handler_runs_after_its_batch(self):
+        seen = []
+
+        def long_job(payload):
+            message = OutboxMessage.objects.get(topic='test.long')
+            # The batch is done: its other messages are deleted, and this one is leased to this worker
+            seen.append((
+                list(OutboxMessage.objects.exclude(pk=message.pk).values_list('topic', flat=True)),
+                message.available_at > timezone.now() + timedelta(minutes=5),
+            ))
+
+        publish('test.long', {})
+        publish('test.quick', {})
+        handlers = {'test.long': long_job, 'test.quick': lambda payload: None}
+        with mock.patch.dict(outbox.HANDLERS, handlers), mock.patch.object(outbox, 'ISOLATED_TOPICS', {'test.long'}):
+            self.assertEqual(process_outbox(), (2, 0))
+        self.assertEqual(seen, [([], True)])
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_failing_isolated_handler_is_retried(self):
+        def long_job(payload):
+            OrderStatusHistory.objects.create(order_id=payload['order'], from_status='pending', to_status='pending')
+            raise TimeoutError('Settlement file unavailable')
+
+        order = Order.objects.create(buyer=self.buyer, product=self.product, quantity=1, total_price=Decimal('80.00'))
+        publish('test.long', {'order': str(order.pk)})
+        with mock.patch.dict(outbox.HANDLERS, {'test.long': long_job}), \
+                mock.patch.object(outbox, 'ISOLATED_TOPICS', {'test.long'}), self.assertLogs('apps.orders.outbox'):
+            self.assertEqual(process_outbox(), (0, 1))
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.attempts, 1)
+        self.assertIn('Settlement file unavailable', message.last_error)
+        self.assertLess(message.available_at, timezone.now() + timedelta(minutes=5))  # Backoff, not the lease
+        self.assertFalse(OrderStatusHistory.objects.exists())
+
+    def test_isolated_message_taken_over_is_not_run_twice(self):
+        message = publish('test.long', {})
+        leased_until = timezone.now()
+        OutboxMessage.objects.update(available_at=leased_until + timedelta(seconds=1))  # Another worker's lease
+        with mock.patch.dict(outbox.HANDLERS, {'test.long': mock.Mock()}) as handlers:
+            self.assertIsNone(outbox.run_isolated(message, leased_until))
+            handlers['test.long'].assert_not_called()
+        self.assertTrue(OutboxMessage.objects.exists())
+
+    @override_settings(OUTBOX_MAX_ATTEMPTS=2)
+    def test_message_is_given_up_on(self):
+        publish('test.unknown', {})
+        with self.assertLogs('apps.orders.outbox'):
+            process_outbox()
+            OutboxMessage.objects.update(available_at=timezone.now())
+            process_outbox()
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.attempts, message.available_at), (2, None))
+        self.assertIn('No outbox handler', message.last_error)
+
+
+class PartitionTests(TestCase):
+    """Orders are partitioned by month of created_at; old months can be archived"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='pass', role='seller'
+        )
+        cls.buyer = User.objects.create_user(
+            email='buyer@example.com', username='buyer', password='pass', role='buyer'
+        )
+        category = Category.objects.create(name='Fashion')
+        cls.product = Product.objects.create(
+            title='Jacket', description='Leather jacket', price=Decimal('80.00'),
+            category=category, seller=cls.seller, stock=10, requires_shipping=False
+        )
+
+    def place_order(self):
+        return Order.objects.create(buyer=self.buyer, product=self.product, quantity=1, total_price=Decimal('80.00'))
+
+    def partition_of(self, order):
+        with connections['default'].cursor() as cursor:
+            cursor.execute('SELECT tableoid::regclass::text FROM orders_order WHERE id = %s', [order.pk])
+            return cursor.fetchone()[0]
+
+    def test_orders_land_in_their_month(self):
+        order = self.place_order()
+        self.assertEqual(self.partition_of(order), partition_name('orders_order', month_start(order.created_at)))
+        self.assertEqual(ensure_partitions('orders_order', months_ahead=3), [])
+        self.assertEqual(len(ensure_partitions('orders_order', months_ahead=4)), 1)
+
+    def test_missed_month_is_moved_out_of_the_default_partition(self):
+        order = self.place_order()
+        month = add_months(month_start(timezone.now()), 6)  # Beyond the months created ahead
+        Order.objects.filter(pk=order.pk).update(
+            created_at=datetime(month.year, month.month, 10, tzinfo=dt_timezone.utc)
+        )
+        self.assertEqual(self.partition_of(order), 'orders_order_default')
+        with connections['default'].cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')  # No pending trigger events on the detached table
+
+        self.assertIn(partition_name('orders_order', month), ensure_partitions('orders_order', months_ahead=6))
+        self.assertEqual(self.partition_of(order), partition_name('orders_order', month))
+        with connections['default'].cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM orders_order_default')
+            self.assertEqual(cursor.fetchone()[0], 0)
+            self.assertEqual(list_partitions(cursor, 'orders_order')[month], partition_name('orders_order', month))
+        self.assertEqual(Order.objects.get(pk=order.pk).pk, order.pk)
+
+    def test_date_range_scans_only_its_month(self):
+        month = month_start(timezone.now())
+        start = datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+        plan = Order.objects.filter(created_at__gte=start, created_at__lt=start + timedelta(days=7)).explain()
+        self.assertIn(partition_name('orders_order', month), plan)
+        self.assertNotIn('orders_order_default', plan)
+        self.assertNotIn(partition_name('orders_order', add_months(month, 1)), plan)
+
+    def test_old_month_is_archived(self):
+        order = self.place_order()
+        address = {
+            'name': 'Sam', 'street1': '1 Main St', 'city': 'Austin', 'state': 'TX', 'zip_code': '78701',
+            'phone': '5550100', 'email': 'sam@example.com', 'is_verified': True,
+        }
+        shipping = Shipping.objects.create(
+            order=order, carrier='USPS', shipping_method='Priority', shipping_cost=Decimal('7.50'),
+            from_address=SellerAddress.objects.create(seller=self.seller, **address),
+            to_address=BuyerAddress.objects.create(buyer=self.buyer, **address),
+        )
+        old = ShippingStatusHistory.objects.create(shipping=shipping, status='PENDING')
+        kept = ShippingStatusHistory.objects.create(shipping=shipping, status='TRANSIT')
+        table = ShippingStatusHistory._meta.db_table
+        with connections['default'].cursor() as cursor:
+            create_partition(cursor, table, date(2020, 1, 1))
+        ShippingStatusHistory.objects.filter(pk=old.pk).update(created_at=datetime(2020, 1, 15, tzinfo=dt_timezone.utc))
+        with connections['default'].cursor() as cursor:
+            # Run the deferred foreign key checks of this test's writes, or the partition cannot be dropped
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+        with tempfile.TemporaryDirectory() as directory:
+            archived = archive_partitions(table, date(2020, 2, 1), directory)
+            self.assertEqual(archived, [f'{table}_p2020_01'])
+            with gzip.open(os.path.join(directory, f'{table}_p2020_01.csv.gz'), 'rt') as archive:
+                rows = list(csv.DictReader(archive))
+        self.assertEqual([row['id'] for row in rows], [str(old.pk)])
+        self.assertEqual(list(ShippingStatusHistory.objects.values_list('pk', flat=True)), [kept.pk])
+
+    def test_referenced_orders_are_not_archived(self):
+        old = self.place_order()
+        with connections['default'].cursor() as cursor:
+            create_partition(cursor, 'orders_order', date(2020, 1, 1))
+        Order.objects.filter(pk=old.pk).update(created_at=datetime(2020, 1, 15, tzinfo=dt_timezone.utc))
+        with tempfile.TemporaryDirectory() as directory, self.assertRaisesMessage(ValueError, 'orders.Payment'):
+            archive_partitions('orders_order', date(2020, 2, 1), directory)
+        self.assertTrue(Order.objects.filter(pk=old.pk).exists())
+
+
+class IdempotencyKeyTests(APITestCase):
+    """Retries sent with the same Idempotency-Key replay the first response"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='pass',
+            role='seller', first_name='Sam', last_name='Seller'
+        )
+        cls.buyer = User.objects.create_user(
+            email='buyer@example.com', username='buyer', password='pass',
+            role='buyer', first_name='Bea', last_name='Buyer'
+        )
+        cls.product = Product.objects.create(
+            title='Jacket', description='Leather jacket', price=Decimal('80.00'),
+            category=Category.objects.create(name='Fashion'), seller=seller, stock=5, requires_shipping=False
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.buyer)
+
+    def place_order(self, key, quantity=1):
+        return self.client.post(
+            '/orders/orders/', {'product': str(self.product.pk), 'quantity': quantity},
+            format='json', HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_retry_replays_the_first_response(self):
+        first = self.place_order('order-1')
+        self.assertEqual(first.status_code, 201)
+        with self.assertNumQueries(3):  # Lock, stored response, unlock
+            retry = self.place_order('order-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data['id'], str(first.data['id']))
+        self.assertEqual(Order.objects.count(), 1)
+
+        self.assertEqual(self.place_order('order-2').status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(self.client.post('/orders/orders/', {'product': str(self.product.pk)}).status_code, 201)
+        self.assertEqual(Order.objects.count(), 3)  # No key, no deduplication
+
+    def test_key_reused_for_another_request_is_rejected(self):
+        self.place_order('order-1')
+        self.assertEqual(self.place_order('order-1', quantity=2).status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_payment_retry_does_not_pay_twice(self):
+        order_id = self.place_order('order-1').data['id']
+        responses = [
+            self.client.post('/orders/payments/', {'order': order_id}, format='json', HTTP_IDEMPOTENCY_KEY='pay-1')
+            for _ in range(2)
+        ]
+        self.assertEqual([response.status_code for response in responses], [202, 202])
+        self.assertEqual(responses[0].data['id'], responses[1].data['id'])
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_failed_label_purchase_can_be_retried(self):
+        seller = self.product.seller
+        self.product.length = self.product.width = self.product.height = self.product.weight = Decimal('1.0')
+        self.product.save()
+        order_id = self.place_order('order-1').data['id']
+        Payment.objects.create(order_id=order_id, amount=Decimal('80.00'), payment_status='completed', transaction_id='tx_1')
+        address = {
+            'name': 'Sam', 'street1': '1 Main St', 'city': 'Austin', 'state': 'TX', 'zip_code': '78701',
+            'phone': '5550100', 'email': 'sam@example.com', 'is_verified': True,
+        }
+        shipping = Shipping.objects.create(
+            order_id=order_id, carrier='', shipping_method='', shipping_cost=Decimal('0'),
+            from_address=SellerAddress.objects.create(seller=seller, **address),
+            to_address=BuyerAddress.objects.create(buyer=self.buyer, **address),
+        )
+        rate = SimpleNamespace(provider='USPS', servicelevel=SimpleNamespace(name='Priority'), amount=Decimal('7.50'))
+        outcomes = [(False, None, 'Shippo timed out'), (True, SimpleNamespace(object_id='txn_1', rate=rate), None)]
+        self.client.force_authenticate(seller)
+
+        def buy_label():
+            return self.client.post(
+                f'/shipping/labels/{shipping.pk}/create/', {'rate_id': 'rate_1'},
+                format='json', HTTP_IDEMPOTENCY_KEY='label-1'
+            )
+
+        with mock.patch.object(Shipping, 'create_shippo_label', side_effect=outcomes) as create_label:
+            self.assertEqual(buy_label().status_code, 400)
+            self.assertFalse(IdempotencyKey.objects.filter(key='label-1').exists())
+            self.assertEqual(buy_label().status_code, 200)  # Runs again instead of replaying the failure
+            replayed = buy_label()
+        self.assertEqual((replayed.status_code, replayed['Idempotent-Replayed']), (200, 'true'))
+        self.assertEqual(create_label.call_count, 2)
+
+    def test_deterministic_errors_are_replayed(self):
+        order_id = self.place_order('order-1').data['id']
+        self.client.post(f'/orders/orders/{order_id}/cancel/')
+        responses = [
+            self.client.post('/orders/payments/', {'order': order_id}, format='json', HTTP_IDEMPOTENCY_KEY='pay-1')
+            for _ in range(2)
+        ]
+        self.assertEqual([response.status_code for response in responses], [400, 400])
+        self.assertEqual(responses[1]['Idempotent-Replayed'], 'true')
+
+    def test_expired_keys_run_again(self):
+        self.place_order('order-1')
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        self.assertEqual(self.place_order('order-1').status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+
+class IdempotencyKeyConcurrencyTests(TransactionTestCase):
+    """Duplicates sent at the same time wait for the first instead of executing again"""
+
+    workers = 10
+
+    def test_concurrent_duplicates_create_one_order(self):
+        seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='pass',
+            role='seller', first_name='Sam', last_name='Seller'
+        )
+        buyer = User.objects.create_user(
+            email='buyer@example.com', username='buyer', password='pass',
+            role='buyer', first_name='Bea', last_name='Buyer'
+        )
+        product = Product.objects.create(
+            title='Jacket', description='Leather jacket', price=Decimal('80.00'),
+            category=Category.objects.create(name='Fashion'), seller=seller, stock=50, requires_shipping=False
+        )
+        barrier = threading.Barrier(self.workers)
+
+        def place_order(_):
+            client = APIClient()
+            client.force_authenticate(buyer)
+            barrier.wait(timeout=30)
+            try:
+                response = client.post(
+                    '/orders/orders/', {'product': str(product.pk), 'quantity': 1},
+                    format='json', HTTP_IDEMPOTENCY_KEY='checkout-42'
+                )
+                return response.status_code, str(response.data['id'])
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(place_order, range(self.workers)))
+
+        self.assertEqual({status_code for status_code, _ in results}, {201})
+        self.assertEqual(len({order_id for _, order_id in results}), 1)
+        self.assertEqual(Order.objects.count(), 1)
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 49)
+
+
+class StockReservationConcurrencyTests(TransactionTestCase):
+    """Hundreds of buyers racing for one hot product must never oversell it"""
+
+    buyers = 200
+    workers = 50
+    stock = 60
+
+    def setUp(self):
+        seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='pass',
+            role='seller', first_name='Sam', last_name='Seller'
+        )
+        self.product = Product.objects.create(
+            title='Limited sneakers', description='Flash sale', price=Decimal('120.00'),
+            category=Category.objects.create(name='Shoes'), seller=seller,
+            stock=self.stock, requires_shipping=False
+        )
+        self.users = [
+            User.objects.create_user(
+                email=f'buyer{i}@example.com', username=f'buyer{i}',
+                role='buyer', first_name='Bea', last_name='Buyer'
+            )
+            for i in range(self.buyers)
+        ]
+
+    def test_flash_sale_does_not_oversell(self):
+        barrier = threading.Barrier(self.workers)
+
+        def buy(user):
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                barrier.wait(timeout=30)
+            except threading.BrokenBarrierError:
+                pass  # Later buyers arrive after the first wave has started
+            try:
+                started = time.monotonic()
+                response = client.post('/orders/orders/', {'product': str(self.product.pk), 'quantity': 1})
+                return response.status_code, time.monotonic() - started
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(buy, self.users))
+
+        statuses = [status_code for status_code, _ in results]
+        self.assertEqual(statuses.count(201), self.stock)
+        self.assertEqual(statuses.count(400), self.buyers - self.stock)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 0)
+        self.assertEqual(Order.objects.filter(product=self.product).count(), self.stock)
+
+        # The product row is locked only from the reservation to commit, so no
+        # request queues behind the others for long
+        self.assertLess(max(elapsed for _, elapsed in results), 5)
@@ -1,10 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import OrderViewSet, PaymentViewSet
+from .views import CartViewSet, CheckoutViewSet, OrderViewSet, PaymentViewSet
 
 router = DefaultRouter()
 router.register(r'orders', OrderViewSet, basename='order')
 router.register(r'payments', PaymentViewSet, basename='payment')
+router.register(r'cart', CartViewSet, basename='cart')
+router.register(r'checkouts', CheckoutViewSet, basename='checkout')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -1,10 +1,18 @@
-from rest_framework import viewsets, permissions, status
+from rest_framework import viewsets, mixins, permissions, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from django.core.exceptions import ValidationError
 from django.shortcuts import get_object_or_404
-from .models import Order, Payment
-from .serializers import OrderSerializer, PaymentSerializer
-from uuid import uuid4
+from django.db import transaction
+from .models import CartItem, Checkout, Order, Payment
+from .serializers import CartItemSerializer, CheckoutSerializer, OrderSerializer, PaymentSerializer
+from .checkout import MAX_CHECKOUT_LINES, checkout_cart, place_orders
+from .idempotency import idempotent
+from .inventory import RESERVING_STATUSES, StockError
+from .states import TransitionError, cancel_order, transition
+from apps.payments.gateway import request_payments
+from auraspotmarketplace1.pagination import StandardResultsSetPagination
+from auraspotmarketplace1.fieldsets import sparse_queryset, wants_sparse
 
 class IsBuyerOrAdmin(permissions.BasePermission):
     def has_permission(self, request, view):
@@ -19,97 +27,255 @@ class OrderViewSet(viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     queryset = Order.objects.all()
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = StandardResultsSetPagination
+    # No PUT/PATCH: saving the whole row would undo a concurrent status change.
+    # Orders change through the conditional transitions below (see states.py)
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
 
     def get_queryset(self):
         """Filter orders based on user role"""
         user = self.request.user
+        orders = Order.objects.select_related('product').order_by('-created_at')
+        if self.action == 'list' and wants_sparse(self.request):
+            orders = sparse_queryset(orders, self.get_serializer())
         if user.role == 'admin':
-            return Order.objects.all()
+            return orders
         elif user.role == 'buyer':
-            return Order.objects.filter(buyer=user)
+            return orders.filter(buyer=user)
         elif user.role == 'seller':
-            return Order.objects.filter(product__seller=user)
+            return orders.filter(product__seller=user)
         return Order.objects.none()
 
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        """Place a one-product order; retries sent with the same Idempotency-Key get the first response"""
+        return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         """Ensure the buyer is the logged-in user"""
         if self.request.user.role != 'buyer':
             raise permissions.PermissionDenied("Only buyers can create orders")
         serializer.save(buyer=self.request.user)
 
+    def perform_destroy(self, instance):
+        """Deleting an order that still holds stock gives the stock back"""
+        with transaction.atomic():
+            cancel_order(instance)
+            instance.delete()
+
     @action(detail=True, methods=['post'], permission_classes=[IsSellerOrAdmin])
     def update_status(self, request, pk=None):
-        """Update order status (Seller/Admin only)"""
+        """
+        Update order status (Seller/Admin only). Send the ``version`` the order
+        was read with to be told (409) if someone changed it in the meantime.
+        """
         order = self.get_object()
-        new_status = request.data.get('status')
-        valid_statuses = ['pending', 'processing', 'shipped', 'delivered', 'cancelled']
-        
-        if new_status not in valid_statuses:
-            return Response(
-                {'error': f'Invalid status. Must be one of {valid_statuses}'}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        order.status = new_status
-        order.save()
-        return Response(OrderSerializer(order).data)
+        return order_transition_response(order, request)
 
     @action(detail=True, methods=['post'], permission_classes=[IsBuyerOrAdmin])
     def cancel(self, request, pk=None):
         """Cancel order (Buyer/Admin only)"""
         order = self.get_object()
-        if order.status not in ['pending', 'processing']:
+        # Releases the reserved stock; fails if the order was shipped, delivered or already cancelled
+        if order.status not in RESERVING_STATUSES:
             return Response(
                 {'error': 'Cannot cancel order that has been shipped or delivered'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        order.status = 'cancelled'
-        order.save()
+        if not cancel_order(order, user=request.user):
+            return Response(
+                {'error': 'The order was changed meanwhile; reload it and try again'},
+                status=status.HTTP_409_CONFLICT
+            )
         return Response(OrderSerializer(order).data)
 
+def order_transition_response(order, request):
+    """Apply ``{"status", "version"?}`` from the request to ``order``: 400 for a move the order cannot make, 409 on a lost race"""
+    new_status = request.data.get('status')
+    valid_statuses = [choice for choice, _ in Order.STATUS_CHOICES]
+
+    if new_status not in valid_statuses:
+        return Response(
+            {'error': f'Invalid status. Must be one of {valid_statuses}'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    version = request.data.get('version')
+    if version is not None:
+        try:
+            version = int(version)
+        except (TypeError, ValueError):
+            return Response({'error': 'version must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        transition(order, new_status, version=version, user=request.user, note=str(request.data.get('note', ''))[:255])
+    except TransitionError as e:
+        return Response(
+            {'error': str(e)},
+            status=status.HTTP_409_CONFLICT if e.conflict else status.HTTP_400_BAD_REQUEST
+        )
+    return Response(OrderSerializer(order).data)
+
 class PaymentViewSet(viewsets.ModelViewSet):
     """API for Processing Payments"""
     serializer_class = PaymentSerializer
     permission_classes = [IsBuyerOrAdmin]
     queryset = Payment.objects.all()
+    pagination_class = StandardResultsSetPagination
 
     def get_queryset(self):
         """Filter payments based on user role"""
         user = self.request.user
+        payments = Payment.objects.select_related('order').order_by('-created_at')
         if user.role == 'admin':
-            return Payment.objects.all()
+            return payments
         elif user.role == 'buyer':
-            return Payment.objects.filter(order__buyer=user)
+            return payments.filter(order__buyer=user)
         return Payment.objects.none()
 
+    @idempotent
     def create(self, request, *args, **kwargs):
-        """Process Payment for an Order"""
+        """Start paying for an order (202); the provider's webhook completes the payment and confirms the order"""
         order = get_object_or_404(Order, id=request.data.get('order'))
         
         # Verify buyer
         if request.user != order.buyer and not request.user.role == 'admin':
             raise permissions.PermissionDenied("You can only pay for your own orders")
             
-        # Check if order is already paid
-        if Payment.objects.filter(order=order, payment_status='completed').exists():
+        with transaction.atomic():
+            # Locked so a concurrent payment, cancel or expiry waits for this one
+            order = Order.objects.select_for_update(of=('self',)).get(pk=order.pk)
+            payment_status = Payment.objects.filter(order=order).values_list('payment_status', flat=True).first()
+
+            # Check if order is already paid
+            if payment_status in ('completed', 'refunded'):
+                return Response(
+                    {'error': 'Order is already paid'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if payment_status == 'pending':
+                return Response(
+                    {'error': 'A payment for this order is already in progress'},
+                    status=status.HTTP_409_CONFLICT
+                )
+            if order.status != 'pending':
+                return Response(
+                    {'error': 'Order is not awaiting payment (it was cancelled or its reservation expired)'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            # Charged by the outbox worker; the provider's webhook completes the payment and the order
+            payment, = request_payments(Order.objects.filter(pk=order.pk))
+
+        return Response(PaymentSerializer(payment).data, status=status.HTTP_202_ACCEPTED)
+
+def stock_error_response(error):
+    """400 listing the products that do not exist or lack stock"""
+    return Response({
+        'error': 'Some items are unavailable',
+        'unknown_products': [str(pk) for pk in error.unknown],
+        'insufficient_stock': {str(pk): shortage for pk, shortage in error.short.items()},
+    }, status=status.HTTP_400_BAD_REQUEST)
+
+class CartViewSet(viewsets.GenericViewSet):
+    """The logged-in buyer's cart: GET lists it, items are added, changed and removed by product"""
+    serializer_class = CartItemSerializer
+    permission_classes = [IsBuyerOrAdmin]
+
+    def get_queryset(self):
+        return CartItem.objects.filter(buyer=self.request.user).select_related('product')
+
+    def list(self, request):
+        """Cart lines and subtotal at current prices"""
+        items = list(self.get_queryset())
+        return Response({
+            'items': self.get_serializer(items, many=True).data,
+            'subtotal': str(sum((item.product.price * item.quantity for item in items), 0)),
+        })
+
+    @action(detail=False, methods=['post'])
+    def items(self, request):
+        """Add a product to the cart, or set its quantity if it is already there"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        product, quantity = serializer.validated_data['product'], serializer.validated_data.get('quantity', 1)
+        if (
+            not CartItem.objects.filter(buyer=request.user, product=product).exists()
+            and CartItem.objects.filter(buyer=request.user).count() >= MAX_CHECKOUT_LINES
+        ):
             return Response(
-                {'error': 'Order is already paid'}, 
+                {'error': f'A cart holds at most {MAX_CHECKOUT_LINES} different products'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        # Simulate payment gateway
-        fake_transaction_id = str(uuid4())
-
-        payment = Payment.objects.create(
-            order=order,
-            amount=order.total_price,
-            payment_status='completed',
-            transaction_id=fake_transaction_id
+        item, created = CartItem.objects.update_or_create(
+            buyer=request.user, product=product, defaults={'quantity': quantity}
+        )
+        return Response(
+            self.get_serializer(item).data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
         )
 
-        # Update Order Status
-        order.status = 'processing'
-        order.save()
-        
-        return Response(PaymentSerializer(payment).data, status=status.HTTP_201_CREATED)
\ No newline at end of file
+    @action(detail=False, methods=['delete'], url_path=r'items/(?P<product_id>[^/.]+)')
+    def remove_item(self, request, product_id=None):
+        """Remove a product from the cart"""
+        try:
+            deleted, _ = CartItem.objects.filter(buyer=request.user, product_id=product_id).delete()
+        except (ValueError, ValidationError):
+            deleted = 0
+        if not deleted:
+            return Response({'error': 'Product is not in the cart'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class CheckoutViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Checkouts: place orders for several products in one request and one
+    transaction, and pay for all of them at once
+    """
+    serializer_class = CheckoutSerializer
+    permission_classes = [IsBuyerOrAdmin]
+    pagination_class = StandardResultsSetPagination
+
+    def get_queryset(self):
+        checkouts = Checkout.objects.prefetch_related('orders').order_by('-created_at')
+        if self.request.user.role == 'admin':
+            return checkouts
+        return checkouts.filter(buyer=self.request.user)
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        """Check out ``items`` (``[{"product", "quantity"}]``) or, without them, the cart"""
+        if request.user.role != 'buyer':
+            raise permissions.PermissionDenied("Only buyers can check out")
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        quantities = serializer.validated_data.get('items')
+        try:
+            if quantities:
+                checkout, _ = place_orders(request.user, quantities, checkout=True)
+            else:
+                checkout, _ = checkout_cart(request.user)
+        except StockError as e:
+            return stock_error_response(e)
+        if checkout is None:
+            return Response({'error': 'Cart is empty'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer(checkout).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'])
+    @idempotent
+    def pay(self, request, pk=None):
+        """Pay for every order of the checkout that still awaits payment, in one transaction"""
+        checkout = self.get_object()
+        if request.user != checkout.buyer and request.user.role != 'admin':
+            raise permissions.PermissionDenied("You can only pay for your own orders")
+
+        # Charged by the outbox worker; each order is confirmed when its payment completes
+        payments = request_payments(Order.objects.filter(checkout=checkout))
+        if not payments:
+            return Response(
+                {'error': 'No order of this checkout is awaiting payment'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response({
+            'checkout': checkout.pk,
+            'amount': str(sum(payment.amount for payment in payments)),
+            'payments': PaymentSerializer(payments, many=True).data,
+        }, status=status.HTTP_202_ACCEPTED)
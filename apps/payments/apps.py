@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PaymentsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.payments"
+
+    def ready(self):
+        from . import handlers  # noqa: F401  Registers the outbox handlers
@@ -0,0 +1,189 @@
+"""
+Taking payments through a payment provider (see ``providers.py``).
+
+Paying does not wait for the provider. ``request_payments`` creates pending
+payments and queues a ``payment.requested`` outbox message for each one, in
+the buyer's transaction, and the API answers 202 straight away. The outbox
+worker then charges them (see ``handlers.py``) with a deadline, retrying
+calls that time out or fail under the same idempotency key. The outcome arrives by webhook:
+``receive_webhook`` verifies it, records the event so redeliveries are
+ignored, and completes or fails the payment. A completed payment confirms its
+order (pending -> processing). A charge that succeeds for an order cancelled
+meanwhile, or for the wrong amount, is refunded.
+
+While a payment is pending its order's stock reservation is extended to
+``PAYMENT_PENDING_TTL``, so the order does not expire under a slow provider.
+"""
+import logging
+from datetime import timedelta
+from uuid import UUID
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from apps.orders.models import Order, Payment
+from apps.orders.outbox import publish, publish_many
+from apps.orders.states import confirm_reservation
+from .models import ProcessedWebhook
+from .providers import Deadline, ProviderError, WebhookError, get_provider
+
+logger = logging.getLogger(__name__)
+
+
+def get_pending_ttl():
+    return timedelta(seconds=getattr(settings, 'PAYMENT_PENDING_TTL', 30 * 60))
+
+
+def get_deadline():
+    return Deadline(getattr(settings, 'PAYMENT_PROVIDER_TIMEOUT', 10))
+
+
+def reference(payment_id, attempt):
+    """What the provider knows a payment attempt by; also its idempotency key"""
+    return f'{payment_id}:{attempt}'
+
+
+def parse_reference(value):
+    try:
+        payment_id, attempt = value.rsplit(':', 1)
+        return UUID(payment_id), int(attempt)
+    except (AttributeError, ValueError):
+        raise WebhookError(f'Unknown payment reference {value!r}')
+
+
+def request_payments(orders, provider=None):
+    """
+    Start paying for the unpaid orders of the queryset ``orders``: a pending
+    payment is created for each one without a payment, and a failed payment
+    is retried as a new attempt. Orders that are not pending, or whose payment
+    is pending or completed, are left alone. Returns the pending payments.
+    """
+    provider = provider or settings.PAYMENT_PROVIDER
+    now = timezone.now()
+    with transaction.atomic():
+        # Locked in a fixed order, so a concurrent cancel, expiry or second payment waits
+        amounts = dict(
+            orders.filter(status='pending').select_for_update(of=('self',)).order_by('pk').values_list('pk', 'total_price')
+        )
+        if not amounts:
+            return []
+        existing = dict(
+            Payment.objects.select_for_update().filter(order_id__in=list(amounts)).values_list('order_id', 'payment_status')
+        )
+        retried = [order_id for order_id, status in existing.items() if status == 'failed']
+        if retried:
+            Payment.objects.filter(order_id__in=retried).update(
+                payment_status='pending', attempt=F('attempt') + 1, transaction_id=None, failure_reason='',
+                provider=provider
+            )
+        Payment.objects.bulk_create([
+            Payment(order_id=order_id, amount=amount, payment_status='pending', provider=provider)
+            for order_id, amount in amounts.items() if order_id not in existing
+        ])
+        payable = retried + [order_id for order_id in amounts if order_id not in existing]
+        if not payable:
+            return []
+        Order.objects.filter(pk__in=payable).update(
+            reserved_until=Greatest(F('reserved_until'), now + get_pending_ttl()), updated_at=now
+        )
+        payments = list(Payment.objects.filter(order_id__in=payable).order_by('order_id'))
+        publish_many('payment.requested', [
+            {'payment': str(payment.pk), 'attempt': payment.attempt} for payment in payments
+        ])
+    return payments
+
+
+def apply_outcome(payment_id, attempt, succeeded, transaction_id=None, amount=None, reason=''):
+    """
+    Record the provider's verdict on a payment attempt. Returns False if the
+    attempt is no longer pending (already decided, or superseded by a retry).
+    """
+    with transaction.atomic():
+        payment = (
+            Payment.objects.select_for_update().select_related('order')
+            .filter(pk=payment_id, attempt=attempt, payment_status='pending').first()
+        )
+        if payment is None:
+            return False
+        payments = Payment.objects.filter(pk=payment.pk)
+        if not succeeded:
+            payments.update(
+                payment_status='failed', transaction_id=transaction_id or payment.transaction_id,
+                failure_reason=(reason or 'Declined')[:255]
+            )
+            return True
+
+        payments.update(payment_status='completed', transaction_id=transaction_id or payment.transaction_id)
+        if amount is not None and amount != payment.amount:
+            problem = f'Charged {amount} instead of {payment.amount}'
+        elif not confirm_reservation(payment.order):
+            problem = 'The order was cancelled before the payment completed'
+        else:
+            publish('payment.completed', {'payment': str(payment.pk)})
+            return True
+        logger.warning(f'Refunding payment {payment.pk}: {problem}')
+        payments.update(failure_reason=problem)
+        publish('payment.refund', {'payment': str(payment.pk)})
+    return True
+
+
+def receive_webhook(provider_name, body, headers):
+    """
+    Verify and apply a webhook callback. Returns False for an event that was
+    already applied; raises WebhookError for a forged or unreadable one.
+    """
+    try:
+        provider = get_provider(provider_name)
+    except KeyError:
+        raise WebhookError(f'Unknown payment provider {provider_name}')
+    event = provider.parse_webhook(body, headers)
+    payment_id, attempt = parse_reference(event.reference)
+    with transaction.atomic():
+        # A redelivery blocks here until the first delivery commits, then finds its record
+        _, created = ProcessedWebhook.objects.get_or_create(provider=provider_name, event_id=event.event_id)
+        if not created:
+            return False
+        applied = apply_outcome(
+            payment_id, attempt, event.kind == 'succeeded',
+            transaction_id=event.transaction_id, amount=event.amount, reason=event.reason,
+        )
+        if not applied:
+            logger.info(f'Ignored {provider_name} event {event.event_id} for a payment that is no longer pending')
+    return True
+
+
+def charge_payment(payment_id, attempt):
+    """Ask the provider to charge a pending payment attempt; raises ProviderError if it should be retried"""
+    payment = Payment.objects.filter(pk=payment_id, attempt=attempt, payment_status='pending').first()
+    if payment is None:
+        return  # Decided or retried meanwhile
+    key = reference(payment.pk, payment.attempt)
+    # ProviderError propagates: the outbox retries the message later, under the same key
+    result = get_provider(payment.provider).charge(key, payment.amount, idempotency_key=key, deadline=get_deadline())
+    if result.status == 'pending':
+        if result.transaction_id:
+            Payment.objects.filter(
+                pk=payment.pk, attempt=payment.attempt, payment_status='pending', transaction_id__isnull=True
+            ).update(transaction_id=result.transaction_id)
+    else:
+        apply_outcome(
+            payment.pk, payment.attempt, result.status == 'completed',
+            transaction_id=result.transaction_id, amount=payment.amount, reason=result.reason,
+        )
+
+
+def refund_payment(payment_id):
+    """Refund a completed payment in full; raises ProviderError if it should be retried"""
+    payment = Payment.objects.filter(pk=payment_id, payment_status='completed').first()
+    if payment is None:
+        return
+    result = get_provider(payment.provider).refund(
+        payment.transaction_id, payment.amount,
+        idempotency_key=f'refund:{reference(payment.pk, payment.attempt)}', deadline=get_deadline(),
+    )
+    if result.status == 'failed':
+        raise ProviderError(f'Refund of payment {payment.pk} was refused: {result.reason}')
+    Payment.objects.filter(pk=payment.pk, payment_status='completed').update(payment_status='refunded')
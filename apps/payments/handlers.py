@@ -0,0 +1,29 @@
+"""
+Outbox handlers for payments: charging and refunding through the provider,
+and reconciling uploaded settlement files.
+
+Registered when the app loads (see ``PaymentsConfig.ready``) and run by the
+``process_outbox`` worker, so no request waits for the provider. A
+reconciliation can take half a minute, so it runs isolated: in a transaction
+of its own rather than the batch's, which would otherwise hold the claim on
+every other message of the batch until it finished.
+"""
+from apps.orders.outbox import handler
+
+from .gateway import charge_payment, refund_payment
+from .reconciliation import run_reconciliation
+
+
+@handler('payment.requested')
+def charge(payload):
+    charge_payment(payload['payment'], payload['attempt'])
+
+
+@handler('payment.refund')
+def refund(payload):
+    refund_payment(payload['payment'])
+
+
+@handler('payment.reconcile', isolated=True)
+def reconcile(payload):
+    run_reconciliation(payload['reconciliation'])
@@ -0,0 +1,53 @@
+import gzip
+import os
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.payments.models import Reconciliation
+from apps.payments.reconciliation import reconcile
+
+
+def period_bound(value):
+    try:
+        return datetime.fromisoformat(value).replace(tzinfo=dt_timezone.utc)
+    except ValueError:
+        raise CommandError(f'Invalid date {value!r}; use YYYY-MM-DD')
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconcile a payment provider settlement CSV (optionally gzipped) against our payments '
+        'and record the mismatches'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV with transaction_id, amount and optionally status columns')
+        parser.add_argument('--provider', default='', help='Only report this provider\'s payments as unsettled')
+        parser.add_argument('--since', type=period_bound, help='With --until, report completed payments from this date (UTC) missing from the file')
+        parser.add_argument('--until', type=period_bound, help='End of the period, exclusive')
+        parser.add_argument('--chunk-size', type=int, help='Rows per COPY (default: SETTLEMENT_CHUNK_SIZE)')
+
+    def handle(self, *args, **options):
+        if bool(options['since']) != bool(options['until']):
+            raise CommandError('--since and --until go together')
+        path = options['path']
+        opener = gzip.open if path.endswith('.gz') else open
+        try:
+            stream = opener(path, 'rt', encoding='utf-8-sig', newline='')
+        except OSError as e:
+            raise CommandError(str(e))
+
+        reconciliation = Reconciliation.objects.create(
+            source_name=os.path.basename(path), provider=options['provider'],
+            period_start=options['since'], period_end=options['until'],
+        )
+        with stream:
+            reconcile(reconciliation, stream, chunk_size=options['chunk_size'])
+        if reconciliation.status == 'failed':
+            raise CommandError(f'Reconciliation {reconciliation.pk} failed: {reconciliation.error}')
+        self.stdout.write(
+            f'Reconciliation {reconciliation.pk}: {reconciliation.rows} rows, {reconciliation.mismatches} mismatches'
+        )
+        for kind, count in sorted(reconciliation.summary.items()):
+            self.stdout.write(f'  {kind}: {count}')
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.6 on 2026-10-17 07:46
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0012_payment_provider'),
+        ('payments', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reconciliation',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('file', models.FileField(blank=True, upload_to='settlements/')),
+                ('source_name', models.CharField(max_length=255)),
+                ('provider', models.CharField(blank=True, max_length=50)),
+                ('period_start', models.DateTimeField(blank=True, null=True)),
+                ('period_end', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('rows', models.PositiveBigIntegerField(default=0)),
+                ('mismatches', models.PositiveBigIntegerField(default=0)),
+                ('summary', models.JSONField(blank=True, default=dict)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReconciliationMismatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('missing', 'Settled but no payment has this transaction ID'), ('amount', 'Settled amount differs from the payment'), ('status', 'Settled status differs from the payment'), ('unsettled', 'Completed payment missing from the settlement'), ('duplicate', 'Transaction settled more than once'), ('malformed', 'Unreadable settlement row')], max_length=20)),
+                ('line', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('transaction_id', models.CharField(blank=True, max_length=255)),
+                ('settled_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True)),
+                ('expected_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('settled_status', models.CharField(blank=True, max_length=50)),
+                ('payment_status', models.CharField(blank=True, max_length=20)),
+                ('detail', models.CharField(blank=True, max_length=255)),
+                ('payment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='orders.payment')),
+                ('reconciliation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mismatch_rows', to='payments.reconciliation')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['reconciliation', 'kind', 'id'], name='recon_mismatch_kind_idx')],
+            },
+        ),
+    ]
@@ -1,3 +1,80 @@
+from uuid import uuid4
+
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+from apps.orders.models import Payment
+
+
+class ProcessedWebhook(models.Model):
+    """A provider webhook event that was applied; redeliveries of it are acknowledged and ignored"""
+    provider = models.CharField(max_length=50)
+    event_id = models.CharField(max_length=255)
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['provider', 'event_id'], name='processed_webhook_event_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.provider} {self.event_id}"
+
+
+class Reconciliation(models.Model):
+    """A provider settlement file checked against our payments (see ``reconciliation.py``)"""
+    STATUS = [
+        ('pending', 'Pending'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    file = models.FileField(upload_to='settlements/', blank=True)  # Empty when run from the command line
+    source_name = models.CharField(max_length=255)
+    provider = models.CharField(max_length=50, blank=True)  # Limits the unsettled check to this provider's payments
+    # With both set, completed payments created in [period_start, period_end) missing from the file are reported
+    period_start = models.DateTimeField(null=True, blank=True)
+    period_end = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS, default='pending')
+    rows = models.PositiveBigIntegerField(default=0)
+    mismatches = models.PositiveBigIntegerField(default=0)
+    summary = models.JSONField(default=dict, blank=True)  # Mismatch kind -> count
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Reconciliation of {self.source_name} - {self.status}"
+
+
+class ReconciliationMismatch(models.Model):
+    """A settlement row, or one of our payments, that does not agree with the other side"""
+    KIND = [
+        ('missing', 'Settled but no payment has this transaction ID'),
+        ('amount', 'Settled amount differs from the payment'),
+        ('status', 'Settled status differs from the payment'),
+        ('unsettled', 'Completed payment missing from the settlement'),
+        ('duplicate', 'Transaction settled more than once'),
+        ('malformed', 'Unreadable settlement row'),
+    ]
+
+    reconciliation = models.ForeignKey(Reconciliation, on_delete=models.CASCADE, related_name='mismatch_rows')
+    kind = models.CharField(max_length=20, choices=KIND)
+    line = models.PositiveBigIntegerField(null=True, blank=True)  # Of the settlement file; empty for unsettled payments
+    transaction_id = models.CharField(max_length=255, blank=True)
+    payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    settled_amount = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    expected_amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    settled_status = models.CharField(max_length=50, blank=True)
+    payment_status = models.CharField(max_length=20, blank=True)
+    detail = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['reconciliation', 'kind', 'id'], name='recon_mismatch_kind_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.transaction_id or self.line}"
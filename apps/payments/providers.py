@@ -0,0 +1,269 @@
+"""
+Payment providers.
+
+A provider charges a payment and later reports the outcome to a webhook. The
+configured providers live in ``settings.PAYMENT_PROVIDERS`` (name -> BACKEND
+class path and OPTIONS, like ``CACHES``); ``get_provider(name)`` returns one
+shared instance per name and process.
+
+Providers are called only from the outbox worker (see ``gateway.py``), never
+from a request, and always with a ``Deadline``: a call that cannot finish in
+time raises ProviderTimeout and is retried later with the same idempotency
+key, so the provider charges at most once. HTTP providers share a pool of
+keep-alive connections per process instead of opening one per call.
+
+``SimulatedProvider`` stands in for a real gateway offline, with configurable
+latency, declines, transient errors and webhook delivery, to exercise and
+load-test the whole payment flow.
+"""
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from uuid import uuid4
+
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+
+
+class ProviderError(Exception):
+    """The provider could not be reached or failed; the call can be retried with the same idempotency key"""
+
+
+class ProviderTimeout(ProviderError):
+    """The call's deadline passed"""
+
+
+class WebhookError(Exception):
+    """A webhook callback that is not authentic or cannot be read"""
+
+
+class Deadline:
+    """A point in time by which a provider call, retries included, must be done"""
+
+    def __init__(self, seconds):
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        """Seconds left; raises ProviderTimeout once none are"""
+        remaining = self.expires - time.monotonic()
+        if remaining <= 0:
+            raise ProviderTimeout('Deadline exceeded')
+        return remaining
+
+
+class ChargeResult:
+    """What a provider said about a charge: ``pending`` (the outcome follows by webhook), ``completed`` or ``failed``"""
+
+    def __init__(self, status, transaction_id=None, reason=''):
+        self.status = status
+        self.transaction_id = transaction_id
+        self.reason = reason
+
+
+class WebhookEvent:
+    """A provider's webhook callback in provider-neutral form"""
+
+    def __init__(self, event_id, kind, reference, transaction_id=None, amount=None, reason=''):
+        self.event_id = event_id
+        self.kind = kind  # 'succeeded' or 'failed'
+        self.reference = reference  # As passed to charge()
+        self.transaction_id = transaction_id
+        self.amount = amount
+        self.reason = reason
+
+
+class PaymentProvider:
+    """Base class of payment providers; ``name`` is the key of the provider in PAYMENT_PROVIDERS"""
+
+    def __init__(self, name, **options):
+        self.name = name
+        self.options = options
+
+    def charge(self, reference, amount, idempotency_key, deadline):
+        """Charge ``amount`` for the payment ``reference``; returns a ChargeResult"""
+        raise NotImplementedError
+
+    def refund(self, transaction_id, amount, idempotency_key, deadline):
+        """Refund a completed charge in full; returns a ChargeResult"""
+        raise NotImplementedError
+
+    def parse_webhook(self, body, headers):
+        """Verify and decode a webhook request; returns a WebhookEvent or raises WebhookError"""
+        raise NotImplementedError
+
+
+class HTTPProvider(PaymentProvider):
+    """
+    A provider reached over HTTP. Requests go through one ``requests.Session``
+    per provider and process, keeping up to ``PAYMENT_PROVIDER_POOL_SIZE``
+    connections open, and time out when their deadline does.
+    """
+    connect_timeout = 3  # seconds
+
+    def __init__(self, name, **options):
+        super().__init__(name, **options)
+        pool_size = getattr(settings, 'PAYMENT_PROVIDER_POOL_SIZE', 20)
+        self.session = requests.Session()
+        # No automatic retries: they would run past the deadline; the outbox retries instead
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, method, url, deadline, **kwargs):
+        remaining = deadline.remaining()
+        try:
+            response = self.session.request(
+                method, url, timeout=(min(self.connect_timeout, remaining), remaining), **kwargs
+            )
+        except requests.Timeout as e:
+            raise ProviderTimeout(str(e)) from e
+        except requests.RequestException as e:
+            raise ProviderError(str(e)) from e
+        if response.status_code >= 500 or response.status_code == 429:
+            raise ProviderError(f'{self.name} answered {response.status_code}')
+        return response
+
+
+class SimulatedProvider(HTTPProvider):
+    """
+    An offline stand-in for a card gateway. Options:
+
+    - ``latency``: seconds each call takes
+    - ``failure_rate``: share of charges declined (reported by webhook)
+    - ``error_rate``: share of calls failing transiently (retried by the worker)
+    - ``webhook_delay``: seconds before the outcome is reported
+    - ``webhook_url``: where outcomes are POSTed, through the connection pool;
+      without it they are handed to the webhook handler in-process
+    - ``webhook_secret``: key the webhook bodies are signed with
+    - ``idempotency_ttl``: seconds a charge's idempotency key is remembered
+    - ``max_idempotency_keys``: most keys remembered; the oldest go first
+    """
+    SIGNATURE_HEADER = 'X-Simulated-Signature'
+
+    def __init__(self, name, latency=0, failure_rate=0, error_rate=0, webhook_delay=0, webhook_url=None,
+                 webhook_secret='simulated-webhook-secret', idempotency_ttl=24 * 60 * 60,
+                 max_idempotency_keys=100000):
+        super().__init__(name)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.error_rate = error_rate
+        self.webhook_delay = webhook_delay
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret.encode()
+        # Idempotency key -> (expiry, ChargeResult), oldest first: like a gateway's idempotency store,
+        # keys are forgotten a while after their first use, so a long load test does not grow it without bound
+        self.charges = OrderedDict()
+        self.idempotency_ttl = idempotency_ttl
+        self.max_idempotency_keys = max_idempotency_keys
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='simulated-payments')
+
+    def _call(self, deadline):
+        """Take ``latency``, or time out if the deadline comes first; sometimes fail"""
+        remaining = deadline.remaining()
+        if self.latency > remaining:
+            time.sleep(remaining)
+            raise ProviderTimeout(f'{self.name} did not answer in time')
+        time.sleep(self.latency)
+        if random.random() < self.error_rate:
+            raise ProviderError(f'{self.name} is unavailable')
+
+    def charge(self, reference, amount, idempotency_key, deadline):
+        self._call(deadline)
+        now = time.monotonic()
+        with self.lock:
+            while self.charges and next(iter(self.charges.values()))[0] <= now:
+                self.charges.popitem(last=False)
+            if idempotency_key in self.charges:
+                return self.charges[idempotency_key][1]  # A retry: same charge, no second webhook
+            result = ChargeResult('pending', f'sim_{uuid4().hex}')
+            self.charges[idempotency_key] = (now + self.idempotency_ttl, result)
+            while len(self.charges) > self.max_idempotency_keys:
+                self.charges.popitem(last=False)
+        declined = random.random() < self.failure_rate
+        event = {
+            'id': f'evt_{uuid4().hex}',
+            'type': 'charge.failed' if declined else 'charge.succeeded',
+            'data': {
+                'reference': reference,
+                'transaction_id': result.transaction_id,
+                'amount': str(amount),
+                'reason': 'Card declined' if declined else '',
+            },
+        }
+        self.send_webhook(json.dumps(event).encode())
+        return result
+
+    def refund(self, transaction_id, amount, idempotency_key, deadline):
+        self._call(deadline)
+        return ChargeResult('completed', f'sim_refund_{uuid4().hex}')
+
+    def sign(self, body):
+        return hmac.new(self.webhook_secret, body, hashlib.sha256).hexdigest()
+
+    def send_webhook(self, body):
+        headers = {'Content-Type': 'application/json', self.SIGNATURE_HEADER: self.sign(body)}
+        if self.webhook_url is None and not self.webhook_delay:
+            from .gateway import receive_webhook
+            receive_webhook(self.name, body, headers)
+            return
+
+        def deliver():
+            time.sleep(self.webhook_delay)
+            if self.webhook_url:
+                self.session.post(self.webhook_url, data=body, headers=headers, timeout=10)
+            else:
+                from django.db import connection
+                from .gateway import receive_webhook
+                try:
+                    receive_webhook(self.name, body, headers)
+                finally:
+                    connection.close()  # This thread's own connection
+        self.executor.submit(deliver)
+
+    def parse_webhook(self, body, headers):
+        signature = headers.get(self.SIGNATURE_HEADER, '')
+        if not hmac.compare_digest(signature, self.sign(body)):
+            raise WebhookError('Invalid signature')
+        try:
+            event = json.loads(body)
+            data = event['data']
+            kind = {'charge.succeeded': 'succeeded', 'charge.failed': 'failed'}[event['type']]
+            return WebhookEvent(
+                event['id'], kind, data['reference'], transaction_id=data.get('transaction_id'),
+                amount=Decimal(data['amount']) if data.get('amount') is not None else None,
+                reason=data.get('reason', ''),
+            )
+        except (ValueError, KeyError, TypeError, ArithmeticError) as e:
+            raise WebhookError(f'Malformed event: {e}') from e
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def get_provider(name=None):
+    """The shared instance of the provider ``name`` (default: PAYMENT_PROVIDER); raises KeyError for an unknown one"""
+    name = name or settings.PAYMENT_PROVIDER
+    with _providers_lock:
+        if name not in _providers:
+            config = settings.PAYMENT_PROVIDERS[name]
+            _providers[name] = import_string(config['BACKEND'])(name, **config.get('OPTIONS', {}))
+        return _providers[name]
+
+
+@receiver(setting_changed)
+def reset_providers(setting, **kwargs):
+    if setting in ('PAYMENT_PROVIDER', 'PAYMENT_PROVIDERS', 'PAYMENT_PROVIDER_POOL_SIZE'):
+        with _providers_lock:
+            _providers.clear()
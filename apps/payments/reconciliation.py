@@ -0,0 +1,266 @@
+"""
+Reconciling provider settlement files against our payments.
+
+A settlement file is a CSV with a header row and the columns
+``transaction_id``, ``amount`` and, optionally, ``status`` (any other
+columns are ignored). It is streamed, never read whole: rows are parsed one
+at a time and copied into a temporary table ``SETTLEMENT_CHUNK_SIZE`` rows
+at a time, so memory stays flat however many millions of lines the file has.
+The comparison is then a handful of set-based joins between that table and
+``orders_payment`` (whose ``transaction_id`` is indexed), run by Postgres
+rather than one lookup per row, and every disagreement is written to
+``ReconciliationMismatch`` with ``INSERT ... SELECT``:
+
+- ``malformed``: the row has no transaction ID or an unreadable amount
+- ``duplicate``: the transaction ID appears again further down the file;
+  only its first row is compared
+- ``missing``: settled, but no payment has the transaction ID
+- ``amount``: the settled amount differs from the payment's
+- ``status``: the settled status does not match the payment's (see
+  ``SETTLED_STATUSES``)
+- ``unsettled``: with a period, a completed or refunded payment created in it
+  that the file does not mention
+
+Mismatches are recorded kind by kind, in the order above, and in file order
+within a kind.
+Running a reconciliation again replaces its mismatches.
+"""
+import csv
+import io
+import logging
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from apps.orders.models import Payment
+from .models import Reconciliation, ReconciliationMismatch
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = ('transaction_id', 'amount')
+
+# Settlement status -> the payment status it confirms; other statuses are reported as status drift
+SETTLED_STATUSES = {
+    'settled': 'completed',
+    'paid': 'completed',
+    'succeeded': 'completed',
+    'refunded': 'refunded',
+    'failed': 'failed',
+}
+
+MAX_AMOUNT = Decimal('1e12')  # Fits settled_amount (14 digits, 2 decimal places)
+
+TEMP_TABLE = 'settlement_rows'
+
+
+class SettlementFileError(Exception):
+    """The file cannot be reconciled at all (e.g. a required column is missing)"""
+
+
+def get_chunk_size():
+    return getattr(settings, 'SETTLEMENT_CHUNK_SIZE', 10000)
+
+
+def parse_row(values, columns):
+    """``(transaction_id, amount, status)`` of a row, or raises ValueError saying what is wrong with it"""
+    def value(name):
+        index = columns.get(name)
+        return values[index].strip() if index is not None and index < len(values) else ''
+
+    transaction_id, amount, status = value('transaction_id'), value('amount'), value('status')
+    if not transaction_id:
+        raise ValueError('No transaction ID')
+    if len(transaction_id) > 255:
+        raise ValueError('Transaction ID longer than 255 characters')
+    try:
+        amount = Decimal(amount)
+    except InvalidOperation:
+        raise ValueError(f'Invalid amount {amount[:50]!r}')
+    if not amount.is_finite() or abs(amount) >= MAX_AMOUNT or amount != amount.quantize(Decimal('0.01')):
+        raise ValueError(f'Invalid amount {str(amount)[:50]!r}')
+    return transaction_id, amount, status.lower()[:50]
+
+
+def open_settlement(reconciliation):
+    """Text stream of an uploaded settlement file"""
+    return io.TextIOWrapper(reconciliation.file.open('rb'), encoding='utf-8-sig', newline='')
+
+
+def load_rows(cursor, reconciliation, stream, chunk_size):
+    """
+    Copy the rows of the CSV ``stream`` into the temporary table, one chunk per
+    ``COPY``, and record the malformed ones. Returns the number of data rows.
+    """
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    columns = {name.strip().lower(): index for index, name in enumerate(header or [])}
+    missing = [name for name in REQUIRED_COLUMNS if name not in columns]
+    if missing:
+        raise SettlementFileError(f"Missing column(s): {', '.join(missing)}")
+    has_status = 'status' in columns
+
+    buffer, buffered, malformed, rows = io.StringIO(), 0, [], 0
+    writer = csv.writer(buffer)
+
+    def flush():
+        nonlocal buffer, writer, buffered
+        if buffered:
+            buffer.seek(0)
+            cursor.copy_expert(
+                f'COPY {TEMP_TABLE} (line, transaction_id, amount, status) FROM STDIN '
+                'WITH (FORMAT csv, FORCE_NOT_NULL (status))', buffer
+            )
+        buffer, buffered = io.StringIO(), 0
+        writer = csv.writer(buffer)
+        if malformed:
+            ReconciliationMismatch.objects.bulk_create(malformed)
+            malformed.clear()
+
+    for values in reader:
+        if not any(value.strip() for value in values):
+            continue  # Blank line
+        rows += 1
+        try:
+            transaction_id, amount, status = parse_row(values, columns)
+        except ValueError as e:
+            raw_id = values[columns['transaction_id']] if columns['transaction_id'] < len(values) else ''
+            malformed.append(ReconciliationMismatch(
+                reconciliation=reconciliation, kind='malformed', line=reader.line_num,
+                transaction_id=raw_id.strip()[:255], detail=str(e)[:255],
+            ))
+        else:
+            writer.writerow([reader.line_num, transaction_id, amount, status if has_status else ''])
+            buffered += 1
+        if buffered >= chunk_size or len(malformed) >= chunk_size:
+            flush()
+    flush()
+    return rows
+
+
+def compare(cursor, reconciliation):
+    """Write the mismatches between the loaded rows and our payments"""
+    mismatches = ReconciliationMismatch._meta.db_table
+    payments = Payment._meta.db_table
+    insert = f"""
+        INSERT INTO {mismatches} (
+            reconciliation_id, kind, line, transaction_id, payment_id,
+            settled_amount, expected_amount, settled_status, payment_status, detail
+        )
+    """
+    pk = reconciliation.pk
+
+    # Duplicates leave the table, so each transaction below is compared once, against its first row
+    cursor.execute(f"""
+        WITH first AS (
+            SELECT transaction_id, min(line) AS line FROM {TEMP_TABLE}
+            GROUP BY transaction_id HAVING count(*) > 1
+        ), removed AS (
+            DELETE FROM {TEMP_TABLE} s USING first f
+            WHERE s.transaction_id = f.transaction_id AND s.line > f.line
+            RETURNING s.line, s.transaction_id, s.amount, s.status, f.line AS first_line
+        )
+        {insert}
+        SELECT %s, 'duplicate', line, transaction_id, NULL, amount, NULL, status, '', 'First settled on line ' || first_line
+        FROM removed ORDER BY line
+    """, [pk])
+    cursor.execute(f"""
+        {insert}
+        SELECT %s, 'missing', s.line, s.transaction_id, NULL, s.amount, NULL, s.status, '', ''
+        FROM {TEMP_TABLE} s
+        WHERE NOT EXISTS (SELECT 1 FROM {payments} p WHERE p.transaction_id = s.transaction_id)
+        ORDER BY s.line
+    """, [pk])
+    cursor.execute(f"""
+        {insert}
+        SELECT %s, 'amount', s.line, s.transaction_id, p.id, s.amount, p.amount, s.status, p.payment_status, ''
+        FROM {TEMP_TABLE} s JOIN {payments} p ON p.transaction_id = s.transaction_id
+        WHERE s.amount <> p.amount
+        ORDER BY s.line
+    """, [pk])
+
+    expected = ', '.join(['(%s, %s)'] * len(SETTLED_STATUSES))
+    cursor.execute(f"""
+        {insert}
+        SELECT %s, 'status', s.line, s.transaction_id, p.id, s.amount, p.amount, s.status, p.payment_status,
+               CASE WHEN m.expected IS NULL THEN 'Unknown settlement status' ELSE '' END
+        FROM {TEMP_TABLE} s
+        JOIN {payments} p ON p.transaction_id = s.transaction_id
+        LEFT JOIN (VALUES {expected}) AS m (settled, expected) ON m.settled = s.status
+        WHERE s.status <> '' AND m.expected IS DISTINCT FROM p.payment_status
+        ORDER BY s.line
+    """, [pk, *(value for pair in SETTLED_STATUSES.items() for value in pair)])
+
+    if reconciliation.period_start and reconciliation.period_end:
+        provider = 'AND p.provider = %s' if reconciliation.provider else ''
+        cursor.execute(f"""
+            {insert}
+            SELECT %s, 'unsettled', NULL, p.transaction_id, p.id, NULL, p.amount, '', p.payment_status, ''
+            FROM {payments} p
+            WHERE p.payment_status IN ('completed', 'refunded') AND p.transaction_id IS NOT NULL
+              AND p.created_at >= %s AND p.created_at < %s {provider}
+              AND NOT EXISTS (SELECT 1 FROM {TEMP_TABLE} s WHERE s.transaction_id = p.transaction_id)
+            ORDER BY p.created_at
+        """, [
+            pk, reconciliation.period_start, reconciliation.period_end,
+            *([reconciliation.provider] if reconciliation.provider else []),
+        ])
+
+
+def reconcile(reconciliation, stream, chunk_size=None):
+    """
+    Reconcile the settlement CSV ``stream`` (text, opened with ``newline=''``)
+    and record the outcome on ``reconciliation``. A file that cannot be read
+    marks it failed; database errors propagate.
+    """
+    chunk_size = chunk_size or get_chunk_size()
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            ReconciliationMismatch.objects.filter(reconciliation=reconciliation).delete()
+            cursor.execute(f"""
+                CREATE TEMPORARY TABLE {TEMP_TABLE} (
+                    line bigint NOT NULL, transaction_id varchar(255) NOT NULL,
+                    amount numeric(14, 2) NOT NULL, status varchar(50) NOT NULL
+                ) ON COMMIT DROP
+            """)
+            rows = load_rows(cursor, reconciliation, stream, chunk_size)
+            cursor.execute(f'CREATE INDEX ON {TEMP_TABLE} (transaction_id)')
+            cursor.execute(f'ANALYZE {TEMP_TABLE}')
+            compare(cursor, reconciliation)
+            # Dropped now, not at commit: the caller's transaction may run another reconciliation
+            cursor.execute(f'DROP TABLE {TEMP_TABLE}')
+
+            summary = dict(
+                ReconciliationMismatch.objects.filter(reconciliation=reconciliation)
+                .values_list('kind').annotate(count=Count('id')).order_by()
+            )
+            reconciliation.status, reconciliation.error = 'completed', ''
+            reconciliation.rows, reconciliation.summary = rows, summary
+            reconciliation.mismatches = sum(summary.values())
+            reconciliation.completed_at = timezone.now()
+            reconciliation.save(update_fields=[
+                'status', 'error', 'rows', 'summary', 'mismatches', 'completed_at'
+            ])
+    except (SettlementFileError, csv.Error, UnicodeDecodeError) as e:
+        logger.warning(f'Reconciliation {reconciliation.pk} of {reconciliation.source_name} failed: {e}')
+        Reconciliation.objects.filter(pk=reconciliation.pk).update(
+            status='failed', error=str(e), completed_at=timezone.now()
+        )
+        reconciliation.status, reconciliation.error = 'failed', str(e)
+    return reconciliation
+
+
+def run_reconciliation(reconciliation_id):
+    """Reconcile an uploaded settlement file; does nothing if it was already done or is being done"""
+    with transaction.atomic():
+        # Locked while it runs, so a second worker skips it rather than reconciling it twice
+        reconciliation = (
+            Reconciliation.objects.select_for_update(skip_locked=True)
+            .filter(pk=reconciliation_id, status='pending').first()
+        )
+        if reconciliation is None or not reconciliation.file:
+            return
+        with open_settlement(reconciliation) as stream:
+            reconcile(reconciliation, stream)
@@ -0,0 +1,33 @@
+from rest_framework import serializers
+
+from .models import Reconciliation, ReconciliationMismatch
+
+
+class ReconciliationSerializer(serializers.ModelSerializer):
+    """A settlement file upload and, once the worker has run it, its outcome"""
+    file = serializers.FileField(write_only=True)
+
+    class Meta:
+        model = Reconciliation
+        fields = (
+            'id', 'file', 'source_name', 'provider', 'period_start', 'period_end', 'status',
+            'rows', 'mismatches', 'summary', 'error', 'created_by', 'created_at', 'completed_at',
+        )
+        read_only_fields = (
+            'source_name', 'status', 'rows', 'mismatches', 'summary', 'error', 'created_by', 'created_at',
+            'completed_at',
+        )
+
+    def validate(self, data):
+        start, end = data.get('period_start'), data.get('period_end')
+        if (start is None) != (end is None):
+            raise serializers.ValidationError("period_start and period_end go together")
+        if start is not None and start >= end:
+            raise serializers.ValidationError({'period_end': "Must be after period_start"})
+        return data
+
+
+class ReconciliationMismatchSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReconciliationMismatch
+        exclude = ('reconciliation',)
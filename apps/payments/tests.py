@@ -1,3 +1,297 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from uuid import uuid4
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from apps.authentication.models import User
+from apps.orders.models import Order, OutboxMessage, Payment
+from apps.orders.outbox import process_outbox
+from apps.products.models import Category, Product
+from .models import ProcessedWebhook, Reconciliation
+from .providers import Deadline, SimulatedProvider, get_provider
+from .reconciliation import reconcile
+
+
+def simulated(**options):
+    """PAYMENT_PROVIDERS with the simulated provider configured with ``options``"""
+    return {'simulated': {'BACKEND': 'apps.payments.providers.SimulatedProvider', 'OPTIONS': options}}
+
+
+@override_settings(PAYMENT_PROVIDER='simulated', PAYMENT_PROVIDERS=simulated())
+class PaymentProviderTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='pass', role='seller'
+        )
+        cls.buyer = User.objects.create_user(
+            email='buyer@example.com', username='buyer', password='pass', role='buyer'
+        )
+        category = Category.objects.create(name='Fashion')
+        cls.product = Product.objects.create(
+            title='Jacket', description='Leather jacket', price=Decimal('80.00'),
+            category=category, seller=cls.seller, stock=10, requires_shipping=False
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.buyer)
+        self.order_id = self.client.post('/orders/orders/', {'product': str(self.product.pk), 'quantity': 1}).data['id']
+
+    def pay(self):
+        return self.client.post('/orders/payments/', {'order': self.order_id})
+
+    def payment(self):
+        return Payment.objects.get(order_id=self.order_id)
+
+    def order_status(self):
+        return Order.objects.get(pk=self.order_id).status
+
+    def post_webhook(self, event, signature=None):
+        body = json.dumps(event).encode()
+        signature = signature or get_provider('simulated').sign(body)
+        return self.client.generic(
+            'POST', '/payments/webhooks/simulated/', body,
+            content_type='application/json', HTTP_X_SIMULATED_SIGNATURE=signature
+        )
+
+    def event(self, payment, kind='charge.succeeded'):
+        return {
+            'id': f'evt_{uuid4().hex}',
+            'type': kind,
+            'data': {
+                'reference': f'{payment.pk}:{payment.attempt}',
+                'transaction_id': 'sim_test',
+                'amount': str(payment.amount),
+            },
+        }
+
+    def test_payment_completes_through_the_webhook(self):
+        response = self.pay()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['payment_status'], 'pending')
+        self.assertEqual(self.order_status(), 'pending')
+        self.assertEqual(self.pay().status_code, 409)
+
+        process_outbox()
+        payment = self.payment()
+        self.assertEqual((payment.payment_status, payment.provider, payment.attempt), ('completed', 'simulated', 1))
+        self.assertTrue(payment.transaction_id.startswith('sim_'))
+        self.assertEqual(self.order_status(), 'processing')
+        self.assertEqual(ProcessedWebhook.objects.count(), 1)
+        self.assertEqual(self.pay().status_code, 400)
+
+    def test_forged_webhook_is_rejected(self):
+        self.pay()
+        event = self.event(self.payment())
+        self.assertEqual(self.post_webhook(event, signature='forged').status_code, 400)
+        self.assertEqual(self.post_webhook({'id': 'evt_1', 'type': 'charge.succeeded'}).status_code, 400)
+        self.assertEqual(self.payment().payment_status, 'pending')
+
+    def test_redelivered_webhook_is_applied_once(self):
+        self.pay()
+        event = self.event(self.payment())
+        first = self.post_webhook(event)
+        self.assertEqual((first.status_code, first.data['duplicate']), (200, False))
+        second = self.post_webhook(event)
+        self.assertEqual((second.status_code, second.data['duplicate']), (200, True))
+        self.assertEqual(self.payment().payment_status, 'completed')
+        self.assertEqual(OutboxMessage.objects.filter(topic='payment.completed').count(), 1)
+
+    def test_declined_payment_is_retried_as_a_new_attempt(self):
+        with self.settings(PAYMENT_PROVIDERS=simulated(failure_rate=1)):
+            self.pay()
+            process_outbox()
+        payment = self.payment()
+        self.assertEqual((payment.payment_status, payment.failure_reason), ('failed', 'Card declined'))
+        self.assertEqual(self.order_status(), 'pending')
+
+        response = self.pay()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual((response.data['id'], response.data['attempt']), (str(payment.pk), 2))
+        # A late event for the first attempt changes nothing
+        self.post_webhook(self.event(payment))
+        self.assertEqual(self.payment().payment_status, 'pending')
+
+        process_outbox()
+        self.assertEqual(self.payment().payment_status, 'completed')
+        self.assertEqual(self.order_status(), 'processing')
+
+    def test_success_after_cancellation_is_refunded(self):
+        self.pay()
+        self.assertEqual(self.client.post(f'/orders/orders/{self.order_id}/cancel/').status_code, 200)
+        process_outbox()  # Charged; the webhook finds the order cancelled
+        self.assertEqual(self.payment().payment_status, 'completed')
+        self.assertEqual(list(OutboxMessage.objects.values_list('topic', flat=True)), ['payment.refund'])
+
+        process_outbox()
+        payment = self.payment()
+        self.assertEqual(payment.payment_status, 'refunded')
+        self.assertIn('cancelled', payment.failure_reason)
+        self.assertEqual(self.order_status(), 'cancelled')
+
+    def test_provider_errors_and_timeouts_are_retried(self):
+        self.pay()
+        for options in ({'error_rate': 1}, {'latency': 0.2}):
+            with self.settings(PAYMENT_PROVIDERS=simulated(**options), PAYMENT_PROVIDER_TIMEOUT=0.05):
+                OutboxMessage.objects.update(available_at=timezone.now())
+                self.assertEqual(process_outbox(), (0, 1))
+            self.assertEqual(self.payment().payment_status, 'pending')
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.attempts, 2)
+        self.assertIn('ProviderTimeout', message.last_error)
+
+        OutboxMessage.objects.update(available_at=timezone.now())
+        process_outbox()
+        self.assertEqual(self.payment().payment_status, 'completed')
+        self.assertEqual(self.order_status(), 'processing')
+
+    def test_simulated_idempotency_keys_are_bounded(self):
+        def charge(provider, key):
+            with mock.patch.object(provider, 'send_webhook'):
+                return provider.charge('ref', Decimal('1.00'), key, Deadline(1)).transaction_id
+
+        provider = SimulatedProvider('simulated', max_idempotency_keys=2)
+        first = charge(provider, 'a')
+        self.assertEqual(charge(provider, 'a'), first)  # A retry is the same charge
+        charge(provider, 'b')
+        charge(provider, 'c')
+        self.assertEqual(list(provider.charges), ['b', 'c'])
+        self.assertNotEqual(charge(provider, 'a'), first)  # Forgotten: the oldest key went first
+
+        provider = SimulatedProvider('simulated', idempotency_ttl=0)  # Keys expire at once
+        expired = charge(provider, 'd')
+        self.assertNotEqual(charge(provider, 'd'), expired)
+        self.assertEqual(list(provider.charges), ['d'])
+
+
+SETTLEMENT = """transaction_id,amount,status,fee
+tx_ok,80.00,settled,1.20
+tx_drift,79.50,settled,1.20
+tx_refunded,80.00,refunded,0
+
+tx_unknown,80.00,disputed,0
+tx_nobody,12.00,settled,0.10
+tx_ok,80.00,settled,1.20
+,5.00,settled,0
+tx_bad,lots,settled,0
+"""
+
+
+class SettlementReconciliationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(
+            email='admin@example.com', username='admin', password='pass', role='admin'
+        )
+        cls.buyer = User.objects.create_user(
+            email='buyer@example.com', username='buyer', password='pass', role='buyer'
+        )
+        category = Category.objects.create(name='Fashion')
+        product = Product.objects.create(
+            title='Jacket', description='Leather jacket', price=Decimal('80.00'),
+            category=category, seller=cls.admin, stock=10, requires_shipping=False
+        )
+        cls.payments = {}
+        for transaction_id in ('tx_ok', 'tx_drift', 'tx_refunded', 'tx_unknown', 'tx_unsettled'):
+            order = Order.objects.create(buyer=cls.buyer, product=product, quantity=1, total_price=Decimal('80.00'))
+            cls.payments[transaction_id] = Payment.objects.create(
+                order=order, amount=Decimal('80.00'), payment_status='completed',
+                transaction_id=transaction_id, provider='simulated'
+            )
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.client.force_authenticate(self.admin)
+
+    def reconcile(self, text, **fields):
+        reconciliation = Reconciliation.objects.create(source_name='settlement.csv', **fields)
+        return reconcile(reconciliation, io.StringIO(text, newline=''), chunk_size=2)
+
+    def mismatches(self, reconciliation):
+        return sorted(
+            (m.kind, m.line, m.transaction_id, m.detail)
+            for m in reconciliation.mismatch_rows.all()
+        )
+
+    def test_mismatches_are_reported(self):
+        now = timezone.now()
+        reconciliation = self.reconcile(
+            SETTLEMENT, period_start=now - timedelta(days=1), period_end=now + timedelta(days=1)
+        )
+        self.assertEqual(reconciliation.status, 'completed')
+        self.assertEqual(reconciliation.rows, 8)  # The blank line is not a row
+        self.assertEqual(self.mismatches(reconciliation), [
+            ('amount', 3, 'tx_drift', ''),
+            ('duplicate', 8, 'tx_ok', 'First settled on line 2'),
+            ('malformed', 9, '', 'No transaction ID'),
+            ('malformed', 10, 'tx_bad', "Invalid amount 'lots'"),
+            ('missing', 7, 'tx_nobody', ''),
+            ('status', 4, 'tx_refunded', ''),
+            ('status', 6, 'tx_unknown', 'Unknown settlement status'),
+            ('unsettled', None, 'tx_unsettled', ''),
+        ])
+        self.assertEqual(
+            reconciliation.summary,
+            {'amount': 1, 'duplicate': 1, 'malformed': 2, 'missing': 1, 'status': 2, 'unsettled': 1}
+        )
+        self.assertEqual(reconciliation.mismatches, 8)
+        drift = reconciliation.mismatch_rows.get(kind='amount')
+        self.assertEqual((drift.payment, drift.settled_amount, drift.expected_amount), (
+            self.payments['tx_drift'], Decimal('79.50'), Decimal('80.00')
+        ))
+
+        self.reconcile(SETTLEMENT)  # Without a period, nothing is reported as unsettled
+        self.assertEqual(Reconciliation.objects.latest('created_at').summary.get('unsettled'), None)
+
+    def test_file_without_required_columns_fails(self):
+        reconciliation = self.reconcile('id,total\ntx_ok,80.00\n')
+        self.assertEqual(reconciliation.status, 'failed')
+        self.assertEqual(reconciliation.error, 'Missing column(s): transaction_id, amount')
+        self.assertFalse(reconciliation.mismatch_rows.exists())
+
+    def test_command_reads_gzipped_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'settlement.csv.gz')
+            with gzip.open(path, 'wt', newline='') as settlement:
+                settlement.write(SETTLEMENT)
+            output = io.StringIO()
+            call_command('reconcile_settlements', path, '--chunk-size', '3', stdout=output)
+        reconciliation = Reconciliation.objects.get()
+        self.assertEqual((reconciliation.source_name, reconciliation.mismatches), ('settlement.csv.gz', 7))
+        self.assertIn('7 mismatches', output.getvalue())
+
+    def test_upload_is_reconciled_by_the_worker(self):
+        upload = SimpleUploadedFile('settlement.csv', SETTLEMENT.encode(), content_type='text/csv')
+        response = self.client.post('/payments/reconciliations/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], 'pending')
+        url = f"/payments/reconciliations/{response.data['id']}/"
+
+        process_outbox()
+        detail = self.client.get(url).data
+        self.assertEqual((detail['status'], detail['rows'], detail['mismatches']), ('completed', 8, 7))
+
+        page = self.client.get(f'{url}mismatches/', {'cursor': '', 'page_size': 3, 'count': 'false'}).data
+        self.assertEqual([m['kind'] for m in page['results']], ['malformed', 'malformed', 'duplicate'])
+        self.assertEqual(len(self.client.get(page['next']).data['results']), 3)
+        missing = self.client.get(f'{url}mismatches/', {'kind': 'missing'}).data
+        self.assertEqual([m['transaction_id'] for m in missing['results']], ['tx_nobody'])
+
+    def test_only_admins_reconcile(self):
+        self.client.force_authenticate(self.buyer)
+        upload = SimpleUploadedFile('settlement.csv', SETTLEMENT.encode())
+        self.assertEqual(self.client.post('/payments/reconciliations/', {'file': upload}).status_code, 403)
+        self.assertEqual(self.client.get('/payments/reconciliations/').status_code, 403)
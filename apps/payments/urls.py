@@ -0,0 +1,12 @@
+from django.urls import include, path
+from rest_framework.routers import DefaultRouter
+
+from .views import ReconciliationViewSet, webhook
+
+router = DefaultRouter()
+router.register(r'reconciliations', ReconciliationViewSet, basename='reconciliation')
+
+urlpatterns = [
+    path('webhooks/<str:provider>/', webhook, name='payment-webhook'),
+    path('', include(router.urls)),
+]
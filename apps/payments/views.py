@@ -1,3 +1,65 @@
-from django.shortcuts import render
+import logging
 
-# Create your views here.
+from django.db import transaction
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action, api_view, authentication_classes, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+
+from apps.authentication.views import IsAdminRole
+from apps.orders.outbox import publish
+from auraspotmarketplace1.pagination import KeysetPagination, StandardResultsSetPagination
+from .gateway import receive_webhook
+from .models import Reconciliation, ReconciliationMismatch
+from .providers import WebhookError
+from .serializers import ReconciliationMismatchSerializer, ReconciliationSerializer
+
+logger = logging.getLogger(__name__)
+
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])  # Authenticated by the provider's signature instead
+def webhook(request, provider):
+    """Payment outcome callback from a provider; redeliveries are acknowledged without being applied again"""
+    try:
+        applied = receive_webhook(provider, request.body, request.headers)
+    except WebhookError as e:
+        logger.warning(f"Rejected {provider} webhook: {e}")
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'received': True, 'duplicate': not applied})
+
+
+class MismatchPagination(KeysetPagination):
+    ordering = ('id',)  # The order they were found in (see apps.payments.reconciliation)
+
+
+class ReconciliationViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Settlement reconciliations (admins only): upload a provider's settlement
+    CSV, then read its mismatches once the worker has reconciled it
+    """
+    serializer_class = ReconciliationSerializer
+    permission_classes = [IsAdminRole]
+    pagination_class = StandardResultsSetPagination
+    queryset = Reconciliation.objects.order_by('-created_at')
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            # The file is stored under MEDIA_ROOT; the upload itself is spooled to disk, not held in memory
+            reconciliation = serializer.save(
+                source_name=serializer.validated_data['file'].name[:255], created_by=request.user
+            )
+            publish('payment.reconcile', {'reconciliation': str(reconciliation.pk)})
+        return Response(self.get_serializer(reconciliation).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['get'], pagination_class=MismatchPagination)
+    def mismatches(self, request, pk=None):
+        """The mismatches found (``?kind=`` filters; ``?cursor=`` pages in constant time)"""
+        mismatches = ReconciliationMismatch.objects.filter(reconciliation=self.get_object())
+        if request.query_params.get('kind'):
+            mismatches = mismatches.filter(kind=request.query_params['kind'])
+        page = self.paginate_queryset(mismatches.order_by('id'))
+        return self.get_paginated_response(ReconciliationMismatchSerializer(page, many=True).data)
@@ -0,0 +1,131 @@
+"""
+Title autocomplete for the search box.
+
+Suggestions come from the ``pg_trgm`` GiST index on ``Product.title``, ranked by
+word similarity so partial words and small typos still match. The index both
+finds the matches and returns them best first (a nearest-neighbour scan on
+the ``<->>`` word distance), so a common word that matches much of the
+catalog still reads only ``limit`` rows. Only the id, title and cover
+thumbnail (joined through ``Product.primary_image``) are loaded. Results for recently typed prefixes are kept in a small per-process
+LRU with a short TTL, since a handful of prefixes account for most keystrokes.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import FloatField, Func, Value
+
+from .models import Product
+
+MIN_TERM_LENGTH = 3  # Shorter terms have no trigram to search the index with
+MAX_TERM_LENGTH = 100
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+
+
+class TitleWordDistance(Func):
+    """
+    ``title <->> term``: one minus the word similarity of ``term`` in the
+    column. Unlike Django's ``TrigramWordDistance`` (``term <<-> title``) the
+    column comes first, which is the form a GiST index can order by.
+    """
+    function = ''
+    arg_joiner = ' <->> '
+    output_field = FloatField()
+
+    def __init__(self, expression, term, **extra):
+        super().__init__(expression, Value(term), **extra)
+
+
+class PrefixCache:
+    """Thread-safe LRU of recent suggestions whose entries expire after ``ttl`` seconds"""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_prefix_cache = None
+_prefix_cache_lock = threading.Lock()
+
+
+def get_prefix_cache():
+    global _prefix_cache
+    with _prefix_cache_lock:
+        if _prefix_cache is None:
+            _prefix_cache = PrefixCache(
+                getattr(settings, 'PRODUCT_AUTOCOMPLETE_CACHE_SIZE', 2048),
+                getattr(settings, 'PRODUCT_AUTOCOMPLETE_CACHE_TTL', 30),
+            )
+        return _prefix_cache
+
+
+def normalize_term(term):
+    return ' '.join((term or '').lower().split())[:MAX_TERM_LENGTH]
+
+
+def cover_thumbnail(image, derivatives):
+    """Storage path of the thumbnail of a cover image, falling back to the original"""
+    if not image:
+        return None
+    thumbnail = (derivatives or {}).get('thumbnail', {})
+    return thumbnail.get('webp') or thumbnail.get('jpeg') or image
+
+
+def suggest_titles(term, limit=DEFAULT_LIMIT, use_cache=True):
+    """
+    Up to ``limit`` ``{'id', 'title', 'thumbnail'}`` suggestions for ``term``,
+    best match first. ``thumbnail`` is a storage path or None.
+    """
+    term = normalize_term(term)
+    if len(term) < MIN_TERM_LENGTH:
+        return []
+
+    cache = get_prefix_cache()
+    key = (term, limit)
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    # Ties are broken by id so identical calls always suggest the same products
+    products = (
+        Product.objects
+        .filter(title__trigram_word_similar=term)
+        .annotate(distance=TitleWordDistance('title', term))
+        .order_by('distance', 'id')
+        .values_list('id', 'title', 'primary_image__image', 'primary_image__derivatives')[:limit]
+    )
+    suggestions = [
+        {'id': pk, 'title': title, 'thumbnail': cover_thumbnail(image, derivatives)}
+        for pk, title, image, derivatives in products
+    ]
+    if use_cache:
+        cache.set(key, suggestions)
+    return suggestions
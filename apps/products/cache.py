@@ -0,0 +1,158 @@
+"""
+Read-through cache for anonymous product list and detail responses, plus the
+category navigation tree.
+
+Entries are keyed on a version number plus the normalized request, so
+invalidation never has to find and delete keys: bumping the version makes
+every older entry unreachable and it simply ages out. Lists share one catalog
+version (any product, image or category change can alter any listing), while
+detail pages are keyed on a per-product version plus a category version, since
+``?expand=category`` embeds the category in them.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.response import Response
+
+CATALOG_VERSION_KEY = 'products:catalog:version'
+PRODUCT_VERSION_KEY = 'products:product:{pk}:version'
+CATEGORY_VERSION_KEY = 'products:category:version'
+CATEGORY_TREE_KEY = 'products:category_tree'
+HITS_KEY = 'products:cache:hits'
+MISSES_KEY = 'products:cache:misses'
+
+
+def get_cache():
+    return caches[getattr(settings, 'PRODUCT_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'PRODUCT_CACHE_TIMEOUT', 300)
+
+
+def _get_version(key):
+    cache = get_cache()
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so a lost version key can never resurrect old entries
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def invalidate_catalog():
+    """Invalidate every cached product listing once the current transaction commits"""
+    transaction.on_commit(lambda: _bump_version(CATALOG_VERSION_KEY))
+
+
+def invalidate_product(pk):
+    """Invalidate the cached detail page of one product and every listing"""
+    def bump():
+        _bump_version(PRODUCT_VERSION_KEY.format(pk=pk))
+        _bump_version(CATALOG_VERSION_KEY)
+    transaction.on_commit(bump)
+
+
+def invalidate_categories():
+    """Invalidate every listing and detail page, and drop the navigation tree, once the current transaction commits"""
+    def bump():
+        _bump_version(CATEGORY_VERSION_KEY)
+        _bump_version(CATALOG_VERSION_KEY)
+        get_cache().delete(CATEGORY_TREE_KEY)
+    transaction.on_commit(bump)
+
+
+def get_category_tree(build_tree):
+    """The full category tree, built with ``build_tree`` on a cache miss"""
+    cache = get_cache()
+    tree = cache.get(CATEGORY_TREE_KEY)
+    if tree is None:
+        _count(MISSES_KEY)
+        tree = build_tree()
+        cache.set(CATEGORY_TREE_KEY, tree, timeout=None)
+    else:
+        _count(HITS_KEY)
+    return tree
+
+
+def normalize_request(request):
+    """Canonical form of a request: scheme, host, path and sorted query parameters"""
+    params = sorted(
+        (key, value)
+        for key in request.query_params
+        for value in request.query_params.getlist(key)
+    )
+    query = '&'.join(f'{key}={value}' for key, value in params)
+    return f'{request.scheme}://{request.get_host()}{request.path}?{query}'
+
+
+def build_key(request, pk=None):
+    digest = hashlib.md5(normalize_request(request).encode('utf-8')).hexdigest()
+    if pk is None:
+        version = _get_version(CATALOG_VERSION_KEY)
+        return f'products:list:{version}:{digest}'
+    version = _get_version(PRODUCT_VERSION_KEY.format(pk=pk))
+    category_version = _get_version(CATEGORY_VERSION_KEY)
+    return f'products:detail:{pk}:{version}.{category_version}:{digest}'
+
+
+def _count(key):
+    cache = get_cache()
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def cached_response(request, build_response, pk=None, public=False):
+    """
+    Serve ``request`` from the cache, or call ``build_response`` and cache a
+    successful result. Only anonymous GET requests are cached unless the
+    response is ``public`` (identical for every user).
+    """
+    if request.method != 'GET' or (request.user.is_authenticated and not public):
+        return build_response()
+
+    cache = get_cache()
+    key = build_key(request, pk)
+    data = cache.get(key)
+    if data is not None:
+        _count(HITS_KEY)
+        return Response(data)
+
+    _count(MISSES_KEY)
+    response = build_response()
+    if response.status_code == 200:
+        cache.set(key, response.data, timeout=get_timeout())
+    return response
+
+
+def get_stats():
+    """Hit/miss counters, shared across processes when the cache backend is"""
+    cache = get_cache()
+    hits = cache.get(HITS_KEY) or 0
+    misses = cache.get(MISSES_KEY) or 0
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else None,
+        'timeout': get_timeout(),
+        'backend': settings.CACHES[getattr(settings, 'PRODUCT_CACHE_ALIAS', 'default')]['BACKEND'],
+    }
+
+
+def reset_stats():
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
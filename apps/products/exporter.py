@@ -0,0 +1,93 @@
+"""
+Streaming catalog export.
+
+Products are read with a server-side cursor (``values().iterator()``) and
+their image URLs are fetched with one query per chunk, so the export starts
+sending immediately and holds only one chunk in memory however big the
+catalog is.
+"""
+import csv
+import json
+from itertools import islice
+
+from django.core.files.storage import default_storage
+
+from .models import ProductImage
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+DEFAULT_CHUNK_SIZE = 2000
+
+EXPORT_FIELDS = [
+    'id', 'title', 'description', 'price', 'category_id', 'category__name', 'seller_id',
+    'stock', 'requires_shipping', 'weight', 'length', 'width', 'height',
+    'free_shipping', 'created_at', 'updated_at',
+]
+
+CSV_COLUMNS = [
+    'id', 'title', 'description', 'price', 'category', 'category_name', 'seller',
+    'stock', 'requires_shipping', 'weight', 'length', 'width', 'height',
+    'free_shipping', 'created_at', 'updated_at', 'images',
+]
+
+
+class Echo:
+    """File-like object whose write() returns the value, for streaming csv.writer output"""
+
+    def write(self, value):
+        return value
+
+
+def iter_export_rows(queryset, build_url=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield one dict per product, with its image URLs (primary first) joined per chunk"""
+    build_url = build_url or (lambda url: url)
+    rows = queryset.values(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+
+        images = {}
+        image_rows = (
+            ProductImage.objects
+            .filter(product_id__in=[row['id'] for row in chunk])
+            .order_by('product_id', '-is_primary', 'position', '-created_at')
+            .values_list('product_id', 'image')
+        )
+        for product_id, name in image_rows:
+            images.setdefault(product_id, []).append(build_url(default_storage.url(name)))
+
+        for row in chunk:
+            yield {
+                'id': str(row['id']),
+                'title': row['title'],
+                'description': row['description'],
+                'price': row['price'],
+                'category': str(row['category_id']),
+                'category_name': row['category__name'],
+                'seller': str(row['seller_id']),
+                'stock': row['stock'],
+                'requires_shipping': row['requires_shipping'],
+                'weight': row['weight'],
+                'length': row['length'],
+                'width': row['width'],
+                'height': row['height'],
+                'free_shipping': row['free_shipping'],
+                'created_at': row['created_at'].isoformat(),
+                'updated_at': row['updated_at'].isoformat(),
+                'images': images.get(row['id'], []),
+            }
+
+
+def stream_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_COLUMNS)  # Header goes out before the first query runs
+    for row in rows:
+        values = [row[column] for column in CSV_COLUMNS[:-1]]
+        values.append(' '.join(row['images']))
+        yield writer.writerow(['' if value is None else value for value in values])
+
+
+def stream_jsonl(rows):
+    for row in rows:
+        yield json.dumps(row, default=str) + '\n'
@@ -0,0 +1,73 @@
+"""
+Facet counts for product search results.
+
+Every facet is computed in a single pass: one GROUP BY category query whose
+rows carry conditional counts for the other facets, which are then summed in
+Python (there are only as many rows as matching categories).
+"""
+from decimal import Decimal
+
+from django.db.models import Count, Q
+
+# Price range facet boundaries; the last bucket is open-ended
+PRICE_BUCKETS = [Decimal('0'), Decimal('25'), Decimal('50'), Decimal('100'), Decimal('250'), Decimal('500')]
+
+
+def price_buckets():
+    """(key, lower, upper) for each price bucket; upper is None for the last one"""
+    bounds = PRICE_BUCKETS + [None]
+    return [
+        (f'{lower}-{upper}' if upper is not None else f'{lower}+', lower, upper)
+        for lower, upper in zip(bounds, bounds[1:])
+    ]
+
+
+def compute_facets(queryset):
+    """Facet counts for the products in ``queryset`` (already filtered/searched)"""
+    buckets = price_buckets()
+    aggregates = {
+        'total': Count('id'),
+        'free_shipping': Count('id', filter=Q(free_shipping=True)),
+        'requires_shipping': Count('id', filter=Q(requires_shipping=True)),
+        'in_stock': Count('id', filter=Q(stock__gt=0)),
+    }
+    for index, (_, lower, upper) in enumerate(buckets):
+        condition = Q(price__gte=lower)
+        if upper is not None:
+            condition &= Q(price__lt=upper)
+        aggregates[f'price_{index}'] = Count('id', filter=condition)
+
+    rows = list(
+        queryset.order_by().prefetch_related(None)
+        .values('category_id', 'category__name')
+        .annotate(**aggregates)
+    )
+
+    total = sum(row['total'] for row in rows)
+
+    def flag(name):
+        matched = sum(row[name] for row in rows)
+        return {'true': matched, 'false': total - matched}
+
+    return {
+        'count': total,
+        'categories': sorted(
+            (
+                {'id': str(row['category_id']), 'name': row['category__name'], 'count': row['total']}
+                for row in rows
+            ),
+            key=lambda category: (-category['count'], category['name']),
+        ),
+        'price': [
+            {
+                'key': key,
+                'min': str(lower),
+                'max': str(upper) if upper is not None else None,
+                'count': sum(row[f'price_{index}'] for row in rows),
+            }
+            for index, (key, lower, upper) in enumerate(buckets)
+        ],
+        'free_shipping': flag('free_shipping'),
+        'requires_shipping': flag('requires_shipping'),
+        'in_stock': flag('in_stock'),
+    }
@@ -0,0 +1,132 @@
+"""
+Derivative pipeline for product images.
+
+Uploaded originals are often multi-megabyte screenshots, so each ProductImage
+gets a few fixed-size WebP and JPEG renditions generated in a background
+worker pool once the upload has been committed. Storage paths are recorded in
+``ProductImage.derivatives`` and exposed as URLs by ``ProductImageSerializer``.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Name -> longest edge in pixels
+DERIVATIVE_SIZES = {
+    'thumbnail': 160,
+    'card': 480,
+    'detail': 1200,
+}
+
+DERIVATIVE_FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'PRODUCT_IMAGE_WORKERS', 2),
+            thread_name_prefix='product-images',
+        )
+    return _executor
+
+
+def derivative_path(image_id, size, fmt):
+    return f'products/derivatives/{image_id}/{size}.{fmt}'
+
+
+def render_derivatives(source):
+    """Render every size/format of an opened PIL image; returns {size: {fmt: bytes, ...}}"""
+    source = ImageOps.exif_transpose(source)
+    has_alpha = source.mode in ('RGBA', 'LA') or (source.mode == 'P' and 'transparency' in source.info)
+    rendered = {}
+    for size, edge in DERIVATIVE_SIZES.items():
+        resized = source.copy()
+        resized.thumbnail((edge, edge), Image.Resampling.LANCZOS)  # Never upscales
+        outputs = {'width': resized.width, 'height': resized.height}
+        for fmt, options in DERIVATIVE_FORMATS.items():
+            if fmt == 'webp' and has_alpha:
+                frame = resized.convert('RGBA')
+            else:
+                frame = resized.convert('RGB')
+            buffer = BytesIO()
+            frame.save(buffer, **options)
+            outputs[fmt] = buffer.getvalue()
+        rendered[size] = outputs
+    return rendered
+
+
+def generate_derivatives(image_id):
+    """Build and store the derivatives of one ProductImage, then record their paths"""
+    from .models import Product, ProductImage
+    from . import cache as product_cache
+
+    try:
+        image = ProductImage.objects.get(pk=image_id)
+    except ProductImage.DoesNotExist:
+        return None
+
+    with image.image.open('rb') as original:
+        with Image.open(original) as source:
+            rendered = render_derivatives(source)
+
+    derivatives = {}
+    for size, outputs in rendered.items():
+        derivatives[size] = {'width': outputs['width'], 'height': outputs['height']}
+        for fmt in DERIVATIVE_FORMATS:
+            path = derivative_path(image.pk, size, fmt)
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            derivatives[size][fmt] = default_storage.save(path, ContentFile(outputs[fmt]))
+
+    # Queryset update: no signals, so saving does not re-queue the image
+    ProductImage.objects.filter(pk=image.pk).update(derivatives=derivatives)
+    Product.objects.filter(pk=image.product_id).update(updated_at=timezone.now())
+    product_cache.invalidate_product(image.product_id)
+    return derivatives
+
+
+def _generate(image_id):
+    try:
+        generate_derivatives(image_id)
+    except Exception as e:
+        logger.error(f"Failed to generate derivatives for image {image_id}: {str(e)}", exc_info=True)
+
+
+def _run(image_id):
+    """Worker thread entry point; the thread owns its database connection"""
+    close_old_connections()
+    try:
+        _generate(image_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_derivatives(image_id):
+    """Queue derivative generation for after the current transaction commits"""
+    if getattr(settings, 'PRODUCT_IMAGE_DERIVATIVES_ASYNC', True):
+        transaction.on_commit(lambda: get_executor().submit(_run, image_id))
+    else:
+        transaction.on_commit(lambda: _generate(image_id))
+
+
+def delete_derivatives(derivatives):
+    """Remove stored derivative files (used when their image is deleted)"""
+    for outputs in (derivatives or {}).values():
+        for fmt in DERIVATIVE_FORMATS:
+            path = outputs.get(fmt)
+            if path and default_storage.exists(path):
+                default_storage.delete(path)
@@ -0,0 +1,164 @@
+"""
+Streaming bulk product import for sellers.
+
+Rows are read one line at a time from a CSV or JSONL file, validated in
+batches with the same shipping rules as ``ProductSerializer`` and inserted
+with ``bulk_create`` one chunk per transaction, so memory use depends on the
+chunk size rather than on the size of the file.
+"""
+import csv
+import json
+
+from django.db import transaction
+
+from . import cache as product_cache
+from .models import Category, Product
+from .serializers import ProductImportRowSerializer
+
+FORMATS = ('csv', 'jsonl')
+DEFAULT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportFileError(Exception):
+    """The rest of the file cannot be read (e.g. it is not UTF-8)"""
+
+
+def detect_format(filename, requested=None):
+    """Import format from an explicit choice or the file extension"""
+    if requested:
+        return requested.lower() if requested.lower() in FORMATS else None
+    name = (filename or '').lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    return None
+
+
+def decode_lines(fileobj):
+    """Text lines of a binary (or text) file object; raises ImportFileError on the first line that is not UTF-8"""
+    for line_number, line in enumerate(fileobj, start=1):
+        if isinstance(line, bytes):
+            try:
+                line = line.decode('utf-8-sig')
+            except UnicodeDecodeError:
+                raise ImportFileError(f'Line {line_number} is not valid UTF-8; save the file as UTF-8 and upload it again')
+        yield line
+
+
+def iter_rows(fileobj, fmt):
+    """
+    Yield ``(row_number, data)`` pairs from a binary file object, one line at a
+    time. Rows that cannot be parsed yield an error message instead of data;
+    a file that cannot be read any further raises ImportFileError.
+    """
+    lines = decode_lines(fileobj)
+
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        try:
+            for row_number, row in enumerate(reader, start=1):
+                # Empty cells mean "not provided" so defaults and optional fields apply
+                yield row_number, {key: value for key, value in row.items() if key and value not in ('', None)}
+        except csv.Error as e:
+            raise ImportFileError(f'Unreadable CSV after row {reader.line_num - 1}: {e}')
+        return
+
+    for row_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as e:
+            yield row_number, f'Invalid JSON: {e}'
+            continue
+        if not isinstance(data, dict):
+            yield row_number, 'Each line must be a JSON object'
+            continue
+        yield row_number, data
+
+
+class ProductImporter:
+    """Validate and insert products from a row stream, collecting a per-row error report"""
+
+    def __init__(self, seller, chunk_size=DEFAULT_CHUNK_SIZE, max_errors=MAX_REPORTED_ERRORS):
+        self.seller = seller
+        self.chunk_size = chunk_size
+        self.max_errors = max_errors
+        self.rows = 0
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        self.file_error = None
+        self.known_categories = set()
+
+    def add_error(self, row_number, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': row_number, 'errors': errors})
+
+    def run(self, rows):
+        chunk = []
+        try:
+            for row_number, data in rows:
+                self.rows += 1
+                if isinstance(data, str):
+                    self.add_error(row_number, {'non_field_errors': [data]})
+                    continue
+                chunk.append((row_number, data))
+                if len(chunk) >= self.chunk_size:
+                    self.import_chunk(chunk)
+                    chunk = []
+        except ImportFileError as e:
+            # The rows read before the unreadable line are still imported, and the report says where it stopped
+            self.file_error = str(e)
+        if chunk:
+            self.import_chunk(chunk)
+
+        if self.created:
+            product_cache.invalidate_catalog()
+        return self.report()
+
+    def import_chunk(self, chunk):
+        validated = []
+        for row_number, data in chunk:
+            serializer = ProductImportRowSerializer(data=data)
+            if serializer.is_valid():
+                validated.append((row_number, serializer.validated_data))
+            else:
+                self.add_error(row_number, serializer.errors)
+
+        # One query per chunk for categories not seen in earlier chunks
+        unknown = {data['category'] for _, data in validated} - self.known_categories
+        if unknown:
+            self.known_categories.update(Category.objects.filter(pk__in=unknown).values_list('pk', flat=True))
+
+        products = []
+        for row_number, data in validated:
+            if data['category'] not in self.known_categories:
+                self.add_error(row_number, {'category': [f"Category {data['category']} does not exist"]})
+                continue
+            data = dict(data)
+            products.append(Product(category_id=data.pop('category'), seller=self.seller, **data))
+
+        if products:
+            with transaction.atomic():
+                Product.objects.bulk_create(products)
+            self.created += len(products)
+
+    def report(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+            'errors_omitted': self.failed - len(self.errors),  # Failed rows beyond max_errors, not listed
+            'file_error': self.file_error,
+        }
+
+
+def import_products(fileobj, fmt, seller, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Import every row of ``fileobj`` for ``seller`` and return the report"""
+    return ProductImporter(seller, chunk_size=chunk_size).run(iter_rows(fileobj, fmt))
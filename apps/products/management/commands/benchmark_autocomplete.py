@@ -0,0 +1,106 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from apps.authentication.models import User
+from apps.products.autocomplete import get_prefix_cache, suggest_titles
+from apps.products.models import Category, Product
+from .benchmark_search import WORDS, _Abort
+
+CONSONANTS = 'bcdfghjklmnprstvwxz'
+VOWELS = 'aeiouy'
+
+
+def percentile(timings, fraction):
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+class Command(BaseCommand):
+    help = 'Measure title autocomplete latency (p50/p95/p99) on a seeded catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000000, help='Number of products to seed')
+        parser.add_argument('--queries', type=int, default=2000, help='Autocomplete calls per phase')
+        parser.add_argument('--limit', type=int, default=8)
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded catalog instead of rolling back')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                brands = self.seed(options['products'])
+                self.run(brands, options['queries'], options['limit'])
+                if not options['keep']:
+                    raise _Abort()
+        except _Abort:
+            self.stdout.write('Seeded catalog rolled back')
+
+    def seed(self, count):
+        rng = random.Random(42)
+        seller = User.objects.create_user(
+            email='bench-seller@example.com', username='benchseller',
+            password=None, role='seller', first_name='Bench', last_name='Seller'
+        )
+        category = Category.objects.create(name='Bench Autocomplete')
+        # Made-up brand names give the catalog a realistic spread of distinct words
+        brands = sorted({
+            ''.join(rng.choice(CONSONANTS) + rng.choice(VOWELS) for _ in range(rng.randint(2, 4)))
+            for _ in range(max(count // 50, 100))
+        })
+
+        batch = []
+        for i in range(count):
+            words = [rng.choice(brands)] + rng.choices(WORDS, k=rng.randint(2, 4))
+            batch.append(Product(
+                title=f"{' '.join(words).title()} {rng.randint(100, 9999)}",
+                description='',
+                price=Decimal(rng.randint(100, 100000)) / 100,
+                category=category,
+                seller=seller,
+                stock=rng.randint(0, 500),
+                requires_shipping=False,
+            ))
+            if len(batch) == 5000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Product.objects.bulk_create(batch)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE products_product')
+        self.stdout.write(f'Seeded {count} products ({len(brands)} brands)')
+        return brands
+
+    def run(self, brands, queries, limit):
+        rng = random.Random(7)
+
+        def typed_prefix():
+            # What a user has typed so far: a prefix of a brand or a common word, sometimes two words
+            word = rng.choice(brands) if rng.random() < 0.7 else rng.choice(WORDS)
+            prefix = word[:rng.randint(3, len(word))] if len(word) > 3 else word
+            if rng.random() < 0.2:
+                prefix = f'{rng.choice(WORDS)} {prefix}'
+            return prefix
+
+        cold = [typed_prefix() for _ in range(queries)]
+        # Keystroke traffic is skewed: a few hot prefixes make up most requests
+        hot = cold[:50]
+        mixed = [rng.choice(hot) if rng.random() < 0.8 else typed_prefix() for _ in range(queries)]
+
+        cache = get_prefix_cache()
+        for label, terms, use_cache in [('cold (no LRU)', cold, False), ('mixed (LRU)', mixed, True)]:
+            cache.clear()
+            timings = []
+            for term in terms:
+                start = time.perf_counter()
+                suggest_titles(term, limit, use_cache=use_cache)
+                timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            self.stdout.write(
+                f'{label:14} n={len(timings):<6} p50={statistics.median(timings):7.2f}ms '
+                f'p95={percentile(timings, 0.95):7.2f}ms p99={percentile(timings, 0.99):7.2f}ms '
+                f'max={timings[-1]:7.2f}ms'
+            )
@@ -0,0 +1,106 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from rest_framework import filters
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from apps.authentication.models import User
+from apps.products.models import Category, Product
+from apps.products.search import search_products
+from apps.products.views import ProductViewSet
+
+WORDS = [
+    'wireless', 'organic', 'leather', 'vintage', 'ceramic', 'bamboo', 'cotton', 'steel',
+    'portable', 'handmade', 'waterproof', 'compact', 'premium', 'classic', 'modern',
+    'lamp', 'serum', 'jacket', 'speaker', 'mug', 'blanket', 'backpack', 'candle',
+    'headphones', 'moisturizer', 'sneakers', 'vase', 'watch', 'charger', 'notebook',
+    'rustic', 'minimal', 'travel', 'kitchen', 'garden', 'outdoor', 'kids', 'gift',
+]
+
+
+class _Abort(Exception):
+    """Raised to roll back the seeded catalog once the benchmark is done"""
+
+
+class Command(BaseCommand):
+    help = 'Compare full-text product search with the legacy ILIKE search on a seeded catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50000, help='Number of products to seed')
+        parser.add_argument('--runs', type=int, default=20, help='Timed runs per query')
+        parser.add_argument('--page-size', type=int, default=10)
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded catalog instead of rolling back')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.seed(options['products'])
+                self.run(options['runs'], options['page_size'])
+                if not options['keep']:
+                    raise _Abort()
+        except _Abort:
+            self.stdout.write('Seeded catalog rolled back')
+
+    def seed(self, count):
+        rng = random.Random(42)
+        seller = User.objects.create_user(
+            email='bench-seller@example.com', username='benchseller',
+            password=None, role='seller', first_name='Bench', last_name='Seller'
+        )
+        categories = [
+            Category.objects.create(name=f'Bench {name}')
+            for name in ['Electronics', 'Home & Decor', 'Fashion', 'Skin Care', 'Outdoors']
+        ]
+
+        batch = []
+        for i in range(count):
+            batch.append(Product(
+                title=' '.join(rng.choices(WORDS, k=rng.randint(3, 6))).title(),
+                description=' '.join(rng.choices(WORDS, k=rng.randint(20, 40))),
+                price=Decimal(rng.randint(100, 100000)) / 100,
+                category=rng.choice(categories),
+                seller=seller,
+                stock=rng.randint(0, 500),
+                requires_shipping=False,
+            ))
+            if len(batch) == 2000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Product.objects.bulk_create(batch)
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE products_product')
+        self.stdout.write(f'Seeded {count} products')
+
+    def run(self, runs, page_size):
+        factory = APIRequestFactory()
+        view = ProductViewSet()
+        legacy_backend = filters.SearchFilter()
+        base = Product.objects.all()
+
+        for term in ['lamp', 'wireless speaker', 'handmade ceramic vase', 'electronics']:
+            request = Request(factory.get('/products/products/', {'search': term}))
+            paths = {
+                'legacy ILIKE': lambda: legacy_backend.filter_queryset(request, base, view).order_by('-created_at'),
+                'full-text': lambda: search_products(base, term).order_by('-search_rank', '-created_at'),
+            }
+            for label, build in paths.items():
+                timings = []
+                for _ in range(runs):
+                    start = time.perf_counter()
+                    queryset = build()
+                    total = queryset.count()
+                    list(queryset[:page_size])
+                    timings.append((time.perf_counter() - start) * 1000)
+                timings.sort()
+                p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+                self.stdout.write(
+                    f'{term!r:28} {label:14} matches={total:<8} '
+                    f'median={statistics.median(timings):8.2f}ms p95={p95:8.2f}ms'
+                )
@@ -0,0 +1,41 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from apps.products.images import generate_derivatives
+from apps.products.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnail/card/detail renditions for product images that do not have them yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Regenerate derivatives for every image')
+        parser.add_argument('--workers', type=int, default=4, help='Number of worker threads')
+
+    def handle(self, *args, **options):
+        images = ProductImage.objects.order_by('created_at')
+        if not options['all']:
+            images = images.filter(derivatives={})
+        image_ids = list(images.values_list('id', flat=True))
+        self.stdout.write(f'Generating derivatives for {len(image_ids)} images')
+
+        def run(image_id):
+            close_old_connections()
+            try:
+                return generate_derivatives(image_id)
+            finally:
+                close_old_connections()
+
+        failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {executor.submit(run, image_id): image_id for image_id in image_ids}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f'Image {futures[future]}: {e}')
+
+        self.stdout.write(self.style.SUCCESS(f'Done: {len(image_ids) - failed} generated, {failed} failed'))
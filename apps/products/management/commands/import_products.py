@@ -0,0 +1,47 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.authentication.models import User
+from apps.products.importer import DEFAULT_CHUNK_SIZE, FORMATS, MAX_REPORTED_ERRORS, detect_format, import_products
+
+
+class Command(BaseCommand):
+    help = 'Stream a CSV or JSONL file of products into the catalog of a seller'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file to import')
+        parser.add_argument('--seller', required=True, help='Email of the seller who will own the products')
+        parser.add_argument('--format', choices=FORMATS, help='File format (default: from the extension)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument(
+            '--report',
+            help=f'Write the JSON report to this file; it lists the first {MAX_REPORTED_ERRORS} failed rows '
+                 'and counts the rest in errors_omitted'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            seller = User.objects.get(email=options['seller'], role__in=['seller', 'admin'])
+        except User.DoesNotExist:
+            raise CommandError(f"No seller with email {options['seller']}")
+
+        fmt = detect_format(options['path'], options['format'])
+        if fmt is None:
+            raise CommandError('Could not detect the file format; pass --format csv or --format jsonl')
+
+        with open(options['path'], 'rb') as fileobj:
+            report = import_products(fileobj, fmt, seller, chunk_size=options['chunk_size'])
+
+        if options['report']:
+            with open(options['report'], 'w') as output:
+                json.dump(report, output, indent=2, default=str)
+
+        for error in report['errors'][:20]:
+            self.stderr.write(f"Row {error['row']}: {error['errors']}")
+        if report['errors_omitted']:
+            self.stderr.write(f"{report['errors_omitted']} more failed rows are not listed in the report")
+        summary = f"{report['rows']} rows: {report['created']} created, {report['failed']} failed"
+        if report['file_error']:
+            raise CommandError(f"{report['file_error']} ({summary})")
+        self.stdout.write(self.style.SUCCESS(summary))
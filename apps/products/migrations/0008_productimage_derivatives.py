@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-17 05:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_product_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=dict, help_text='Storage paths of resized WebP/JPEG renditions, filled in by a background worker'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.6 on 2026-10-17 05:55
+
+from django.db import migrations, models
+
+
+def populate_paths(apps, schema_editor):
+    """Compute materialized paths for existing categories, parents before children"""
+    Category = apps.get_model('products', 'Category')
+    categories = {c.pk: c for c in Category.objects.all()}
+    resolved = {}
+
+    def resolve(category, seen=()):
+        if category.pk in resolved:
+            return resolved[category.pk]
+        parent = categories.get(category.parent_id)
+        if parent is None or parent.pk in seen:
+            path, depth = f'{category.pk.hex}/', 0
+        else:
+            parent_path, parent_depth = resolve(parent, seen + (category.pk,))
+            path, depth = f'{parent_path}{category.pk.hex}/', parent_depth + 1
+        resolved[category.pk] = (path, depth)
+        return path, depth
+
+    for category in categories.values():
+        category.path, category.depth = resolve(category)
+    Category.objects.bulk_update(categories.values(), ['path', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_productimage_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=1024),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['path'], name='category_path_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+    ]
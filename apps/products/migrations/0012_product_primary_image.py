@@ -0,0 +1,44 @@
+# Generated by Django 5.1.6 on 2026-10-17 06:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_primary_images(apps, schema_editor):
+    """Point every product at its cover image, making sure exactly one image is primary"""
+    Product = apps.get_model('products', 'Product')
+    ProductImage = apps.get_model('products', 'ProductImage')
+    covers = (
+        ProductImage.objects.order_by('product_id', '-is_primary', '-created_at')
+        .distinct('product_id')
+        .values_list('product_id', 'id')
+    )
+    for product_id, image_id in covers.iterator():
+        ProductImage.objects.filter(product_id=product_id).exclude(pk=image_id).filter(is_primary=True).update(is_primary=False)
+        ProductImage.objects.filter(pk=image_id, is_primary=False).update(is_primary=True)
+        Product.objects.filter(pk=product_id).update(primary_image_id=image_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_product_title_trgm'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='productimage',
+            options={'ordering': ['-is_primary', 'position', '-created_at']},
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='primary_image',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='products.productimage'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='position',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_primary_images, migrations.RunPython.noop),
+    ]
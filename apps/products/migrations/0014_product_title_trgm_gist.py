@@ -0,0 +1,24 @@
+# Generated by Django 5.1.6 on 2026-10-17 07:55
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_product_filter_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_title_trgm_gin',
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GistIndex(fields=['title'], name='product_title_trgm_gist', opclasses=['gist_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,43 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# The composite indexes of 0013 lead with these columns, so they serve every
+# lookup (and ON DELETE CASCADE scan) the single-column indexes did. Only the
+# indexes are dropped: a plain AlterField would also drop and re-validate the
+# foreign key constraints, scanning the whole table.
+DROP_INDEXES = """
+DROP INDEX IF EXISTS products_product_category_id_9b594869;
+DROP INDEX IF EXISTS products_product_seller_id_07afb1e3;
+"""
+
+CREATE_INDEXES = """
+CREATE INDEX IF NOT EXISTS products_product_category_id_9b594869 ON products_product (category_id);
+CREATE INDEX IF NOT EXISTS products_product_seller_id_07afb1e3 ON products_product (seller_id);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0014_product_title_trgm_gist'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunSQL(DROP_INDEXES, CREATE_INDEXES)],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='product',
+                    name='category',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='products', to='products.category'),
+                ),
+                migrations.AlterField(
+                    model_name='product',
+                    name='seller',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='products', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+    ]
@@ -3,6 +3,19 @@ from apps.authentication.models import User
 from uuid import uuid4
 from django.core.validators import MinValueValidator
 from django.core.exceptions import ValidationError
+from django.contrib.postgres.indexes import GinIndex, GistIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Substr
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from django.db import transaction
+from django.utils import timezone
+from . import cache as product_cache
+from . import images as product_images
+
+# Text search configuration used for the product search vector and queries
+SEARCH_CONFIG = 'english'
 
 class Category(models.Model):
     """Product Categories (e.g., Skin Care, Fashion, Home & Decor)"""
@@ -10,26 +23,87 @@ class Category(models.Model):
     name = models.CharField(max_length=255, unique=True)
     description = models.TextField(blank=True, null=True)
     parent = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='subcategories')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # Materialized path: ancestor ids followed by this category's id, e.g. "<root>/<child>/".
+    # All descendants of a category share its path as a prefix.
+    path = models.CharField(max_length=1024, default='', editable=False)
+    depth = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Prefix (LIKE 'path%') lookups for descendant queries
+            models.Index(fields=['path'], name='category_path_idx', opclasses=['varchar_pattern_ops']),
+        ]
 
     def __str__(self):
         return self.name
 
+    def build_path(self):
+        """Path and depth this category should have under its current parent"""
+        own = f'{self.pk.hex}/'
+        if self.parent_id is None:
+            return own, 0
+        parent = Category.objects.only('path', 'depth').get(pk=self.parent_id)
+        return parent.path + own, parent.depth + 1
+
+    def save(self, *args, **kwargs):
+        """Keep the materialized path of this category and its subtree in sync"""
+        old = None
+        if not self._state.adding:
+            old = Category.objects.filter(pk=self.pk).values('path', 'depth').first()
+
+        path, depth = self.build_path()
+        if old and old['path'] and path != old['path'] and path.startswith(old['path']):
+            raise ValidationError({'parent': 'A category cannot be moved under one of its own subcategories'})
+        self.path, self.depth = path, depth
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if old and old['path'] and old['path'] != path:
+                # Moved: rewrite the path prefix of every descendant in one statement
+                Category.objects.filter(path__startswith=old['path']).exclude(pk=self.pk).update(
+                    path=Concat(Value(path), Substr('path', len(old['path']) + 1)),
+                    depth=F('depth') + (depth - old['depth']),
+                    updated_at=timezone.now(),
+                )
+
+    def get_descendants(self, include_self=True):
+        """This category's subtree, resolved with a single indexed prefix query"""
+        descendants = Category.objects.filter(path__startswith=self.path)
+        if not include_self:
+            descendants = descendants.exclude(pk=self.pk)
+        return descendants
+
 class ProductImage(models.Model):
     """Model for storing multiple images per product"""
     id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
     product = models.ForeignKey('Product', on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to="products/")
     is_primary = models.BooleanField(default=False)
+    position = models.PositiveIntegerField(default=0)  # Display order set by reorder_images
+    derivatives = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Storage paths of resized WebP/JPEG renditions, filled in by a background worker"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
-        ordering = ['-is_primary', '-created_at']
+        ordering = ['-is_primary', 'position', '-created_at']
         
     def save(self, *args, **kwargs):
-        if self.is_primary:
-            # Set all other images of this product to not primary
-            ProductImage.objects.filter(product=self.product).update(is_primary=False)
-        super().save(*args, **kwargs)
+        """Keep Product.primary_image pointing at the product's primary image"""
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if self.is_primary:
+                # Locks the product row, so concurrent primary changes are applied one at a time
+                Product.objects.filter(pk=self.product_id).update(primary_image=self)
+                # Only the previous primary image needs demoting, not every sibling
+                ProductImage.objects.filter(product_id=self.product_id, is_primary=True).exclude(pk=self.pk).update(is_primary=False)
+            elif not adding:
+                Product.objects.filter(pk=self.product_id, primary_image=self).update(primary_image=None)
 
 class Product(models.Model):
     """Product Model for Sellers to List Items"""
@@ -37,9 +111,14 @@ class Product(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
-    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
-    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='products')
+    # No single-column indexes: product_category_price_idx and product_seller_created_idx lead with them
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products', db_index=False)
+    seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='products', db_index=False)
     stock = models.PositiveIntegerField(default=0)
+    # Denormalized cover image, so listings can render it without querying the images
+    primary_image = models.ForeignKey(
+        ProductImage, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
     
     # Shipping related fields
     requires_shipping = models.BooleanField(
@@ -86,6 +165,30 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Full-text search document, kept in sync by Postgres as a stored generated column
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('title', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='product_search_vector_gin'),
+            # Keyset pagination order
+            models.Index(fields=['-created_at', '-id'], name='product_created_id_idx'),
+            # Title autocomplete (pg_trgm word similarity); GiST, not GIN, so it can also return the best matches first
+            GistIndex(fields=['title'], name='product_title_trgm_gist', opclasses=['gist_trgm_ops']),
+            # ProductFilter: category with a price range or price ordering
+            models.Index(fields=['category', 'price'], name='product_category_price_idx'),
+            # A seller's products, newest first (seller dashboard, export, seller filter);
+            # also the entry point for every order/shipment lookup by product__seller
+            models.Index(fields=['seller', '-created_at'], name='product_seller_created_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -122,3 +225,52 @@ class Product(models.Model):
             "mass_unit": "lb"
         }
 
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_cache(sender, instance, **kwargs):
+    """Drop cached responses that render this product"""
+    product_cache.invalidate_product(instance.pk)
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_product_image_cache(sender, instance, **kwargs):
+    """Images are nested in product responses, so they invalidate their product and bump its ETag"""
+    Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+    product_cache.invalidate_product(instance.product_id)
+
+@receiver(post_save, sender=ProductImage)
+def queue_image_derivatives(sender, instance, created, **kwargs):
+    """Generate resized renditions off the request path once the upload is committed"""
+    if created:
+        product_images.schedule_derivatives(instance.pk)
+
+@receiver(post_delete, sender=ProductImage)
+def delete_image_derivatives(sender, instance, **kwargs):
+    """Remove the renditions of a deleted image"""
+    derivatives = instance.derivatives
+    transaction.on_commit(lambda: product_images.delete_derivatives(derivatives))
+
+@receiver(post_delete, sender=ProductImage)
+def promote_next_primary_image(sender, instance, **kwargs):
+    """When the primary image is deleted, the next image in display order becomes primary"""
+    if instance.is_primary:
+        next_image = ProductImage.objects.filter(product_id=instance.product_id).first()
+        if next_image:
+            next_image.is_primary = True
+            next_image.save(update_fields=['is_primary'])
+
+@receiver(pre_delete, sender=Category)
+def reroot_subcategories(sender, instance, **kwargs):
+    """Children of a deleted category become roots (parent is SET_NULL), so strip its path prefix"""
+    if instance.path:
+        Category.objects.filter(path__startswith=instance.path).exclude(pk=instance.pk).update(
+            path=Substr('path', len(instance.path) + 1),
+            depth=F('depth') - (instance.depth + 1),
+            updated_at=timezone.now(),
+        )
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_cache(sender, instance, **kwargs):
+    """Category changes affect category-name filters, search, expanded categories and the category tree"""
+    product_cache.invalidate_categories()
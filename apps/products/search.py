@@ -0,0 +1,93 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db.models import F, Q
+from rest_framework import filters
+from rest_framework.settings import api_settings
+from apps.authentication.models import User
+from .models import Category, SEARCH_CONFIG
+
+
+def search_products(queryset, text):
+    """
+    Full-text search over products, ranked by relevance.
+
+    Title and description are matched through the indexed ``search_vector``
+    column. A term may also match a category name or a seller's username, in
+    place of the text; the other terms must still match. Categories and
+    sellers are resolved to ids first (both tables are small) so Postgres can
+    combine everything into a single bitmap scan of the products table
+    instead of joining and running ILIKE.
+
+    Titles that resemble the search terms (pg_trgm word similarity, served by
+    the title trigram index) match too, so a typo such as "ceramc" still finds
+    "Ceramic lamp". ``search_rank`` orders full-text matches and
+    ``title_similarity`` the rest, which have no rank.
+    """
+    text = (text or '').strip()
+    if not text:
+        return queryset
+
+    query = SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+    terms = text.split()
+    # Web-search operators ("quotes", -excluded, or) mean nothing to trigrams
+    # or to category and seller names
+    included = [
+        term.strip('"') for term in terms
+        if not term.startswith('-') and term.lower() != 'or' and term.strip('"')
+    ]
+    fuzzy_text = ' '.join(included)
+    excluded = [term[1:].strip('"') for term in terms if term.startswith('-') and term[1:].strip('"')]
+    excluded_match = Q()
+    if excluded:
+        excluded_match = ~Q(search_vector=SearchQuery(' or '.join(excluded), search_type='websearch', config=SEARCH_CONFIG))
+
+    condition = Q(search_vector=query)
+    if fuzzy_text:
+        # Similar titles must still honour the excluded terms
+        condition |= Q(title__trigram_word_similar=fuzzy_text) & excluded_match
+
+    names_match = Q()
+    usernames_match = Q()
+    for term in included:
+        names_match |= Q(name__icontains=term)
+        usernames_match |= Q(username__iexact=term)
+    categories = list(Category.objects.filter(names_match).values_list('id', 'name')) if included else []
+    sellers = list(User.objects.filter(usernames_match, role='seller').values_list('id', 'username')) if included else []
+    if categories or sellers:
+        # A category or seller name only widens the match for its own term:
+        # every other term must still match, so "lamp textiles" finds the
+        # lamps among textiles rather than every textile
+        widened = excluded_match
+        for term in included:
+            term_match = Q(search_vector=SearchQuery(term, config=SEARCH_CONFIG))
+            category_ids = [pk for pk, name in categories if term.lower() in name.lower()]
+            seller_ids = [pk for pk, username in sellers if term.lower() == username.lower()]
+            if category_ids:
+                term_match |= Q(category_id__in=category_ids)
+            if seller_ids:
+                term_match |= Q(seller_id__in=seller_ids)
+            widened &= term_match
+        condition |= widened
+
+    return queryset.filter(condition).annotate(
+        search_rank=SearchRank(F('search_vector'), query),
+        title_similarity=TrigramWordSimilarity(fuzzy_text or text, 'title'),
+    )
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    Search backend for products that uses Postgres full-text search.
+
+    Results are ordered by relevance unless the client asks for an explicit
+    ordering, so this backend must come after ``OrderingFilter``.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '')
+        if not text.strip():
+            return queryset
+
+        queryset = search_products(queryset, text)
+        if not request.query_params.get(api_settings.ORDERING_PARAM):
+            queryset = queryset.order_by('-search_rank', '-title_similarity', '-created_at', '-id')
+        return queryset
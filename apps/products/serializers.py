@@ -1,12 +1,57 @@
 from rest_framework import serializers
+from django.core.files.storage import default_storage
+from django.db.models import Count, Max
 from .models import Category, Product, ProductImage
+from .images import DERIVATIVE_FORMATS
+from auraspotmarketplace1.fieldsets import SparseFieldsetMixin
+
+SHIPPING_DIMENSION_FIELDS = ['weight', 'length', 'width', 'height']
+
+
+def validate_shipping(data):
+    """Shipping dimensions are required and positive when requires_shipping is True"""
+    requires_shipping = data.get('requires_shipping', True)  # Default to True if not provided
+
+    if requires_shipping:
+        missing_fields = [field for field in SHIPPING_DIMENSION_FIELDS if not data.get(field)]
+
+        if missing_fields:
+            raise serializers.ValidationError({
+                field: 'This field is required when requires_shipping is True'
+                for field in missing_fields
+            })
+
+        # Validate minimum values
+        for field in SHIPPING_DIMENSION_FIELDS:
+            value = data.get(field)
+            if value and value <= 0:
+                raise serializers.ValidationError({
+                    field: f"{field.title()} must be greater than 0"
+                })
+
+    return data
 
 class ProductImageSerializer(serializers.ModelSerializer):
     """Serializer for product images"""
+    derivatives = serializers.SerializerMethodField()
+
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'is_primary', 'created_at']
-        read_only_fields = ['id', 'created_at']
+        fields = ['id', 'image', 'derivatives', 'is_primary', 'position', 'created_at']
+        read_only_fields = ['id', 'position', 'created_at']
+        field_dependencies = {'derivatives': ['derivatives']}  # Columns read by the method fields
+
+    def get_derivatives(self, obj):
+        """URLs of the resized renditions, or an empty object while they are being generated"""
+        request = self.context.get('request')
+        derivatives = {}
+        for size, outputs in (obj.derivatives or {}).items():
+            derivatives[size] = {'width': outputs.get('width'), 'height': outputs.get('height')}
+            for fmt in DERIVATIVE_FORMATS:
+                if outputs.get(fmt):
+                    url = default_storage.url(outputs[fmt])
+                    derivatives[size][fmt] = request.build_absolute_uri(url) if request else url
+        return derivatives
 
 class CategorySerializer(serializers.ModelSerializer):
     """Serializer for Product Categories"""
@@ -14,9 +59,16 @@ class CategorySerializer(serializers.ModelSerializer):
         model = Category
         fields = '__all__'
 
-class ProductSerializer(serializers.ModelSerializer):
-    """Serializer for Product Management"""
+    def validate_parent(self, parent):
+        """Prevent cycles: a category cannot be moved under itself or its subcategories"""
+        if parent and self.instance and self.instance.path and parent.path.startswith(self.instance.path):
+            raise serializers.ValidationError("A category cannot be moved under itself or one of its subcategories")
+        return parent
+
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """Serializer for Product Management (supports ?fields= and ?expand=category)"""
     images = ProductImageSerializer(many=True, read_only=True)
+    primary_image = ProductImageSerializer(read_only=True)  # Cover image, without loading the others
     uploaded_images = serializers.ListField(
         child=serializers.ImageField(max_length=1000000, allow_empty_file=False, use_url=False),
         write_only=True,
@@ -29,8 +81,9 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'description', 'price', 'category', 'seller', 
                  'stock', 'requires_shipping', 'weight', 'length', 'width', 
                  'height', 'free_shipping', 'created_at', 'updated_at', 
-                 'images', 'uploaded_images']
+                 'primary_image', 'images', 'uploaded_images']
         read_only_fields = ('seller',)
+        expandable_fields = {'category': CategorySerializer}
 
     def validate_uploaded_images(self, value):
         """Validate uploaded images"""
@@ -56,8 +109,11 @@ class ProductSerializer(serializers.ModelSerializer):
             ProductImage.objects.create(
                 product=product,
                 image=image,
-                is_primary=(i == 0)  # First image is primary
+                is_primary=(i == 0),  # First image is primary
+                position=i
             )
+        if uploaded_images:
+            product.refresh_from_db(fields=['primary_image', 'updated_at'])
         
         return product
 
@@ -67,42 +123,46 @@ class ProductSerializer(serializers.ModelSerializer):
         product = super().update(instance, validated_data)
         
         # Handle new images
-        existing_images_count = product.images.count()
+        existing = product.images.aggregate(count=Count('id'), last_position=Max('position'))
+        existing_images_count = existing['count']
+        next_position = 0 if existing['last_position'] is None else existing['last_position'] + 1
         if existing_images_count + len(uploaded_images) > 5:
             raise serializers.ValidationError({
                 'uploaded_images': f'This product already has {existing_images_count} images. '
                                  f'You can only add {5 - existing_images_count} more.'
             })
             
-        for image in uploaded_images:
+        for i, image in enumerate(uploaded_images):
             ProductImage.objects.create(
                 product=product,
                 image=image,
-                is_primary=(not product.images.filter(is_primary=True).exists())
+                is_primary=(i == 0 and product.primary_image_id is None),
+                position=next_position + i
             )
+        if uploaded_images:
+            product.refresh_from_db(fields=['primary_image', 'updated_at'])
         
         return product
 
     def validate(self, data):
         """Validate shipping-related fields"""
-        requires_shipping = data.get('requires_shipping', True)  # Default to True if not provided
-        
-        if requires_shipping:
-            shipping_fields = ['weight', 'length', 'width', 'height']
-            missing_fields = [field for field in shipping_fields if not data.get(field)]
-            
-            if missing_fields:
-                raise serializers.ValidationError({
-                    field: 'This field is required when requires_shipping is True'
-                    for field in missing_fields
-                })
-            
-            # Validate minimum values
-            for field in shipping_fields:
-                value = data.get(field)
-                if value and value <= 0:
-                    raise serializers.ValidationError({
-                        field: f"{field.title()} must be greater than 0"
-                    })
-        
-        return data
+        return validate_shipping(data)
+
+
+class ProductImportRowSerializer(serializers.Serializer):
+    """One row of a bulk product import (CSV or JSONL)"""
+    title = serializers.CharField(max_length=255)
+    description = serializers.CharField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    category = serializers.UUIDField()
+    stock = serializers.IntegerField(min_value=0, default=0)
+    requires_shipping = serializers.BooleanField(default=True)
+    weight = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, allow_null=True)
+    length = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, allow_null=True)
+    width = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, allow_null=True)
+    height = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, allow_null=True)
+    free_shipping = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        """Same shipping rules as ProductSerializer"""
+        return validate_shipping(data)
@@ -1,3 +1,946 @@
-from django.test import TestCase
+import base64
+import csv
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from uuid import uuid4
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from apps.authentication.models import User
+from auraspotmarketplace1.testing import QueryCountTestMixin
+from . import cache as product_cache
+from .autocomplete import get_prefix_cache
+from .exporter import CSV_COLUMNS, iter_export_rows
+from .images import DERIVATIVE_SIZES, render_derivatives
+from .importer import ProductImporter, import_products, iter_rows
+from .models import Category, Product, ProductImage
+
+
+class ProductQueryCountTests(QueryCountTestMixin, APITestCase):
+    """Product and category listings must not issue per-row queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='pass',
+            role='seller', first_name='Sam', last_name='Seller'
+        )
+        parent = Category.objects.create(name='Home & Decor')
+        cls.categories = [
+            Category.objects.create(name=f'Category {i}', parent=parent) for i in range(25)
+        ]
+        for i in range(25):
+            product = Product.objects.create(
+                title=f'Ceramic lamp {i}', description='Handmade ceramic lamp',
+                price=Decimal('19.99'), category=cls.categories[i], seller=cls.seller,
+                stock=10, requires_shipping=False
+            )
+            for j in range(2):
+                ProductImage.objects.create(
+                    product=product, image=f'products/lamp-{i}-{j}.jpg', is_primary=(j == 0)
+                )
+
+    def setUp(self):
+        cache.clear()  # Anonymous product responses are cached
+
+    def test_product_list(self):
+        # COUNT, page of products (with category and seller), images prefetch
+        self.assertListQueryCount('/products/products/', 3)
+
+    def test_product_list_filtered(self):
+        # Category/seller lookups for search, COUNT, products, images prefetch
+        self.assertListQueryCount('/products/products/', 5, {
+            'search': 'lamp', 'category_name': 'category', 'seller_name': 'seller'
+        })
+
+    def test_product_list_cursor(self):
+        # Page of products and images prefetch, no COUNT
+        for page_size in self.page_sizes:
+            with self.assertNumQueries(2):
+                response = self.client.get('/products/products/', {
+                    'cursor': '', 'count': 'false', 'page_size': page_size
+                })
+            self.assertEqual(len(response.data['results']), page_size)
+
+    def test_category_list(self):
+        # ETag aggregate, COUNT, page of categories
+        self.assertListQueryCount('/products/categories/', 3)
+
+    def test_product_list_sparse_fields(self):
+        # COUNT and page of products; images are not prefetched
+        self.assertListQueryCount('/products/products/', 2, {'fields': 'id,title,price,primary_image'})
+        response = self.client.get('/products/products/', {'fields': 'id,title,price,primary_image'})
+        product = response.data['results'][0]
+        self.assertEqual(set(product), {'id', 'title', 'price', 'primary_image'})
+        self.assertTrue(product['primary_image']['image'].endswith('products/lamp-24-0.jpg'))
+
+    def test_product_list_sparse_fields_defer_columns(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/products/products/', {'fields': 'id,title'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title'})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/products/products/', {'fields': 'id,title', 'page': 2})
+        self.assertNotIn('"description"', queries[-1]['sql'])
+
+    def test_product_list_expand(self):
+        # COUNT, page of products joined with their category
+        self.assertListQueryCount('/products/products/', 2, {'fields': 'id,category', 'expand': 'category'})
+        response = self.client.get('/products/products/', {'fields': 'id,category', 'expand': 'category'})
+        self.assertEqual(response.data['results'][0]['category']['name'], 'Category 24')
+
+
+class ConditionalGetTests(APITestCase):
+    """Unchanged products and categories are answered with 304 from a single query"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='pass',
+            role='seller', first_name='Sam', last_name='Seller'
+        )
+        cls.category = Category.objects.create(name='Home & Decor')
+        cls.product = Product.objects.create(
+            title='Ceramic lamp', description='Handmade ceramic lamp', price=Decimal('19.99'),
+            category=cls.category, seller=cls.seller, stock=10, requires_shipping=False
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.url = f'/products/products/{self.product.pk}/'
+
+    def test_product_detail_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_product_detail_if_modified_since(self):
+        response = self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    @mock.patch('apps.products.images.schedule_derivatives')  # Rendering is covered by ImageDerivativeTests
+    def test_product_detail_changes_etag(self, schedule_derivatives):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductImage.objects.create(product=self.product, image='products/lamp.jpg', is_primary=True)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['images']), 1)
+
+    def test_category_list_not_modified(self):
+        etag = self.client.get('/products/categories/')['ETag']
+        self.assertEqual(self.client.get('/products/categories/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Category.objects.create(name='Fashion')
+        self.assertEqual(self.client.get('/products/categories/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class PrimaryImageTests(APITestCase):
+    """Product.primary_image follows the primary image through saves, deletes and reorders"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='pass',
+            role='seller', first_name='Sam', last_name='Seller'
+        )
+        category = Category.objects.create(name='Home & Decor')
+        cls.product = Product.objects.create(
+            title='Ceramic lamp', description='Handmade ceramic lamp', price=Decimal('19.99'),
+            category=category, seller=cls.seller, stock=10, requires_shipping=False
+        )
+        cls.images = [
+            ProductImage.objects.create(
+                product=cls.product, image=f'products/lamp-{i}.jpg', is_primary=(i == 0), position=i
+            )
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.url = f'/products/products/{self.product.pk}/'
+        self.client.force_authenticate(self.seller)
+
+    def assertPrimary(self, image):
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.primary_image_id, image.pk)
+        self.assertEqual(
+            list(ProductImage.objects.filter(product=self.product, is_primary=True).values_list('pk', flat=True)),
+            [image.pk]
+        )
+
+    def test_set_primary_image(self):
+        self.assertPrimary(self.images[0])
+        response = self.client.post(f'{self.url}set_primary_image/', {'image_id': self.images[2].pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertPrimary(self.images[2])
+
+    def test_delete_primary_promotes_next(self):
+        response = self.client.delete(f'{self.url}delete_image/', {'image_id': self.images[0].pk})
+        self.assertEqual(response.status_code, 204)
+        self.assertPrimary(self.images[1])
+
+    def test_reorder_images(self):
+        order = [self.images[2].pk, self.images[0].pk, self.images[1].pk]
+        with self.assertNumQueries(8):  # Product, images prefetch, savepoint, lock, two UPDATEs, release, images
+            response = self.client.post(
+                f'{self.url}reorder_images/', {'order': order, 'primary': self.images[1].pk}, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([image['id'] for image in response.data], [str(pk) for pk in [order[2], order[0], order[1]]])
+        self.assertPrimary(self.images[1])
+
+    def test_reorder_images_rejects_partial_order(self):
+        response = self.client.post(
+            f'{self.url}reorder_images/', {'order': [self.images[0].pk]}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertPrimary(self.images[0])
+
+    def test_list_renders_cover(self):
+        self.client.force_authenticate(None)
+        response = self.client.get('/products/products/')
+        self.assertTrue(response.data['results'][0]['primary_image']['image'].endswith('products/lamp-0.jpg'))
+
+
+class AutocompleteTests(APITestCase):
+    """Title suggestions come from the trigram index in a single query"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='pass',
+            role='seller', first_name='Sam', last_name='Seller'
+        )
+        category = Category.objects.create(name='Home & Decor')
+        for title in ['Ceramic Lamp', 'Ceramic Mug', 'Wireless Speaker']:
+            Product.objects.create(
+                title=title, description='Handmade', price=Decimal('19.99'),
+                category=category, seller=seller, stock=10, requires_shipping=False
+            )
+
+    def setUp(self):
+        get_prefix_cache().clear()
+
+    def test_suggestions(self):
+        with self.assertNumQueries(1):  # Candidates joined with their cover image
+            response = self.client.get('/products/products/autocomplete/', {'q': 'ceram'})
+        self.assertEqual(
+            sorted(result['title'] for result in response.data['results']), ['Ceramic Lamp', 'Ceramic Mug']
+        )
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title', 'thumbnail'})
+
+        with self.assertNumQueries(0):  # Served from the prefix LRU
+            self.client.get('/products/products/autocomplete/', {'q': 'ceram'})
+
+    def test_best_match_first_among_many(self):
+        product = Product.objects.get(title='Ceramic Lamp')
+        Product.objects.bulk_create([
+            Product(
+                title=f'Ceramica Tile {i}', description='Handmade', price=Decimal('9.99'),
+                category=product.category, seller=product.seller, stock=10, requires_shipping=False
+            )
+            for i in range(250)
+        ])
+        # Inserted after 250 weaker matches, so it is not among the first 200 rows in physical order
+        exact = Product.objects.create(
+            title='Ceramic', description='Handmade', price=Decimal('9.99'),
+            category=product.category, seller=product.seller, stock=10, requires_shipping=False
+        )
+        first = self.client.get('/products/products/autocomplete/', {'q': 'ceramic', 'limit': 3}).data['results']
+        # The three whole-word matches, ahead of every 'Ceramica' partial match
+        self.assertEqual({result['title'] for result in first}, {'Ceramic', 'Ceramic Lamp', 'Ceramic Mug'})
+        self.assertIn(exact.pk, [result['id'] for result in first])
+        get_prefix_cache().clear()
+        again = self.client.get('/products/products/autocomplete/', {'q': 'ceramic', 'limit': 3}).data['results']
+        self.assertEqual(again, first)
+
+    def test_short_term(self):
+        with self.assertNumQueries(0):
+            response = self.client.get('/products/products/autocomplete/', {'q': 'ce'})
+        self.assertEqual(response.data['results'], [])
+
+
+class ProductImportTests(APITestCase):
+    """Bulk import from CSV and JSONL, with a per-row error report"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='pass', role='seller'
+        )
+        cls.buyer = User.objects.create_user(
+            email='buyer@example.com', username='buyer', password='pass', role='buyer'
+        )
+        cls.category = Category.objects.create(name='Lighting')
+
+    def setUp(self):
+        self.client.force_authenticate(self.seller)
+
+    def upload(self, name, content, **data):
+        upload = SimpleUploadedFile(name, content)
+        return self.client.post('/products/products/import/', {'file': upload, **data}, format='multipart')
+
+    def csv_file(self, *rows):
+        header = 'title,description,price,category,stock,requires_shipping,weight,length,width,height\n'
+        return (header + ''.join(f'{row}\n' for row in rows)).encode()
+
+    def test_csv_import_reports_row_errors(self):
+        category = self.category.pk
+        response = self.upload('catalog.csv', self.csv_file(
+            f'Lamp,Ceramic lamp,19.99,{category},5,false,,,,',
+            f'Parcel lamp,Ships,25.00,{category},,true,1.5,10,10,20',
+            f'No price,Missing,,{category},1,false,,,,',
+            f'Heavy lamp,No weight,30.00,{category},1,true,,10,10,20',
+            f'Lost lamp,Unknown category,10.00,{uuid4()},1,false,,,,',
+        ))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {key: response.data[key] for key in ('rows', 'created', 'failed', 'errors_truncated', 'file_error')},
+            {'rows': 5, 'created': 2, 'failed': 3, 'errors_truncated': False, 'file_error': None}
+        )
+        errors = {error['row']: error['errors'] for error in response.data['errors']}
+        self.assertEqual(set(errors), {3, 4, 5})
+        self.assertIn('price', errors[3])
+        self.assertIn('weight', errors[4])
+        self.assertIn('does not exist', errors[5]['category'][0])
+
+        parcel = Product.objects.get(title='Parcel lamp')
+        self.assertEqual((parcel.seller, parcel.stock, parcel.weight), (self.seller, 0, Decimal('1.5')))
+        self.assertFalse(Product.objects.get(title='Lamp').requires_shipping)
+
+    def test_jsonl_import(self):
+        row = {'description': 'Lamp', 'price': '9.50', 'category': str(self.category.pk), 'requires_shipping': False}
+        lines = [
+            json.dumps({'title': 'First', **row}),
+            '',
+            '{"title": "Broken"',
+            '["not", "an", "object"]',
+            json.dumps({'title': 'Second', **row, 'stock': 3}),
+        ]
+        response = self.upload('catalog.ndjson', '\n'.join(lines).encode())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['rows'], response.data['created']), (4, 2))
+        self.assertEqual([error['row'] for error in response.data['errors']], [3, 4])
+        self.assertIn('Invalid JSON', response.data['errors'][0]['errors']['non_field_errors'][0])
+        self.assertEqual(sorted(Product.objects.values_list('title', 'stock')), [('First', 0), ('Second', 3)])
+
+    def test_rows_are_inserted_in_chunks(self):
+        rows = [f'Lamp {i},Ceramic lamp,19.99,{self.category.pk},1,false,,,,' for i in range(5)]
+        with CaptureQueriesContext(connection) as queries:
+            report = import_products(io.BytesIO(self.csv_file(*rows)), 'csv', self.seller, chunk_size=2)
+        self.assertEqual((report['rows'], report['created'], report['failed']), (5, 5, 0))
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "products_product"')]
+        self.assertEqual(len(inserts), 3)
+        # The category is looked up once, by the first chunk
+        lookups = [query for query in queries if 'FROM "products_category"' in query['sql']]
+        self.assertEqual(len(lookups), 1)
+
+    def test_file_that_is_not_utf8_is_rejected(self):
+        content = self.csv_file(f'Lamp,Ceramic lamp,19.99,{self.category.pk},1,false,,,,')
+        content += 'Lampe été,Latin-1,9.99,,1,false,,,,\n'.encode('latin-1')
+        response = self.upload('catalog.csv', content)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['file_error'], (
+            'Line 3 is not valid UTF-8; save the file as UTF-8 and upload it again'
+        ))
+        # The rows before the unreadable line are imported
+        self.assertEqual((response.data['rows'], response.data['created']), (1, 1))
+
+        response = self.upload('catalog.jsonl', b'\xff\xfe{"title": "Lamp"}\n')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Line 1 is not valid UTF-8', response.data['file_error'])
+
+    def test_upload_is_validated(self):
+        self.assertEqual(self.client.post('/products/products/import/', {}, format='multipart').status_code, 400)
+        self.assertEqual(self.upload('catalog.xlsx', b'').status_code, 400)
+        row = f'Lamp,Ceramic lamp,19.99,{self.category.pk},1,false,,,,'
+        self.assertEqual(self.upload('catalog.txt', self.csv_file(row), format='csv').status_code, 200)
+        self.client.force_authenticate(self.buyer)
+        self.assertEqual(self.upload('catalog.csv', self.csv_file(row)).status_code, 403)
+
+    def test_error_list_is_capped_and_counted(self):
+        rows = [f'Lamp {i},Ceramic lamp,-1,{self.category.pk},1,false,,,,' for i in range(3)]
+        report = ProductImporter(self.seller, max_errors=1).run(iter_rows(io.BytesIO(self.csv_file(*rows)), 'csv'))
+        self.assertEqual([error['row'] for error in report['errors']], [1])
+        self.assertEqual((report['failed'], report['errors_truncated'], report['errors_omitted']), (3, True, 2))
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'catalog.csv')
+            report_path = os.path.join(directory, 'report.json')
+            with open(path, 'wb') as catalog:
+                catalog.write(self.csv_file(
+                    f'Lamp,Ceramic lamp,19.99,{self.category.pk},1,false,,,,',
+                    f'Bad lamp,Ceramic lamp,-1,{self.category.pk},1,false,,,,',
+                ))
+            output, errors = io.StringIO(), io.StringIO()
+            call_command(
+                'import_products', path, '--seller', 'seller@example.com', '--report', report_path,
+                stdout=output, stderr=errors
+            )
+            with open(report_path) as report_file:
+                report = json.load(report_file)
+            self.assertIn('2 rows: 1 created, 1 failed', output.getvalue())
+            self.assertIn('Row 2:', errors.getvalue())
+            self.assertEqual(report['errors'][0]['row'], 2)
+            self.assertEqual(report['errors_omitted'], 0)
+
+            with open(path, 'ab') as catalog:
+                catalog.write(b'\xff\n')
+            with self.assertRaisesMessage(CommandError, 'Line 4 is not valid UTF-8'):
+                call_command('import_products', path, '--seller', 'seller@example.com', stdout=output, stderr=errors)
+            with self.assertRaisesMessage(CommandError, 'No seller'):
+                call_command('import_products', path, '--seller', 'buyer@example.com')
+
+
+class ProductCacheTests(APITestCase):
+    """Anonymous product responses are cached, counted and never served stale"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(
+            email='admin@example.com', username='admin', password='pass', role='admin'
+        )
+        cls.category = Category.objects.create(name='Lighting')
+        cls.product = Product.objects.create(
+            title='Ceramic lamp', description='Handmade ceramic lamp', price=Decimal('19.99'),
+            category=cls.category, seller=cls.admin, stock=10, requires_shipping=False
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.url = f'/products/products/{self.product.pk}/'
+
+    def stats(self):
+        stats = product_cache.get_stats()
+        return stats['hits'], stats['misses']
+
+    def test_hits_and_misses_are_counted(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get('/products/products/').status_code, 200)
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(self.stats(), (2, 2))
+        self.client.get('/products/products/', {'page': 99})  # 404s are not cached
+        self.client.get('/products/products/', {'page': 99})
+        self.assertEqual(self.stats(), (2, 4))
+
+        self.client.force_authenticate(self.admin)
+        self.client.get('/products/products/')  # Authenticated responses bypass the cache
+        stats = self.client.get('/products/products/cache_stats/').data
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate']), (2, 4, 0.3333))
+
+    def test_product_save_invalidates(self):
+        self.client.get('/products/products/')
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.get(pk=self.product.pk)
+            product.title = 'Porcelain lamp'
+            product.save()
+        self.assertEqual(self.client.get('/products/products/').data['results'][0]['title'], 'Porcelain lamp')
+        self.assertEqual(self.client.get(self.url).data['title'], 'Porcelain lamp')
+        self.assertEqual(self.stats(), (0, 4))
+
+    @mock.patch('apps.products.images.schedule_derivatives')
+    def test_image_save_invalidates(self, schedule_derivatives):
+        self.assertEqual(self.client.get(self.url).data['images'], [])
+        self.client.get('/products/products/')
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductImage.objects.create(product=self.product, image='products/lamp.jpg', is_primary=True)
+        self.assertEqual(len(self.client.get(self.url).data['images']), 1)
+        self.assertEqual(len(self.client.get('/products/products/').data['results'][0]['images']), 1)
+        schedule_derivatives.assert_called_once()
+
+    def test_category_save_invalidates(self):
+        params = {'expand': 'category'}
+        self.client.get(self.url, params)
+        self.client.get('/products/products/', params)
+        self.assertEqual(self.client.get('/products/categories/tree/').data[0]['name'], 'Lighting')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = 'Lamps'
+            self.category.save()
+        self.assertEqual(self.client.get(self.url, params).data['category']['name'], 'Lamps')
+        self.assertEqual(self.client.get('/products/products/', params).data['results'][0]['category']['name'], 'Lamps')
+        self.assertEqual(self.client.get('/products/categories/tree/').data[0]['name'], 'Lamps')
+        self.assertEqual(self.client.get('/products/products/', {'category_name': 'lamps'}).data['count'], 1)
+
+
+class KeysetPaginationTests(APITestCase):
+    """Cursor pages of the product list: stable across ties, reversible and tamper-proof"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='pass', role='seller'
+        )
+        category = Category.objects.create(name='Lighting')
+        for i in range(11):
+            Product.objects.create(
+                title=f'Lamp {i}', description='Lamp', price=Decimal('10.00'),
+                category=category, seller=seller, stock=1, requires_shipping=False
+            )
+        # Seven products share one created_at, so only the id orders them
+        tied = list(Product.objects.order_by('title').values_list('pk', flat=True)[:7])
+        Product.objects.filter(pk__in=tied).update(created_at=timezone.now() - timedelta(days=1))
+        cls.expected = [str(pk) for pk in Product.objects.order_by('-created_at', '-id').values_list('pk', flat=True)]
+
+    def setUp(self):
+        cache.clear()
+
+    def ids(self, response):
+        return [product['id'] for product in response.data['results']]
+
+    def cursor(self, data):
+        token = base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+        return self.client.get('/products/products/', {'cursor': token})
+
+    def test_next_and_previous_round_trip(self):
+        response = self.client.get('/products/products/', {'cursor': '', 'page_size': 3})
+        self.assertIsNone(response.data['previous'])
+        pages = [self.ids(response)]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append(self.ids(response))
+        self.assertEqual([len(page) for page in pages], [3, 3, 3, 2])
+        self.assertEqual(sum(pages, []), self.expected)
+
+        backwards = []
+        while response.data['previous']:
+            response = self.client.get(response.data['previous'])
+            backwards.append(self.ids(response))
+        self.assertEqual(backwards, pages[-2::-1])
+        self.assertIsNone(response.data['previous'])
+
+    def test_malformed_or_tampered_cursor(self):
+        for token in ('garbage', '!!!', base64.urlsafe_b64encode(b'[1, 2]').decode()):
+            with self.subTest(token=token):
+                self.assertEqual(self.client.get('/products/products/', {'cursor': token}).status_code, 404)
+        for data in ({'p': ['yesterday', 'x']}, {'p': [None, None]}, {'p': ['2025-01-01T00:00:00Z']}, {'r': 1}):
+            with self.subTest(data=data):
+                self.assertEqual(self.cursor(data).status_code, 404)
+
+    def test_count_is_optional(self):
+        response = self.client.get('/products/products/', {'cursor': '', 'page_size': 5})
+        self.assertEqual(response.data['count'], 11)
+        with self.assertNumQueries(2):  # Page of products and images prefetch
+            response = self.client.get('/products/products/', {'cursor': '', 'page_size': 5, 'count': 'false'})
+        self.assertNotIn('count', response.data)
+        self.assertEqual(self.ids(response), self.expected[:5])
+
+    def test_page_number_fallback(self):
+        response = self.client.get('/products/products/', {'page_size': 5})
+        self.assertEqual(response.data['count'], 11)
+        self.assertIn('page=2', response.data['next'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(self.ids(response), self.expected[5:10])
+        self.assertEqual(self.client.get('/products/products/', {'page': 4, 'page_size': 5}).status_code, 404)
+
+
+class CategoryTreeTests(APITestCase):
+    """Materialized category paths follow moves and deletions"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(
+            email='admin@example.com', username='admin', password='pass', role='admin'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.home = Category.objects.create(name='Home')
+        self.lighting = Category.objects.create(name='Lighting', parent=self.home)
+        self.lamps = Category.objects.create(name='Lamps', parent=self.lighting)
+        self.garden = Category.objects.create(name='Garden')
+
+    def path(self, *categories):
+        return ''.join(f'{category.pk.hex}/' for category in categories)
+
+    def assertPlaced(self, category, *ancestors):
+        category.refresh_from_db()
+        self.assertEqual((category.path, category.depth), (self.path(*ancestors, category), len(ancestors)))
+
+    def test_paths_on_create(self):
+        self.assertPlaced(self.home)
+        self.assertPlaced(self.lamps, self.home, self.lighting)
+        self.assertEqual(
+            set(self.home.get_descendants(include_self=False)), {self.lighting, self.lamps}
+        )
+
+    def test_moving_a_subtree_rewrites_paths(self):
+        self.lighting.parent = self.garden
+        self.lighting.save()
+        self.assertPlaced(self.lighting, self.garden)
+        self.assertPlaced(self.lamps, self.garden, self.lighting)
+        self.assertEqual(list(self.home.get_descendants()), [self.home])
+
+        self.lighting.parent = None
+        self.lighting.save()
+        self.assertPlaced(self.lighting)
+        self.assertPlaced(self.lamps, self.lighting)
+
+    def test_cycles_are_rejected(self):
+        for parent in (self.lamps, self.home):
+            with self.subTest(parent=parent.name):
+                self.home.parent = parent
+                with self.assertRaises(ValidationError):
+                    self.home.save()
+        self.assertPlaced(self.home)
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.put(f'/products/categories/{self.home.pk}/', {
+            'name': 'Home', 'parent': str(self.lamps.pk)
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('parent', response.data)
+        self.assertPlaced(self.home)
+
+    def test_deleting_a_category_reroots_its_children(self):
+        self.home.delete()
+        self.assertPlaced(self.lighting)
+        self.assertPlaced(self.lamps, self.lighting)
+        self.assertIsNone(Category.objects.get(pk=self.lighting.pk).parent)
+
+    def test_tree(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lighting.parent = self.garden
+            self.lighting.save()
+        tree = self.client.get('/products/categories/tree/').data
+        self.assertEqual([(node['name'], node['depth']) for node in tree], [('Garden', 0), ('Home', 0)])
+        lighting = tree[0]['subcategories'][0]
+        self.assertEqual((lighting['name'], lighting['depth']), ('Lighting', 1))
+        self.assertEqual([(node['name'], node['depth']) for node in lighting['subcategories']], [('Lamps', 2)])
+        self.assertEqual(tree[1]['subcategories'], [])
+
+
+class FacetTests(APITestCase):
+    """Facet counts describe exactly the products the same filters list"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='pass', role='seller'
+        )
+        cls.lighting = Category.objects.create(name='Lighting')
+        cls.textiles = Category.objects.create(name='Textiles')
+        cls.kitchen = Category.objects.create(name='Kitchen')
+        products = [
+            ('Ceramic lamp', cls.lighting, '19.99', 5, True),
+            ('Brass lamp', cls.lighting, '120.00', 0, False),
+            ('Paper lantern', cls.lighting, '24.99', 2, True),
+            ('Linen throw', cls.textiles, '49.99', 3, False),
+            ('Wool rug', cls.textiles, '260.00', 1, False),
+            ('Ceramic mug', cls.kitchen, '12.00', 0, True),
+        ]
+        for title, category, price, stock, free_shipping in products:
+            Product.objects.create(
+                title=title, description=f'Handmade {title.lower()}', price=Decimal(price),
+                category=category, seller=seller, stock=stock, requires_shipping=False,
+                free_shipping=free_shipping
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def listed(self, params):
+        return self.client.get('/products/products/', {**params, 'page_size': 100}).data['results']
+
+    def assertFacetsMatchList(self, params):
+        facets = self.client.get('/products/products/facets/', params).data
+        products = self.listed(params)
+        self.assertEqual(facets['count'], len(products))
+        self.assertEqual(
+            {category['id']: category['count'] for category in facets['categories']},
+            {str(category): sum(1 for p in products if p['category'] == category) for category in {p['category'] for p in products}}
+        )
+        for bucket in facets['price']:
+            in_bucket = [
+                p for p in products
+                if Decimal(p['price']) >= Decimal(bucket['min'])
+                and (bucket['max'] is None or Decimal(p['price']) < Decimal(bucket['max']))
+            ]
+            self.assertEqual(bucket['count'], len(in_bucket), bucket['key'])
+        free = sum(1 for p in products if p['free_shipping'])
+        self.assertEqual(facets['free_shipping'], {'true': free, 'false': len(products) - free})
+        in_stock = sum(1 for p in products if p['stock'] > 0)
+        self.assertEqual(facets['in_stock'], {'true': in_stock, 'false': len(products) - in_stock})
+        return facets
+
+    def test_counts_match_the_filtered_products(self):
+        for params in ({}, {'q': 'ceramic'}, {'min_price': '20', 'max_price': '200'}, {'stock__gte': 1, 'q': 'lamp'}):
+            with self.subTest(params=params):
+                self.assertFacetsMatchList(params)
+
+    def test_active_filter_on_the_same_facet(self):
+        facets = self.assertFacetsMatchList({'category': str(self.lighting.pk)})
+        self.assertEqual(facets['categories'], [{'id': str(self.lighting.pk), 'name': 'Lighting', 'count': 3}])
+
+        facets = self.assertFacetsMatchList({'free_shipping': 'true'})
+        self.assertEqual(facets['free_shipping'], {'true': 3, 'false': 0})
+
+        facets = self.assertFacetsMatchList({'min_price': '25', 'max_price': '49.99'})
+        self.assertEqual([bucket['count'] for bucket in facets['price']], [0, 1, 0, 0, 0, 0])
+
+    def test_no_matches(self):
+        facets = self.assertFacetsMatchList({'q': 'nothing matches this'})
+        self.assertEqual((facets['count'], facets['categories']), (0, []))
+        self.assertEqual(facets['free_shipping'], {'true': 0, 'false': 0})
+
+
+class ProductExportTests(APITestCase):
+    """Catalog export streams CSV or JSONL with a flat number of queries"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='pass', role='seller'
+        )
+        other = User.objects.create_user(
+            email='other@example.com', username='other', password='pass', role='seller'
+        )
+        cls.category = Category.objects.create(name='Lighting')
+        cls.products = []
+        for i in range(6):
+            product = Product.objects.create(
+                title=f'Lamp {i}', description='Ceramic, "handmade"\nlamp', price=Decimal('19.99'),
+                category=cls.category, seller=cls.seller, stock=i, requires_shipping=False
+            )
+            for j in range(2):
+                ProductImage.objects.create(
+                    product=product, image=f'products/lamp-{i}-{j}.jpg', is_primary=(j == 1), position=j
+                )
+            cls.products.append(product)
+        Product.objects.create(
+            title='Not mine', description='Rug', price=Decimal('50.00'),
+            category=cls.category, seller=other, stock=1, requires_shipping=False
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.seller)
+
+    def export(self, **params):
+        response = self.client.get('/products/products/export/', params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertRegex(response['Content-Disposition'], r'^attachment; filename="products-\d{8}-\d{6}\.csv"$')
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(list(rows[0]), CSV_COLUMNS)
+        self.assertEqual([row['title'] for row in rows], [f'Lamp {i}' for i in reversed(range(6))])
+        lamp = rows[-1]
+        self.assertEqual(
+            (lamp['id'], lamp['description'], lamp['price'], lamp['category_name'], lamp['weight']),
+            (str(self.products[0].pk), 'Ceramic, "handmade"\nlamp', '19.99', 'Lighting', '')
+        )
+        self.assertEqual(lamp['images'].split(' '), [
+            'http://testserver/media/products/lamp-0-1.jpg', 'http://testserver/media/products/lamp-0-0.jpg'
+        ])
+
+        # The export can be imported again
+        report = import_products(io.BytesIO(content.encode()), 'csv', self.seller)
+        self.assertEqual((report['created'], report['failed']), (6, 0))
+
+    def test_jsonl(self):
+        response, content = self.export(export_format='jsonl', min_price='10', stock__gte=3)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['title'] for row in rows], ['Lamp 5', 'Lamp 4', 'Lamp 3'])
+        self.assertEqual(set(rows[0]), set(CSV_COLUMNS))
+        self.assertEqual((rows[0]['stock'], rows[0]['price'], len(rows[0]['images'])), (5, '19.99', 2))
+
+    def test_query_count_does_not_grow_with_the_catalog(self):
+        # Products and one images query per chunk, whatever the number of products
+        for stock in (5, 0):
+            with self.subTest(products=6 - stock):
+                with self.assertNumQueries(2):
+                    _, content = self.export(export_format='jsonl', stock__gte=stock)
+                self.assertEqual(len(content.splitlines()), 6 - stock)
+        with self.assertNumQueries(3):  # Products, then images for each chunk of 4
+            rows = list(iter_export_rows(Product.objects.filter(seller=self.seller), chunk_size=4))
+        self.assertEqual(len(rows), 6)
+
+    def test_invalid_format(self):
+        self.assertEqual(self.client.get('/products/products/export/', {'export_format': 'xml'}).status_code, 400)
+
+
+def make_image(size, mode='RGB', fmt='PNG', **save_options):
+    """An in-memory image file of ``size`` pixels"""
+    buffer = io.BytesIO()
+    Image.new(mode, size, (200, 120, 40, 128)[:len(mode)]).save(buffer, fmt, **save_options)
+    return buffer.getvalue()
+
+
+class ImageDerivativeTests(APITestCase):
+    """Resized WebP and JPEG renditions of product images"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='pass', role='seller'
+        )
+        cls.product = Product.objects.create(
+            title='Ceramic lamp', description='Handmade ceramic lamp', price=Decimal('19.99'),
+            category=Category.objects.create(name='Lighting'), seller=cls.seller, stock=1, requires_shipping=False
+        )
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name, PRODUCT_IMAGE_DERIVATIVES_ASYNC=False))
+
+    def render(self, content):
+        with Image.open(io.BytesIO(content)) as source:
+            return render_derivatives(source)
+
+    def opened(self, content):
+        image = Image.open(io.BytesIO(content))
+        self.addCleanup(image.close)
+        return image
+
+    def test_sizes_and_formats(self):
+        rendered = self.render(make_image((2400, 1200)))
+        self.assertEqual(set(rendered), set(DERIVATIVE_SIZES))
+        for size, (width, height) in {'thumbnail': (160, 80), 'card': (480, 240), 'detail': (1200, 600)}.items():
+            with self.subTest(size=size):
+                self.assertEqual((rendered[size]['width'], rendered[size]['height']), (width, height))
+                for fmt, pil_format in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+                    image = self.opened(rendered[size][fmt])
+                    self.assertEqual((image.format, image.size, image.mode), (pil_format, (width, height), 'RGB'))
+
+    def test_small_images_are_not_upscaled(self):
+        rendered = self.render(make_image((300, 400)))
+        self.assertEqual((rendered['thumbnail']['width'], rendered['thumbnail']['height']), (120, 160))
+        self.assertEqual(self.opened(rendered['detail']['jpeg']).size, (300, 400))
+
+    def test_transparency_is_kept_in_webp(self):
+        rendered = self.render(make_image((200, 200), mode='RGBA'))
+        self.assertEqual(self.opened(rendered['card']['webp']).mode, 'RGBA')
+        self.assertEqual(self.opened(rendered['card']['jpeg']).mode, 'RGB')
+
+    def test_exif_orientation_is_applied(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Rotated 90 degrees: stored landscape, displayed portrait
+        rendered = self.render(make_image((400, 200), fmt='JPEG', exif=exif))
+        self.assertEqual((rendered['card']['width'], rendered['card']['height']), (200, 400))
+
+    def test_uploaded_image_gets_stored_derivatives(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(
+                product=self.product, is_primary=True,
+                image=SimpleUploadedFile('lamp.png', make_image((1000, 500)), content_type='image/png'),
+            )
+        image.refresh_from_db()
+        self.assertEqual(image.derivatives['card'], {
+            'width': 480, 'height': 240,
+            'webp': f'products/derivatives/{image.pk}/card.webp',
+            'jpeg': f'products/derivatives/{image.pk}/card.jpeg',
+        })
+        with default_storage.open(image.derivatives['thumbnail']['webp']) as stored:
+            self.assertEqual(Image.open(stored).size, (160, 80))
+
+        cache.clear()
+        detail = self.client.get(f'/products/products/{self.product.pk}/').data
+        self.assertEqual(
+            detail['primary_image']['derivatives']['thumbnail']['jpeg'],
+            f'http://testserver/media/products/derivatives/{image.pk}/thumbnail.jpeg'
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image.delete()
+        self.assertFalse(default_storage.exists(f'products/derivatives/{image.pk}/card.webp'))
+
+    def test_unreadable_upload_is_logged(self):
+        with self.assertLogs('apps.products.images', 'ERROR') as logs:
+            with self.captureOnCommitCallbacks(execute=True):
+                image = ProductImage.objects.create(
+                    product=self.product, image=SimpleUploadedFile('lamp.png', b'not an image')
+                )
+        self.assertIn(f'Failed to generate derivatives for image {image.pk}', logs.output[0])
+        image.refresh_from_db()
+        self.assertEqual(image.derivatives, {})
+
+
+class ProductSearchTests(APITestCase):
+    """Full-text search with category, seller and similar-title matches"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.potter = User.objects.create_user(
+            email='potter@example.com', username='potter', password='pass', role='seller'
+        )
+        weaver = User.objects.create_user(
+            email='weaver@example.com', username='weaver', password='pass', role='seller'
+        )
+        lighting = Category.objects.create(name='Lighting')
+        textiles = Category.objects.create(name='Textiles')
+        products = [
+            ('Ceramic lamp', 'Glazed stoneware lamp', lighting, cls.potter),
+            ('Brass lamp', 'Brass lamp with a ceramic base', lighting, cls.potter),
+            ('Lampshade', 'Linen shade for floor lamps', textiles, weaver),
+            ('Wool rug', 'Hand-woven rug', textiles, weaver),
+            ('Ceramica vase', 'Terracotta vase', textiles, weaver),
+        ]
+        for title, description, category, seller in products:
+            Product.objects.create(
+                title=title, description=description, price=Decimal('20.00'),
+                category=category, seller=seller, stock=1, requires_shipping=False
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, text, **params):
+        response = self.client.get('/products/products/', {'search': text, **params})
+        self.assertEqual(response.status_code, 200)
+        return [product['title'] for product in response.data['results']]
+
+    def test_title_matches_rank_first(self):
+        # Title beats description; "Ceramica" only resembles the term, so it comes last
+        self.assertEqual(self.search('ceramic'), ['Ceramic lamp', 'Brass lamp', 'Ceramica vase'])
+        self.assertEqual(self.search('ceramic', ordering='title'), ['Brass lamp', 'Ceramic lamp', 'Ceramica vase'])
+        self.assertEqual(self.search('lamps')[2:], ['Lampshade'])  # Description match
+
+    def test_category_and_seller_matches(self):
+        self.assertEqual(set(self.search('textiles')), {'Lampshade', 'Wool rug', 'Ceramica vase'})
+        self.assertEqual(set(self.search('potter')), {'Ceramic lamp', 'Brass lamp'})
+
+    def test_category_and_seller_matches_narrow_other_terms(self):
+        # Every term must match: the category or seller stands in for one term only
+        self.assertEqual(self.search('lamp textiles'), ['Lampshade'])
+        self.assertEqual(set(self.search('glazed potter')), {'Ceramic lamp'})
+        self.assertEqual(set(self.search('textiles -rug')), {'Lampshade', 'Ceramica vase'})
+        self.assertEqual(self.search('xyzzy textiles'), [])
+
+    def test_similar_titles_match(self):
+        # Typos: only the trigram fallback matches
+        self.assertEqual(set(self.search('ceramc')), {'Ceramic lamp', 'Ceramica vase'})
+        self.assertEqual(self.search('rugg'), ['Wool rug'])
+
+    def test_fallback_honours_excluded_terms(self):
+        self.assertEqual(self.search('lamp -brass'), ['Ceramic lamp', 'Lampshade'])
+        self.assertEqual(self.search('ceramc -"stoneware"'), ['Ceramica vase'])
+
+    def test_q_filter(self):
+        response = self.client.get('/products/products/', {'q': 'ceramc', 'ordering': 'title'})
+        self.assertEqual([product['title'] for product in response.data['results']], ['Ceramic lamp', 'Ceramica vase'])
+        facets = self.client.get('/products/products/facets/', {'search': 'ceramc'}).data
+        self.assertEqual(facets['count'], 2)
@@ -1,25 +1,29 @@
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import BooleanField, Case, Count, F, IntegerField, Max, Value, When
+from django.core.files.storage import default_storage
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import MultiPartParser
 from django_filters.rest_framework import DjangoFilterBackend, FilterSet, filters as django_filters
 from .models import Category, Product, ProductImage
 from .serializers import CategorySerializer, ProductSerializer, ProductImageSerializer
-
-
-class StandardResultsSetPagination(PageNumberPagination):
-    """Standard pagination class for consistent pagination"""
-    page_size = 10  # Number of items per page
-    page_size_query_param = 'page_size'  # Allow client to override page size
-    max_page_size = 100  # Maximum limit per page
-    
-    def get_paginated_response(self, data):
-        return Response({
-            'count': self.page.paginator.count,  # Total number of items
-            'next': self.get_next_link(),  # URL for next page
-            'previous': self.get_previous_link(),  # URL for previous page
-            'results': data  # Current page of results
-        })
+from .search import ProductSearchFilter, search_products
+from . import cache as product_cache
+from .facets import compute_facets
+from .importer import detect_format, import_products
+from .exporter import EXPORT_FORMATS, iter_export_rows, stream_csv, stream_jsonl
+from .autocomplete import DEFAULT_LIMIT, MAX_LIMIT, cover_thumbnail, suggest_titles
+from apps.analytics.counters import record_view
+from apps.analytics.models import RelatedProduct
+from apps.analytics.ordering import PopularityOrderingFilter
+from apps.authentication.views import IsAdminRole
+from auraspotmarketplace1.pagination import StandardResultsSetPagination, KeysetPagination
+from auraspotmarketplace1.conditional import conditional_response, make_etag
+from auraspotmarketplace1.fieldsets import sparse_queryset, wants_sparse
 
 class ProductFilter(FilterSet):
     """Filter set for advanced product filtering"""
@@ -31,17 +35,28 @@ class ProductFilter(FilterSet):
     created_before = django_filters.DateTimeFilter(field_name="created_at", lookup_expr='lte')
     requires_shipping = django_filters.BooleanFilter(field_name="requires_shipping")
     free_shipping = django_filters.BooleanFilter(field_name="free_shipping")
+    q = django_filters.CharFilter(method='filter_search')
+    category_tree = django_filters.UUIDFilter(method='filter_category_tree')
     
     class Meta:
         model = Product
         fields = {
-            'title': ['icontains'],
-            'description': ['icontains'],
             'stock': ['gte', 'lte'],
             'category': ['exact'],
             'seller': ['exact'],
         }
 
+    def filter_search(self, queryset, name, value):
+        """Same matching as ``search``: title and description, category name, seller username and similar titles"""
+        return search_products(queryset, value)
+
+    def filter_category_tree(self, queryset, name, value):
+        """Products in a category or any of its subcategories (materialized path prefix match)"""
+        path = Category.objects.filter(pk=value).values_list('path', flat=True).first()
+        if not path:
+            return queryset.none()
+        return queryset.filter(category__path__startswith=path)
+
 class IsSellerOrAdmin(permissions.BasePermission):
     """Custom permission to allow only sellers and admins to modify products."""
 
@@ -59,7 +74,7 @@ class IsSellerOrAdmin(permissions.BasePermission):
     
 class CategoryViewSet(viewsets.ModelViewSet):
     """CRUD API for Product Categories"""
-    queryset = Category.objects.all()
+    queryset = Category.objects.all().order_by('name')
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]  
     pagination_class = StandardResultsSetPagination
@@ -71,28 +86,215 @@ class CategoryViewSet(viewsets.ModelViewSet):
         if self.action in ['create', 'update', 'destroy']:
             return [IsSellerOrAdmin()]
         return [permissions.AllowAny()]  # Anyone can view categories
+
+    def list(self, request, *args, **kwargs):
+        """List categories, answering conditional GETs with 304 while no category has changed"""
+        # ETag only: a deletion can lower the latest timestamp, so Last-Modified would be unreliable
+        state = Category.objects.aggregate(count=Count('id'), updated_at=Max('updated_at'))
+        build = super().list
+        return conditional_response(
+            request, lambda: build(request, *args, **kwargs),
+            etag=make_etag(request, state['count'], state['updated_at'])
+        )
+
+    @action(detail=False, methods=['get'])
+    def tree(self, request):
+        """Full category tree in one response, for navigation menus"""
+        def build_tree():
+            nodes = {}
+            roots = []
+            for category in Category.objects.order_by('path').values('id', 'name', 'description', 'parent_id', 'depth'):
+                node = {
+                    'id': str(category['id']),
+                    'name': category['name'],
+                    'description': category['description'],
+                    'depth': category['depth'],
+                    'subcategories': [],
+                }
+                nodes[category['id']] = node
+                parent = nodes.get(category['parent_id'])
+                (parent['subcategories'] if parent else roots).append(node)
+            for node in [*nodes.values(), {'subcategories': roots}]:
+                node['subcategories'].sort(key=lambda child: child['name'].lower())
+            return roots
+
+        return Response(product_cache.get_category_tree(build_tree))
     
 class ProductViewSet(viewsets.ModelViewSet):
     """CRUD API for Products with advanced search and filtering"""
-    queryset = Product.objects.all().order_by('-created_at')
+    queryset = (
+        Product.objects
+        .select_related('category', 'seller', 'primary_image')  # Filters, object permissions and the cover image
+        .prefetch_related('images')  # Nested in every serialized product
+        .order_by('-created_at')
+    )
     serializer_class = ProductSerializer
-    pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = KeysetPagination  # ?cursor= selects keyset pages, otherwise page numbers
+    filter_backends = [DjangoFilterBackend, PopularityOrderingFilter, ProductSearchFilter]
     filterset_class = ProductFilter
     search_fields = ['title', 'description', 'category__name', 'seller__username']
-    ordering_fields = ['price', 'created_at', 'stock', 'title']
+    ordering_fields = ['price', 'created_at', 'stock', 'title', 'views', 'trending']
     ordering = ['-created_at']  # Default ordering
 
     def get_permissions(self):
         """Define permission rules based on the action"""
-        if self.action in ['create', 'update', 'partial_update', 'destroy', 'set_primary_image', 'delete_image']:
+        if self.action in ['create', 'update', 'partial_update', 'destroy', 'set_primary_image', 'delete_image', 'reorder_images', 'bulk_import', 'export']:
             return [IsSellerOrAdmin()]
+        if self.action == 'cache_stats':
+            return [IsAdminRole()]
         return [permissions.AllowAny()]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list' and wants_sparse(self.request):
+            # Load only what ?fields=/?expand= renders, plus the keyset cursor columns
+            queryset = sparse_queryset(queryset, self.get_serializer(), extra=('created_at',))
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """List products, served from the response cache for anonymous clients"""
+        build = super().list
+        return product_cache.cached_response(request, lambda: build(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        """Product detail, served from the response cache for anonymous clients"""
+        pk = kwargs.get(self.lookup_field)
+        build = super().retrieve
+
+        def respond():
+            return product_cache.cached_response(request, lambda: build(request, *args, **kwargs), pk=pk)
+
+        # Image and stock changes bump updated_at too; with the category's (for ?expand=category) it validates the whole response
+        try:
+            versions = Product.objects.filter(pk=pk).values_list('updated_at', 'category__updated_at').first()
+        except (ValueError, ValidationError):
+            versions = None
+        if versions is None:
+            return respond()  # Let the regular path produce the 404
+        updated_at = max(versions)
+        response = conditional_response(
+            request, respond, etag=make_etag(request, pk, *(version.isoformat() for version in versions)),
+            last_modified=updated_at
+        )
+        # A 304 is a client revalidating a copy it already counted, not a new view
+        if response.status_code == 200:
+            record_view(pk)
+        return response
+
     def perform_create(self, serializer):
         """Ensure the product is saved under the logged-in seller"""
         serializer.save(seller=self.request.user)
 
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def bulk_import(self, request):
+        """Bulk-create products from an uploaded CSV or JSONL file (Seller/Admin only)"""
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response({'error': 'A CSV or JSONL file is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        fmt = detect_format(upload.name, request.data.get('format'))
+        if fmt is None:
+            return Response(
+                {'error': 'Unsupported file format. Use .csv or .jsonl, or pass format=csv|jsonl'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        report = import_products(upload, fmt, seller=request.user)
+        ok = report['created'] and not report['file_error']
+        return Response(report, status=status.HTTP_200_OK if ok else status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream the seller's products, or the whole catalog for admins, as CSV or JSONL"""
+        # Not "format": DRF reserves that query parameter for renderer selection
+        fmt = request.query_params.get('export_format', 'csv').lower()
+        if fmt not in EXPORT_FORMATS:
+            return Response(
+                {'error': 'Unsupported export format. Use export_format=csv|jsonl'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        queryset = Product.objects.order_by('-created_at', '-id')
+        if request.user.role != 'admin':
+            queryset = queryset.filter(seller=request.user)
+        filterset = ProductFilter(request.query_params, queryset=queryset, request=request)
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        queryset = filterset.qs
+
+        # Resolve the media base URL once instead of per image
+        media_root = request.build_absolute_uri('/').rstrip('/')
+        rows = iter_export_rows(queryset, build_url=lambda url: url if '://' in url else media_root + url)
+
+        if fmt == 'csv':
+            response = StreamingHttpResponse(stream_csv(rows), content_type='text/csv')
+        else:
+            response = StreamingHttpResponse(stream_jsonl(rows), content_type='application/x-ndjson')
+        filename = f"products-{timezone.now():%Y%m%d-%H%M%S}.{fmt}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['X-Accel-Buffering'] = 'no'  # Let proxies pass rows through as they are produced
+        return response
+
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """Title suggestions for the search box: only id, title and primary thumbnail"""
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', DEFAULT_LIMIT)), MAX_LIMIT))
+        except ValueError:
+            limit = DEFAULT_LIMIT
+
+        suggestions = suggest_titles(request.query_params.get('q', ''), limit)
+        return Response({
+            'results': [
+                {
+                    'id': suggestion['id'],
+                    'title': suggestion['title'],
+                    'thumbnail': (
+                        request.build_absolute_uri(default_storage.url(suggestion['thumbnail']))
+                        if suggestion['thumbnail'] else None
+                    ),
+                }
+                for suggestion in suggestions
+            ]
+        })
+
+    @action(detail=True, methods=['get'])
+    def related(self, request, pk=None):
+        """"Customers also bought": co-purchased products, best match first (built by refresh_related_products)"""
+        try:
+            neighbours = list(
+                RelatedProduct.objects.filter(product_id=pk).order_by('rank').values_list(
+                    'related_id', 'related__title', 'related__price', 'score',
+                    'related__primary_image__image', 'related__primary_image__derivatives',
+                )
+            )
+        except (ValueError, ValidationError):
+            return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        results = []
+        for related_id, title, price, score, image, derivatives in neighbours:
+            thumbnail = cover_thumbnail(image, derivatives)
+            results.append({
+                'id': related_id,
+                'title': title,
+                'price': str(price),
+                'score': round(score, 4),
+                'thumbnail': request.build_absolute_uri(default_storage.url(thumbnail)) if thumbnail else None,
+            })
+        return Response({'results': results})
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """Facet counts (category, price range, shipping, stock) for the filtered/searched products"""
+        def build():
+            return Response(compute_facets(self.filter_queryset(self.get_queryset())))
+        return product_cache.cached_response(request, build, public=True)
+
+    @action(detail=False, methods=['get'])
+    def cache_stats(self, request):
+        """Response cache hit/miss counters (Admin only)"""
+        return Response(product_cache.get_stats())
+
     @action(detail=True, methods=['post'])
     def set_primary_image(self, request, pk=None):
         """Set an image as primary for the product"""
@@ -127,15 +329,58 @@ class ProductViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
             
-        was_primary = image.is_primary
+        # The next image in display order takes over as primary (see promote_next_primary_image)
         image.delete()
         
-        # If we deleted the primary image, set the first remaining image as primary
-        if was_primary:
-            first_image = product.images.first()
-            if first_image:
-                first_image.is_primary = True
-                first_image.save()
-        
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=True, methods=['post'])
+    def reorder_images(self, request, pk=None):
+        """Set the display order of all images and/or the primary image in one transaction"""
+        product = self.get_object()
+        order = request.data.get('order')
+        primary_id = request.data.get('primary')
+        if order is None and primary_id is None:
+            return Response({'error': 'Provide "order", "primary" or both'}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            image_ids = {
+                str(image_id) for image_id in
+                ProductImage.objects.select_for_update().filter(product=product).order_by('pk').values_list('id', flat=True)
+            }
+            if order is not None:
+                order = [str(image_id) for image_id in order] if isinstance(order, list) else []
+                if len(order) != len(image_ids) or set(order) != image_ids:
+                    return Response(
+                        {'error': '"order" must list every image of the product exactly once'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+            if primary_id is not None:
+                primary_id = str(primary_id)
+            if primary_id is not None and primary_id not in image_ids:
+                return Response({'error': 'Image not found'}, status=status.HTTP_404_NOT_FOUND)
+
+            # One UPDATE for every image; signals do not fire, so the product is touched below
+            changes = {}
+            if order:
+                changes['position'] = Case(
+                    *[When(pk=image_id, then=Value(position)) for position, image_id in enumerate(order)],
+                    default=F('position'), output_field=IntegerField(),
+                )
+            if primary_id is not None:
+                changes['is_primary'] = Case(
+                    When(pk=primary_id, then=Value(True)), default=Value(False), output_field=BooleanField()
+                )
+            if changes:
+                ProductImage.objects.filter(product=product).update(**changes)
+
+            fields = {'updated_at': timezone.now()}
+            if primary_id is not None:
+                fields['primary_image_id'] = primary_id
+            Product.objects.filter(pk=product.pk).update(**fields)
+        product_cache.invalidate_product(product.pk)
+
+        return Response(ProductImageSerializer(
+            ProductImage.objects.filter(product=product), many=True, context={'request': request}
+        ).data)
+
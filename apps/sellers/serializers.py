@@ -2,8 +2,10 @@ from rest_framework import serializers
 from apps.products.models import Product
 from apps.orders.models import Order, Payment
 from apps.shipping.models import Shipping
+from auraspotmarketplace1.fieldsets import SparseFieldsetMixin
 
-class DashboardProductSerializer(serializers.ModelSerializer):
+class DashboardProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    image = serializers.ImageField(source='primary_image.image', read_only=True, allow_null=True)  # Cover image
     total_orders = serializers.IntegerField(read_only=True)
     revenue = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     
@@ -19,7 +21,7 @@ class DashboardProductSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'updated_at']
 
-class DashboardOrderSerializer(serializers.ModelSerializer):
+class DashboardOrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     product = DashboardProductSerializer(read_only=True)
     buyer_name = serializers.CharField(source='buyer.get_full_name', read_only=True)
     buyer_email = serializers.EmailField(source='buyer.email', read_only=True)
@@ -32,13 +34,13 @@ class DashboardOrderSerializer(serializers.ModelSerializer):
         model = Order
         fields = [
             'id', 'product', 'buyer_name', 'buyer_email',
-            'quantity', 'total_price', 'status', 'payment_status',
+            'quantity', 'total_price', 'status', 'version', 'payment_status',
             'shipping_status', 'tracking_number', 'shipping_label_url',
             'created_at', 'updated_at'
         ]
         read_only_fields = ['created_at', 'updated_at']
 
-class DashboardPaymentSerializer(serializers.ModelSerializer):
+class DashboardPaymentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     order = DashboardOrderSerializer(read_only=True)
     
     class Meta:
@@ -49,7 +51,7 @@ class DashboardPaymentSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at']
 
-class DashboardShippingSerializer(serializers.ModelSerializer):
+class DashboardShippingSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     order = DashboardOrderSerializer(read_only=True)
     
     class Meta:
@@ -5,10 +5,13 @@ from rest_framework.response import Response
 from django.db.models import Count, Sum, Q
 from django.utils import timezone
 from datetime import timedelta
-from rest_framework.pagination import PageNumberPagination
+from uuid import UUID
+from auraspotmarketplace1.fieldsets import sparse_queryset
+from auraspotmarketplace1.pagination import StandardResultsSetPagination
 
 from apps.products.models import Product
 from apps.orders.models import Order, Payment
+from apps.orders.states import MAX_BULK_ORDERS, TransitionError, bulk_transition, transition
 from apps.shipping.models import Shipping
 from .serializers import (
     DashboardProductSerializer,
@@ -18,11 +21,6 @@ from .serializers import (
     DashboardStatsSerializer
 )
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 10
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-
 class IsSellerOrAdmin(permissions.BasePermission):
     """Permission class for seller or admin access"""
     def has_permission(self, request, view):
@@ -68,6 +66,15 @@ class SellerDashboardViewSet(viewsets.ViewSet):
                 self._paginator = self.pagination_class()
         return self._paginator
 
+    def get_serializer(self, serializer_class, *args, **kwargs):
+        """Serializer with the request in its context, so ?fields= and ?expand= apply"""
+        kwargs.setdefault('context', {'request': self.request})
+        return serializer_class(*args, **kwargs)
+
+    def sparse(self, queryset, serializer_class):
+        """Load only the columns and relations the requested fields render"""
+        return sparse_queryset(queryset, self.get_serializer(serializer_class))
+
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """Get seller's dashboard statistics"""
@@ -97,17 +104,18 @@ class SellerDashboardViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['get'])
     def products(self, request):
         """Get seller's products with order statistics"""
-        products = Product.objects.filter(seller=request.user).annotate(
+        products = Product.objects.filter(seller=request.user).order_by('-created_at').annotate(
             total_orders=Count('orders'),
             revenue=Sum('orders__total_price', filter=Q(orders__payment__payment_status='completed'))
         )
 
+        products = self.sparse(products, DashboardProductSerializer)
         page = self.paginate_queryset(products)
         if page is not None:
-            serializer = DashboardProductSerializer(page, many=True)
+            serializer = self.get_serializer(DashboardProductSerializer, page, many=True)
             return self.get_paginated_response(serializer.data)
 
-        serializer = DashboardProductSerializer(products, many=True)
+        serializer = self.get_serializer(DashboardProductSerializer, products, many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
@@ -116,7 +124,7 @@ class SellerDashboardViewSet(viewsets.ViewSet):
         status_filter = request.query_params.get('status')
         date_filter = request.query_params.get('date')
         
-        orders = Order.objects.filter(product__seller=request.user)
+        orders = Order.objects.filter(product__seller=request.user).order_by('-created_at')
         
         # Apply filters
         if status_filter:
@@ -134,12 +142,13 @@ class SellerDashboardViewSet(viewsets.ViewSet):
                     created_at__gte=timezone.now() - timedelta(days=30)
                 )
 
+        orders = self.sparse(orders, DashboardOrderSerializer)
         page = self.paginate_queryset(orders)
         if page is not None:
-            serializer = DashboardOrderSerializer(page, many=True)
+            serializer = self.get_serializer(DashboardOrderSerializer, page, many=True)
             return self.get_paginated_response(serializer.data)
 
-        serializer = DashboardOrderSerializer(orders, many=True)
+        serializer = self.get_serializer(DashboardOrderSerializer, orders, many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
@@ -153,8 +162,9 @@ class SellerDashboardViewSet(viewsets.ViewSet):
         
         if status_filter:
             payments = payments.filter(payment_status=status_filter)
+        payments = self.sparse(payments, DashboardPaymentSerializer)
             
-        serializer = DashboardPaymentSerializer(payments, many=True)
+        serializer = self.get_serializer(DashboardPaymentSerializer, payments, many=True)
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
@@ -168,18 +178,22 @@ class SellerDashboardViewSet(viewsets.ViewSet):
         
         if status_filter:
             shipments = shipments.filter(status=status_filter)
+        shipments = self.sparse(shipments, DashboardShippingSerializer)
             
-        serializer = DashboardShippingSerializer(shipments, many=True)
+        serializer = self.get_serializer(DashboardShippingSerializer, shipments, many=True)
         return Response(serializer.data)
 
+    def order_queryset(self, request):
+        """Orders the user may change: a seller's own, or any order for an admin"""
+        if request.user.role == 'admin':
+            return Order.objects.all()
+        return Order.objects.filter(product__seller=request.user)
+
     @action(detail=True, methods=['post'])
     def update_order_status(self, request, pk=None):
         """Update order status"""
         try:
-            order = Order.objects.get(
-                id=pk,
-                product__seller=request.user
-            )
+            order = self.order_queryset(request).get(id=pk)
         except Order.DoesNotExist:
             return Response(
                 {'error': 'Order not found'},
@@ -192,9 +206,58 @@ class SellerDashboardViewSet(viewsets.ViewSet):
                 {'error': 'Invalid status'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-            
-        order.status = new_status
-        order.save()
+
+        # Optional: the version the order was read with, to detect concurrent changes
+        version = request.data.get('version')
+        try:
+            version = int(version) if version is not None else None
+        except (TypeError, ValueError):
+            return Response({'error': 'version must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Releases the reserved stock when a pending/processing order is cancelled
+        try:
+            transition(order, new_status, version=version, user=request.user)
+        except TransitionError as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_409_CONFLICT if e.conflict else status.HTTP_400_BAD_REQUEST
+            )
         
         serializer = DashboardOrderSerializer(order)
         return Response(serializer.data)
+
+    @action(detail=False, methods=['post'])
+    def bulk_update_order_status(self, request):
+        """Move many of the seller's orders to one status with a single update"""
+        order_ids = request.data.get('order_ids')
+        new_status = request.data.get('status')
+        if new_status not in ['processing', 'shipped', 'delivered', 'cancelled']:
+            return Response(
+                {'error': 'Invalid status'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not isinstance(order_ids, list) or not order_ids:
+            return Response(
+                {'error': 'order_ids must be a non-empty list'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(order_ids) > MAX_BULK_ORDERS:
+            return Response(
+                {'error': f'At most {MAX_BULK_ORDERS} orders per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            order_ids = {str(UUID(str(pk))) for pk in order_ids}
+        except ValueError:
+            return Response({'error': 'Invalid order id'}, status=status.HTTP_400_BAD_REQUEST)
+
+        orders = self.order_queryset(request).filter(id__in=order_ids)
+        updated = {str(pk) for pk in bulk_transition(orders, new_status, user=request.user)}
+
+        # Not the seller's (for a seller), unknown, or not in a status that can move to new_status
+        return Response({
+            'status': new_status,
+            'updated': sorted(updated),
+            'skipped': sorted(order_ids - updated),
+        })
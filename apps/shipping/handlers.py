@@ -0,0 +1,28 @@
+"""
+Outbox handlers for shipping: label history and the buyer's tracking email.
+
+Registered when the app loads (see ``ShippingConfig.ready``) and run by the
+``process_outbox`` worker.
+"""
+from apps.orders.handlers import send_order_email
+from apps.orders.outbox import handler
+
+from .models import Shipping, ShippingStatusHistory
+
+
+@handler('shipping.label_created')
+def record_label(payload):
+    shipping = Shipping.objects.select_related('order__buyer', 'order__product').filter(pk=payload['shipping']).first()
+    if shipping is None:
+        return
+    ShippingStatusHistory.objects.create(
+        shipping=shipping,
+        status='PENDING',
+        description='Shipping label created'
+    )
+    order = shipping.order
+    send_order_email(
+        order, 'Your order is ready to ship',
+        f'Your order of {order.product.title} will be shipped with {shipping.carrier} ({shipping.shipping_method}).',
+        link=shipping.tracking_url,
+    )
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.6 on 2026-10-17 07:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from auraspotmarketplace1.partitions import partition_table, unpartition_table
+
+
+def partition_status_history(apps, schema_editor):
+    partition_table(schema_editor, 'shipping_shippingstatushistory')
+
+
+def unpartition_status_history(apps, schema_editor):
+    unpartition_table(schema_editor, 'shipping_shippingstatushistory')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_order_relations_without_constraint'),
+        ('shipping', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shipping',
+            name='order',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='shipping', to='orders.order'),
+        ),
+        migrations.RunPython(partition_status_history, unpartition_status_history),
+    ]
@@ -4,6 +4,7 @@ from uuid import uuid4  # Import uuid4 for generating unique IDs
 import shippo  # Import Shippo SDK for shipping functionality
 from shippo.models import components  # Import Shippo components for creating shipping requests
 from django.conf import settings  # Import Django settings to access configuration variables
+from django.utils import timezone  # Import timezone for update timestamps
 from django.db.models.signals import pre_save  # Import pre_save signal for validation before saving
 from django.dispatch import receiver  # Import receiver decorator for connecting signals
 import logging  # Import logging for error tracking and debugging
@@ -201,7 +202,7 @@ class Shipping(models.Model):
     )
 
     id = models.UUIDField(primary_key=True, default=uuid4, editable=False)  # Unique identifier for shipment
-    order = models.OneToOneField('orders.Order', on_delete=models.CASCADE, related_name='shipping')  # Link to order
+    order = models.OneToOneField('orders.Order', on_delete=models.CASCADE, related_name='shipping', db_constraint=False)  # Link to order; no database constraint as orders are partitioned
     from_address = models.ForeignKey(SellerAddress, on_delete=models.PROTECT, related_name='shipments_from')  # Sender address
     to_address = models.ForeignKey(BuyerAddress, on_delete=models.PROTECT, related_name='shipments_to')  # Recipient address
     
@@ -407,8 +408,11 @@ class Shipping(models.Model):
                     self.save()
 
                     # Update order total to include actual shipping cost
+                    # Only this column: a full save() would overwrite a concurrent status change
                     order.total_price = order.product.price * order.quantity + self.shipping_cost
-                    order.save()
+                    type(order).objects.filter(pk=order.pk).update(
+                        total_price=order.total_price, updated_at=timezone.now()
+                    )
 
                     # Create shipping status history
                     ShippingStatusHistory.objects.create(
@@ -545,7 +549,7 @@ class Shipping(models.Model):
             return []
 
 class ShippingStatusHistory(models.Model):
-    """Track shipping status changes over time"""
+    """Track shipping status changes over time (partitioned by month of created_at, see auraspotmarketplace1.partitions)"""
     id = models.UUIDField(primary_key=True, default=uuid4, editable=False)  # Unique identifier
     shipping = models.ForeignKey(Shipping, on_delete=models.CASCADE, related_name='status_history')  # Link to shipping record
     status = models.CharField(max_length=20)  # Status at this point
@@ -1,3 +1,74 @@
-from django.test import TestCase
+from decimal import Decimal
 
-# Create your tests here.
+from rest_framework.test import APITestCase
+
+from apps.authentication.models import User
+from apps.orders.models import Order
+from apps.products.models import Category, Product
+from .models import BuyerAddress, SellerAddress, Shipping, ShippingStatusHistory
+
+
+class TrackShipmentTests(APITestCase):
+    """Tracking polls for an unchanged shipment are answered with 304"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user(
+            email='seller@example.com', username='seller', password='pass',
+            role='seller', first_name='Sam', last_name='Seller'
+        )
+        cls.buyer = User.objects.create_user(
+            email='buyer@example.com', username='buyer', password='pass',
+            role='buyer', first_name='Bea', last_name='Buyer'
+        )
+        product = Product.objects.create(
+            title='Jacket', description='Leather jacket', price=Decimal('80.00'),
+            category=Category.objects.create(name='Fashion'), seller=cls.seller, stock=5, requires_shipping=False
+        )
+        order = Order.objects.create(buyer=cls.buyer, product=product, quantity=1, total_price=product.price)
+        address = {
+            'name': 'Sam', 'street1': '1 Main St', 'city': 'Austin', 'state': 'TX', 'zip_code': '78701',
+            'phone': '5550100', 'email': 'sam@example.com', 'is_verified': True,
+        }
+        cls.shipping = Shipping.objects.create(
+            order=order, carrier='USPS', shipping_method='Priority', shipping_cost=Decimal('7.50'),
+            from_address=SellerAddress.objects.create(seller=cls.seller, **address),
+            to_address=BuyerAddress.objects.create(buyer=cls.buyer, **address),
+        )
+        ShippingStatusHistory.objects.create(shipping=cls.shipping, status='PENDING')
+
+    def setUp(self):
+        self.client.force_authenticate(self.buyer)
+        self.url = f'/shipping/shipments/{self.shipping.pk}/track/'
+
+    def test_repeat_poll_is_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['status_history']), 1)
+
+        for headers in (
+            {'HTTP_IF_NONE_MATCH': response['ETag']},
+            {'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']},
+        ):
+            with self.subTest(headers=headers), self.assertNumQueries(1):
+                poll = self.client.get(self.url, **headers)
+            self.assertEqual(poll.status_code, 304)
+            self.assertEqual(poll.content, b'')
+            self.assertEqual(poll['ETag'], response['ETag'])
+
+    def test_new_status_is_served_with_a_new_etag(self):
+        response = self.client.get(self.url)
+        ShippingStatusHistory.objects.create(shipping=self.shipping, status='TRANSIT', location='Austin, TX')
+
+        poll = self.client.get(
+            self.url, HTTP_IF_NONE_MATCH=response['ETag'], HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(poll.status_code, 200)
+        self.assertNotEqual(poll['ETag'], response['ETag'])
+        self.assertEqual(len(poll.data['status_history']), 2)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=poll['ETag']).status_code, 304)
+
+    def test_other_buyers_cannot_track(self):
+        other = User.objects.create_user(email='other@example.com', username='other', password='pass', role='buyer')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
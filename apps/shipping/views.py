@@ -4,14 +4,21 @@ from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, BasePermission
 from django.utils import timezone
+from django.db import transaction as db_transaction  # ``transaction`` is Shippo's below
+from django.db.models import Count, Max
+from django.http import Http404
 from apps.orders.models import Order
-from .models import Shipping, SellerAddress, BuyerAddress, ShippingStatusHistory
+from apps.orders.states import confirm_reservation
+from apps.orders.idempotency import idempotent, retryable
+from apps.orders.outbox import publish
+from .models import Shipping, SellerAddress, BuyerAddress
 from .serializers import (
     ShippingSerializer, SellerAddressSerializer, BuyerAddressSerializer,
     ShippingRateSerializer, AddressValidationSerializer
 )
 from datetime import datetime
 from django.conf import settings
+from auraspotmarketplace1.conditional import conditional_response, make_etag
 import logging
 import shippo
 from shippo.models import components
@@ -290,6 +297,7 @@ def calculate_shipping_rates(request):
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated, IsSellerOrAdmin])
+@idempotent  # A retried purchase must not buy a second Shippo label
 def create_shipping_label(request, shipping_id):
     """Create shipping label for an order (Seller/Admin only)"""
     try:
@@ -357,18 +365,14 @@ def create_shipping_label(request, shipping_id):
             shipping.shipping_method = transaction.rate.servicelevel.name
             shipping.shipping_cost = transaction.rate.amount
             shipping.shippo_rate_id = rate_id
-            shipping.save()
-
-            # Update order status
-            order.status = 'processing'
-            order.save()
-            
-            # Create shipping status history
-            ShippingStatusHistory.objects.create(
-                shipping=shipping,
-                status='PENDING',
-                description='Shipping label created'
-            )
+            with db_transaction.atomic():
+                shipping.save()
+
+                # Update order status; a shipping order's reserved stock no longer expires
+                confirm_reservation(order, user=request.user)
+
+                # Shipping status history and the buyer's email are written by the outbox worker
+                publish('shipping.label_created', {'shipping': str(shipping.pk)})
 
             return Response({
                 'message': 'Shipping label created successfully',
@@ -384,41 +388,73 @@ def create_shipping_label(request, shipping_id):
             })
         else:
             logger.error(f"Failed to create Shippo label: {error_msg}")
-            return Response(
+            # No label was bought, and Shippo and network errors are often transient: let a retry run again
+            return retryable(Response(
                 {'error': error_msg or 'Failed to create shipping label'},
                 status=status.HTTP_400_BAD_REQUEST
-            )
+            ))
 
     except Exception as e:
         logger.error(f"Error creating shipping label: {str(e)}", exc_info=True)
-        return Response(
+        return retryable(Response(
             {
                 'error': 'Failed to create shipping label',
                 'details': str(e)
             },
             status=status.HTTP_400_BAD_REQUEST
-        )
+        ))
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def track_shipment(request, shipping_id):
     """Track shipment status"""
     try:
-        shipping = get_object_or_404(Shipping, id=shipping_id)
-        order = shipping.order
+        # One query for the permission check and everything the response depends on,
+        # so polls for an unchanged shipment are answered with 304 without serializing
+        state = (
+            Shipping.objects.filter(id=shipping_id)
+            .values(
+                'updated_at', 'order__buyer_id', 'order__product__seller_id',
+                'from_address__updated_at', 'to_address__updated_at',
+            )
+            .annotate(history_count=Count('status_history'), history_at=Max('status_history__created_at'))
+            .order_by('updated_at')
+            .first()
+        )
+        if state is None:
+            raise Http404
 
         # Check permissions
-        if (request.user != order.buyer and 
-            request.user != order.product.seller and 
+        if (request.user.pk != state['order__buyer_id'] and 
+            request.user.pk != state['order__product__seller_id'] and 
             request.user.role != 'admin'):
             return Response(
                 {'error': 'You do not have permission to track this shipment'},
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        # Get tracking information
-        serializer = ShippingSerializer(shipping)
-        return Response(serializer.data)
+        last_modified = max(
+            value for value in (
+                state['updated_at'], state['from_address__updated_at'],
+                state['to_address__updated_at'], state['history_at'],
+            ) if value is not None
+        )
+
+        def build_response():
+            shipping = get_object_or_404(
+                Shipping.objects.select_related('from_address', 'to_address')
+                .prefetch_related('status_history'),
+                id=shipping_id
+            )
+            # Get tracking information
+            serializer = ShippingSerializer(shipping)
+            return Response(serializer.data)
+
+        return conditional_response(
+            request, build_response,
+            etag=make_etag(request, *(state[key] for key in sorted(state))),
+            last_modified=last_modified
+        )
 
     except Exception as e:
         logger.error(f"Error tracking shipment: {str(e)}", exc_info=True)
@@ -0,0 +1,51 @@
+"""
+Conditional GET support (ETag / Last-Modified) for API views.
+
+Views compute their validators from ``updated_at`` timestamps with one cheap
+query; a client whose copy is still current gets a 304 before the view loads
+or serializes anything.
+"""
+import hashlib
+from calendar import timegm
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(request, *parts):
+    """
+    Strong ETag for the response to ``request`` given the state in ``parts``.
+    The URL, host and renderer are included because they change the body too
+    (e.g. absolute image URLs, browsable API vs JSON).
+    """
+    renderer = getattr(request, 'accepted_renderer', None)
+    key = '|'.join([
+        request.get_host(),
+        request.get_full_path(),
+        getattr(renderer, 'format', '') or '',
+        *(str(part) for part in parts),
+    ])
+    return quote_etag(hashlib.md5(key.encode('utf-8')).hexdigest())
+
+
+def conditional_response(request, build_response, etag=None, last_modified=None):
+    """
+    Answer ``If-None-Match``/``If-Modified-Since`` with 304 when the client's
+    copy is current, otherwise call ``build_response``. Validators are attached
+    to both so clients can keep revalidating.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return build_response()
+
+    timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = build_response()
+        if response.status_code != 200:
+            return response
+
+    if etag and not response.has_header('ETag'):
+        response['ETag'] = etag
+    if timestamp is not None and not response.has_header('Last-Modified'):
+        response['Last-Modified'] = http_date(timestamp)
+    return response
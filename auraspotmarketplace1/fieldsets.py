@@ -0,0 +1,145 @@
+"""
+Sparse fieldsets (``?fields=``) and expansions (``?expand=``) for API responses.
+
+``?fields=id,title,price`` renders only the listed top-level fields and
+``?expand=category`` replaces a related object's id with the object itself,
+for the relations a serializer lists in ``Meta.expandable_fields``.
+
+``sparse_queryset`` then trims the queryset to what the remaining fields read:
+columns of fields that are not rendered are deferred with ``only()``, and
+relations that are not rendered are neither joined nor prefetched, so payload
+size, query cost and serialization time all shrink with the fieldset.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.utils.module_loading import import_string
+from rest_framework import permissions
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+
+def parse_fieldset(value):
+    """``'a, b,,c'`` -> ``{'a', 'b', 'c'}``"""
+    return {name.strip() for name in (value or '').split(',') if name.strip()}
+
+
+def wants_sparse(request):
+    """Whether the client asked for a fieldset or an expansion"""
+    return bool(request.query_params.get('fields') or request.query_params.get('expand'))
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer mixin honouring ``?fields=`` and ``?expand=`` on safe requests.
+    Only the top-level serializer (or the child of a top-level ``many=True``
+    list) reads the query string; nested serializers render in full.
+
+    ``Meta.expandable_fields`` maps a field name to the serializer class (or its
+    dotted path) that renders the related object when it is expanded.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        root = self.root
+        if (
+            request is None
+            or request.method not in permissions.SAFE_METHODS
+            or not (root is self or getattr(root, 'child', None) is self)
+        ):
+            return fields
+
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        for name in parse_fieldset(request.query_params.get('expand')) & set(expandable):
+            serializer_class = expandable[name]
+            if isinstance(serializer_class, str):
+                serializer_class = import_string(serializer_class)
+            fields[name] = serializer_class(read_only=True)
+
+        requested = parse_fieldset(request.query_params.get('fields'))
+        if requested:
+            fields = {name: field for name, field in fields.items() if name in requested}
+        return fields
+
+
+class _Plan:
+    def __init__(self, annotations):
+        self.annotations = annotations
+        self.columns = set()
+        self.select = set()
+        self.prefetch = set()
+        self.full = set()  # Paths whose whole row is needed (properties, methods, untyped method fields)
+
+
+def _collect(serializer, model, path, plan):
+    dependencies = getattr(getattr(serializer, 'Meta', None), 'field_dependencies', {})
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == '*':
+            if field.field_name in dependencies:
+                for dependency in dependencies[field.field_name]:
+                    _add_source(dependency.split('__'), None, model, path, plan)
+            else:
+                plan.full.add(path)
+            continue
+        nested = field.child if isinstance(field, ListSerializer) else field
+        _add_source(field.source_attrs, nested if isinstance(nested, BaseSerializer) else None, model, path, plan)
+
+
+def _add_source(attrs, nested, model, path, plan):
+    """Record what reading ``attrs`` (a field's source) from ``model`` at ``path`` needs"""
+    for index, attr in enumerate(attrs):
+        if not path and attr in plan.annotations:
+            return
+        try:
+            model_field = model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            plan.full.add(path)  # A property or method: it may read any column
+            return
+        lookup = '__'.join((*path, attr))
+        last = index == len(attrs) - 1
+        if not model_field.is_relation:
+            plan.columns.add(lookup)
+            return
+        if model_field.many_to_many or model_field.one_to_many:
+            plan.prefetch.add(lookup)
+            return
+        if model_field.concrete:
+            plan.columns.add(lookup)
+            if last and nested is None:
+                return  # Rendered as the primary key, which is the column itself
+        plan.select.add(lookup)
+        model, path = model_field.related_model, (*path, attr)
+    if nested is not None:
+        _collect(nested, model, path, plan)
+    else:
+        plan.full.add(path)
+
+
+def sparse_queryset(queryset, serializer, extra=()):
+    """
+    Restrict ``queryset`` to the columns and relations ``serializer`` renders.
+    Existing ``select_related``/``prefetch_related`` are replaced by what the
+    fields need; ``extra`` lists further columns to load (e.g. a pagination cursor).
+    """
+    if isinstance(serializer, ListSerializer):
+        serializer = serializer.child
+    plan = _Plan(set(queryset.query.annotations))
+    _collect(serializer, queryset.model, (), plan)
+
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if plan.select:
+        queryset = queryset.select_related(*sorted(plan.select))
+    if plan.prefetch:
+        queryset = queryset.prefetch_related(*sorted(plan.prefetch))
+    if () in plan.full:
+        return queryset
+
+    # A related row that is read whole keeps all its columns: only() leaves a
+    # relation alone when none of its columns are listed
+    columns = {
+        column for column in plan.columns
+        if not any(
+            full and column.startswith('__'.join(full) + '__') for full in plan.full
+        )
+    }
+    return queryset.only(*sorted(columns | set(extra)))
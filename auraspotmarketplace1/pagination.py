@@ -0,0 +1,162 @@
+"""
+Shared pagination classes for the marketplace APIs.
+"""
+import base64
+import json
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class StandardResultsSetPagination(PageNumberPagination):
+    """Standard pagination class for consistent pagination across views."""
+    page_size = 10  # Default number of items per page
+    page_size_query_param = 'page_size'  # Allow client to override page size
+    max_page_size = 100  # Maximum limit per page
+    page_query_param = 'page'  # Parameter name for page number
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.page.paginator.count,  # Total number of items
+            'next': self.get_next_link(),  # URL for next page
+            'previous': self.get_previous_link(),  # URL for previous page
+            'results': data  # Page of results
+        })
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over a fixed, unique ordering.
+
+    Each page is fetched with ``WHERE (created_at, id) < (<last seen>)`` and a
+    ``LIMIT``, so the cost of a page does not depend on how deep it is. The
+    position is handed to clients as an opaque ``cursor`` token.
+
+    Keyset mode is selected by sending the ``cursor`` parameter (empty for the
+    first page). Requests without it fall back to ``fallback_class`` so existing
+    page-number clients keep working. The total ``count`` is included unless
+    the client sends ``count=false``, which keeps every page constant-time.
+    Client-supplied ``ordering`` is ignored in keyset mode.
+    """
+    ordering = ('-created_at', '-id')  # Must be unique; the last field breaks ties
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    include_count = True
+    fallback_class = StandardResultsSetPagination
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.fallback = None
+        if self.fallback_class is not None and self.cursor_query_param not in request.query_params:
+            self.fallback = self.fallback_class()
+            return self.fallback.paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.fields = [queryset.model._meta.get_field(name.lstrip('-')) for name in self.ordering]
+
+        position, reverse = self.decode_cursor(request)
+        self.count = queryset.count() if self.should_count(request) else None
+
+        ordering = [self._flip(name) for name in self.ordering] if reverse else list(self.ordering)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.seek_filter(ordering, position))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        if self.fallback is not None:
+            return self.fallback.get_paginated_response(data)
+
+        response = {}
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['previous'] = self.get_previous_link()
+        response['results'] = data
+        return Response(response)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def should_count(self, request):
+        value = request.query_params.get(self.count_query_param)
+        if value is None:
+            return self.include_count
+        return value.lower() not in ('0', 'false', 'no')
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def seek_filter(self, ordering, position):
+        """Build the lexicographic "comes after <position>" condition for ``ordering``"""
+        condition = Q()
+        for index, name in enumerate(ordering):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            step = Q(**{f'{field}__{lookup}': position[index]})
+            for previous, value in zip(ordering[:index], position[:index]):
+                step &= Q(**{previous.lstrip('-'): value})
+            condition |= step
+        return condition
+
+    def encode_cursor(self, instance, reverse):
+        position = [field.value_to_string(instance) for field in self.fields]
+        token = json.dumps({'p': position, 'r': int(reverse)}, separators=(',', ':'))
+        token = base64.urlsafe_b64encode(token.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            data = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+            position = [field.to_python(value) for field, value in zip(self.fields, data['p'])]
+            reverse = bool(data.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if len(position) != len(self.fields) or any(value is None for value in position):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    @staticmethod
+    def _flip(name):
+        return name[1:] if name.startswith('-') else f'-{name}'
+
+
+class UserKeysetPagination(KeysetPagination):
+    """Keyset pagination for user listings, which have ``date_joined`` rather than ``created_at``"""
+    ordering = ('-date_joined', '-id')
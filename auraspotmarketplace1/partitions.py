@@ -0,0 +1,248 @@
+"""
+Monthly range partitioning of append-mostly tables by ``created_at``.
+
+``orders_order`` and ``shipping_shippingstatushistory`` are Postgres
+declaratively partitioned tables: one partition per calendar month, named
+``<table>_pYYYY_MM``, plus ``<table>_default`` for rows outside every
+month (it should stay empty; rows that land there because a month was not
+created in time are moved out when it is). Queries with a ``created_at`` range only scan
+the months it covers, and vacuum, analyze and index maintenance work on one
+month at a time instead of the whole table; old months stop changing and are
+frozen once.
+
+Postgres requires the partition key in every unique index of a partitioned
+table, so the primary key becomes ``(id, created_at)`` and other tables can no
+longer declare a foreign key to ``id``: their Django relations are kept with
+``db_constraint=False``, and cascades are done by Django as before.
+
+``partition_table`` converts an existing table (used by migrations),
+``ensure_partitions`` creates the months ahead and ``archive_partitions``
+detaches old months, dumps them to gzipped CSV files and drops them (see the
+``manage_partitions`` command). Since nothing in the database stops rows of
+other tables from pointing at archived rows, tables that other models refer
+to (such as ``orders_order``) cannot be archived.
+"""
+import gzip
+import logging
+import os
+import re
+from datetime import date
+
+from django.apps import apps
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PARTITION_NAME = re.compile(r'_p(\d{4})_(\d{2})$')
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f'{table}_p{month.year:04d}_{month.month:02d}'
+
+
+def _bound(month):
+    """Partition bound literal for the start of ``month``; months are UTC, like the stored timestamps"""
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+
+def is_partitioned(cursor, table):
+    cursor.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = %s::regclass", [table])
+    row = cursor.fetchone()
+    return bool(row and row[0])
+
+
+def list_partitions(cursor, table):
+    """``{month: partition name}`` of the monthly partitions attached to ``table``"""
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+    """, [table])
+    partitions = {}
+    for (name,) in cursor.fetchall():
+        match = PARTITION_NAME.search(name)
+        if match and name.startswith(table):
+            partitions[date(int(match[1]), int(match[2]), 1)] = name
+    return partitions
+
+
+def create_partition(cursor, table, month, column='created_at'):
+    """
+    Create the partition of ``table`` for ``month``. Rows of that month that
+    landed in the default partition meanwhile (Postgres refuses to create the
+    partition while they are there) are moved into it: the default partition
+    is detached, the month created, its rows moved and the default reattached,
+    all under the lock on ``table`` of the caller's transaction.
+    """
+    name = partition_name(table, month)
+    bounds = f'FROM ({_bound(month)}) TO ({_bound(add_months(month, 1))})'
+    default = f'{table}_default'
+    cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [f'"{default}"'])
+    stray = False
+    if cursor.fetchone()[0]:
+        cursor.execute(
+            f'SELECT EXISTS (SELECT 1 FROM "{default}" WHERE "{column}" >= {_bound(month)} '
+            f'AND "{column}" < {_bound(add_months(month, 1))})'
+        )
+        stray = cursor.fetchone()[0]
+    if not stray:
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table}" FOR VALUES {bounds}')
+        return name
+
+    logger.warning(f'Moving the rows of {name} out of {default}')
+    cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{default}"')
+    cursor.execute(f'CREATE TABLE "{name}" PARTITION OF "{table}" FOR VALUES {bounds}')
+    cursor.execute(f"""
+        WITH moved AS (
+            DELETE FROM "{default}" WHERE "{column}" >= {_bound(month)} AND "{column}" < {_bound(add_months(month, 1))}
+            RETURNING *
+        )
+        INSERT INTO "{table}" SELECT * FROM moved
+    """)
+    cursor.execute(f'ALTER TABLE "{table}" ATTACH PARTITION "{default}" DEFAULT')
+    return name
+
+
+def ensure_partitions(table, months_ahead=3, today=None):
+    """Create the partitions of ``table`` from the current month to ``months_ahead`` months ahead; returns the names created"""
+    current = month_start(today or timezone.now())
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        existing = list_partitions(cursor, table)
+        for offset in range(months_ahead + 1):
+            month = add_months(current, offset)
+            if month not in existing:
+                created.append(create_partition(cursor, table, month))
+    return created
+
+
+def partition_table(schema_editor, table, column='created_at', months_ahead=3):
+    """
+    Turn the plain table ``table`` into one range-partitioned by ``column``,
+    with its rows, defaults, checks, outgoing foreign keys and indexes. The
+    primary key ``id`` becomes ``(id, column)``. Foreign keys pointing at the
+    table must have been dropped first. Locks the table while its rows are
+    copied, so large tables need a quiet moment.
+    """
+    cursor = schema_editor.connection.cursor()
+    if is_partitioned(cursor, table):
+        return
+    cursor.execute("""
+        SELECT indexdef FROM pg_indexes
+        WHERE tablename = %s AND indexname NOT IN (
+            SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype IN ('p', 'u')
+        )
+    """, [table, table])
+    indexes = [row[0] for row in cursor.fetchall()]
+    if any(index.startswith('CREATE UNIQUE') for index in indexes):
+        raise ValueError(f'{table} has unique indexes, which a partitioned table only allows with {column}')
+    cursor.execute("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype IN ('c', 'f')
+    """, [table])
+    constraints = cursor.fetchall()
+    cursor.execute(f'SELECT min("{column}") FROM "{table}"')
+    oldest = cursor.fetchone()[0] or timezone.now()
+
+    cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{table}_unpartitioned"')
+    cursor.execute(
+        f'CREATE TABLE "{table}" (LIKE "{table}_unpartitioned" INCLUDING DEFAULTS INCLUDING STORAGE) '
+        f'PARTITION BY RANGE ("{column}")'
+    )
+    cursor.execute(f'CREATE TABLE "{table}_default" PARTITION OF "{table}" DEFAULT')
+    month, last = month_start(oldest), add_months(month_start(timezone.now()), months_ahead)
+    while month <= last:
+        create_partition(cursor, table, month, column)
+        month = add_months(month, 1)
+    cursor.execute(f'INSERT INTO "{table}" SELECT * FROM "{table}_unpartitioned"')
+    # Fails if another table still has a foreign key to this one
+    cursor.execute(f'DROP TABLE "{table}_unpartitioned"')
+
+    cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY (id, "{column}")')
+    for name, definition in constraints:
+        cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {definition}')
+    for index in indexes:
+        cursor.execute(index)  # Created on the parent, so on every partition, present and future
+
+
+def unpartition_table(schema_editor, table, column='created_at'):
+    """Reverse of ``partition_table``: back to a plain table with primary key ``id``"""
+    cursor = schema_editor.connection.cursor()
+    if not is_partitioned(cursor, table):
+        return
+    cursor.execute("""
+        SELECT indexdef FROM pg_indexes
+        WHERE tablename = %s AND indexname <> %s
+    """, [table, f'{table}_pkey'])
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype IN ('c', 'f')
+    """, [table])
+    constraints = cursor.fetchall()
+
+    cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{table}_partitioned"')
+    cursor.execute(f'CREATE TABLE "{table}" (LIKE "{table}_partitioned" INCLUDING DEFAULTS INCLUDING STORAGE)')
+    cursor.execute(f'INSERT INTO "{table}" SELECT * FROM "{table}_partitioned"')
+    cursor.execute(f'DROP TABLE "{table}_partitioned"')  # And its partitions
+
+    cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY (id)')
+    for name, definition in constraints:
+        cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {definition}')
+    for index in indexes:
+        cursor.execute(index)
+
+
+def referencing_models(table):
+    """Labels of the other models with a relation to ``table``"""
+    return sorted({
+        model._meta.label
+        for model in apps.get_models()
+        for field in model._meta.concrete_fields
+        if field.is_relation and field.related_model is not None
+        and field.related_model._meta.db_table == table and model._meta.db_table != table
+    })
+
+
+def archive_partitions(table, before, directory, keep_detached=False):
+    """
+    Detach the monthly partitions of ``table`` that end on or before the month
+    of ``before``. Each is dumped to ``<directory>/<partition>.csv.gz`` and
+    dropped, or, with ``keep_detached``, left as a standalone table. Returns
+    the partition names. Raises ValueError for a table other models refer to,
+    whose rows would be left pointing at nothing.
+    """
+    referenced_by = referencing_models(table)
+    if referenced_by:
+        raise ValueError(f"{table} cannot be archived: {', '.join(referenced_by)} refer to its rows")
+    cutoff = month_start(before)
+    with connection.cursor() as cursor:
+        old = sorted(
+            (month, name) for month, name in list_partitions(cursor, table).items()
+            if add_months(month, 1) <= cutoff
+        )
+    archived = []
+    for month, name in old:
+        # Brief lock on the parent; the partition's rows are not touched
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"')
+        if not keep_detached:
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f'{name}.csv.gz')
+            with transaction.atomic(), connection.cursor() as cursor:
+                with gzip.open(path, 'wb') as archive:
+                    cursor.copy_expert(f'COPY "{name}" TO STDOUT WITH (FORMAT csv, HEADER)', archive)
+                # Only once the file is complete; a failed dump leaves the partition detached, not lost
+                cursor.execute(f'DROP TABLE "{name}"')
+            logger.info(f'Archived {name} to {path}')
+        archived.append(name)
+    return archived
@@ -89,6 +89,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",  # Full-text search and GIN indexes
     
     "rest_framework",
     "rest_framework_simplejwt",
@@ -163,6 +164,30 @@ DATABASES = {
     }
 }
 
+# Cache
+# In-process by default; set REDIS_URL to share the cache between workers
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'auraspot-default',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+if os.getenv('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL'),
+    }
+
+# Anonymous product list/detail response cache (see apps/products/cache.py)
+PRODUCT_CACHE_ALIAS = 'default'
+PRODUCT_CACHE_TIMEOUT = int(os.getenv('PRODUCT_CACHE_TIMEOUT', 300))  # seconds
+
+# Per-process LRU of recent title autocomplete results
+PRODUCT_AUTOCOMPLETE_CACHE_SIZE = 2048  # entries
+PRODUCT_AUTOCOMPLETE_CACHE_TTL = 30  # seconds
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(hours=24),  # Changed from 20 minutes to 24 hours
     "REFRESH_TOKEN_LIFETIME": timedelta(days=30),  # Changed from 7 days to 30 days
@@ -218,6 +243,63 @@ STATIC_URL = "static/"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Product image derivatives (thumbnail/card/detail in WebP and JPEG)
+PRODUCT_IMAGE_WORKERS = int(os.getenv('PRODUCT_IMAGE_WORKERS', 2))  # Background worker threads
+PRODUCT_IMAGE_DERIVATIVES_ASYNC = True  # False renders inline after commit (useful in tests)
+
+# Product view counting: views are buffered in memory and written in batches
+ANALYTICS_VIEW_FLUSH_INTERVAL = int(os.getenv('ANALYTICS_VIEW_FLUSH_INTERVAL', 10))  # seconds
+ANALYTICS_VIEW_BUFFER_SIZE = 5000  # Buffered product-hours that force an early flush
+PRODUCT_POPULARITY_HALF_LIFE_HOURS = 24  # A view counts half as much towards "trending" after this long
+
+# "Customers also bought": co-purchase neighbours built offline by refresh_related_products
+RELATED_PRODUCTS_TOP_K = 12  # Neighbours kept per product
+RELATED_PRODUCTS_MIN_BUYERS = 1  # Buyers two products must share to count as related
+
+# Stock reserved by an unpaid order is released after this many seconds (see expire_reservations)
+ORDER_RESERVATION_TTL = int(os.getenv('ORDER_RESERVATION_TTL', 900))
+
+# Idempotency-Key: responses to keyed POSTs are replayed to retries for this long
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60  # seconds
+IDEMPOTENCY_WAIT_TIMEOUT = 30  # seconds a retry waits for the original request to finish
+
+# Payment providers (see apps/payments): payments are charged by the outbox worker and
+# completed by the provider's webhook at /payments/webhooks/<name>/
+PAYMENT_PROVIDER = os.getenv('PAYMENT_PROVIDER', 'simulated')
+PAYMENT_PROVIDERS = {
+    'simulated': {
+        'BACKEND': 'apps.payments.providers.SimulatedProvider',
+        'OPTIONS': {
+            'latency': float(os.getenv('SIMULATED_PAYMENT_LATENCY', 0)),  # seconds per call
+            'failure_rate': float(os.getenv('SIMULATED_PAYMENT_FAILURE_RATE', 0)),  # share of charges declined
+            'error_rate': float(os.getenv('SIMULATED_PAYMENT_ERROR_RATE', 0)),  # share of calls failing transiently
+            'webhook_delay': float(os.getenv('SIMULATED_PAYMENT_WEBHOOK_DELAY', 0)),  # seconds
+            'webhook_url': os.getenv('SIMULATED_PAYMENT_WEBHOOK_URL'),  # Unset: webhooks are applied in-process
+            'webhook_secret': os.getenv('SIMULATED_PAYMENT_WEBHOOK_SECRET', 'simulated-webhook-secret'),
+        },
+    },
+}
+PAYMENT_PROVIDER_TIMEOUT = 10  # seconds a provider call may take before it is retried
+PAYMENT_PROVIDER_POOL_SIZE = 20  # HTTP connections kept open per provider and process
+PAYMENT_PENDING_TTL = 30 * 60  # seconds an order's reservation is extended to while its payment is pending
+SETTLEMENT_CHUNK_SIZE = 10000  # settlement file rows buffered per COPY when reconciling
+
+# Outbox: follow-up work of order changes, run by process_outbox workers
+OUTBOX_MAX_ATTEMPTS = 8  # A message that failed this often is kept for inspection and no longer retried
+OUTBOX_RETRY_DELAY = 30  # seconds before the first retry; doubles with every further failure
+OUTBOX_MAX_RETRY_DELAY = 60 * 60  # seconds
+OUTBOX_LEASE = 15 * 60  # seconds an isolated message (e.g. a reconciliation) is hidden from other workers while it runs
+
+# Monthly partitions of the tables that grow with every order (see manage_partitions)
+PARTITIONED_TABLES = {
+    # Table -> months kept attached; older months are archived. None keeps every month.
+    # Tables other models refer to cannot be archived (see archive_partitions).
+    'orders_order': None,
+    'shipping_shippingstatushistory': 24,
+}
+PARTITION_MONTHS_AHEAD = 3  # Partitions created ahead of time, so new rows never land in the default one
+PARTITION_ARCHIVE_DIR = os.getenv('PARTITION_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -0,0 +1,22 @@
+"""
+Shared helpers for the apps' test suites.
+"""
+
+
+class QueryCountTestMixin:
+    """
+    Assert that a list endpoint runs a fixed number of queries whatever the page size.
+
+    A query count that grows with the page size means something is being loaded
+    per row (an N+1), which is exactly the regression these tests guard against.
+    """
+    page_sizes = (1, 5, 20)
+
+    def assertListQueryCount(self, url, expected, params=None):
+        for page_size in self.page_sizes:
+            query = dict(params or {}, page_size=page_size)
+            with self.subTest(url=url, page_size=page_size):
+                with self.assertNumQueries(expected):
+                    response = self.client.get(url, query)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), min(page_size, response.data['count']))
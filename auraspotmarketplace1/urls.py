@@ -27,6 +27,7 @@ urlpatterns = [
     path('shipping/', include('apps.shipping.urls')),
     path('sellers/', include('apps.sellers.urls')),
     path('buyers/', include('apps.buyers.urls')),
+    path('payments/', include('apps.payments.urls')),
 ]
 
 if settings.DEBUG: